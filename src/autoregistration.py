@@ -40,23 +40,33 @@ def _update_autoregistration(on: bool) -> None:
     load_config("maintenance")
 
     with transaction.manager:
-        account = get_account_by_name("standalone")
-
-        if account is None:
-            logging.error(
-                "autoregistration script can only be used for self-hosted "
-                "landscape-server after the first account has been bootstrapped"
-            )
-            return
-
-        management = AccountManagement(account)
-        logging.info(
-            "setting autoregistration to %s for account %s",
-            "on" if on else "off",
-            account.name,
+        set_autoregistration(on)
+
+
+def set_autoregistration(on: bool) -> bool:
+    """
+    Sets autoregistration for the standalone account in the current transaction.
+
+    :returns: False if the account has not been bootstrapped yet.
+    """
+    account = get_account_by_name("standalone")
+
+    if account is None:
+        logging.error(
+            "autoregistration script can only be used for self-hosted "
+            "landscape-server after the first account has been bootstrapped"
         )
+        return False
+
+    management = AccountManagement(account)
+    logging.info(
+        "setting autoregistration to %s for account %s",
+        "on" if on else "off",
+        account.name,
+    )
 
-        management.set_preferences(auto_register_new_computers=on)
+    management.set_preferences(auto_register_new_computers=on)
+    return True
 
 
 if __name__ == "__main__":
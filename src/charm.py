@@ -13,19 +13,26 @@ develop a new k8s charm using the Operator Framework:
 """
 
 from base64 import b64decode, b64encode, binascii
+from collections import defaultdict
+from concurrent.futures import as_completed, ThreadPoolExecutor
 from dataclasses import asdict
+from datetime import datetime, timezone
 from functools import cached_property
+import hashlib
+import json
 import os
 import subprocess
-from subprocess import CalledProcessError, check_call
+from subprocess import CalledProcessError, TimeoutExpired
+import time
 from typing import List
 
 from charms.data_platform_libs.v0.data_interfaces import (
     DatabaseCreatedEvent,
     DatabaseEndpointsChangedEvent,
+    DatabaseReadOnlyEndpointsChangedEvent,
     DatabaseRequires,
 )
-from charms.grafana_agent.v0.cos_agent import COSAgentProvider
+from charms.grafana_agent.v0.cos_agent import COSAgentProvider, ProtocolNotFoundError
 from charms.operator_libs_linux.v0 import apt
 from charms.operator_libs_linux.v0.apt import PackageError, PackageNotFoundError
 from charms.operator_libs_linux.v0.passwd import group_exists, user_exists
@@ -47,28 +54,59 @@ from ops.charm import (
     RelationDepartedEvent,
     RelationJoinedEvent,
     UpdateStatusEvent,
+    UpgradeCharmEvent,
 )
-from ops.framework import StoredState
+from ops.framework import PreCommitEvent, StoredState
 from ops.model import (
     ActiveStatus,
     BlockedStatus,
     MaintenanceStatus,
+    ModelError,
     Relation,
+    UnknownStatus,
     WaitingStatus,
 )
 from pydantic import ValidationError
 import yaml
 
-from config import DEFAULT_CONFIGURATION, LandscapeCharmConfiguration, RedirectHTTPS
+from charm_metrics import (
+    install_metrics_service,
+    METRICS_PATH,
+    METRICS_PORT,
+    render as render_charm_metrics,
+    update_counters,
+    write_metrics,
+)
+from config import (
+    DEFAULT_CONFIGURATION,
+    LandscapeCharmConfiguration,
+    METRIC_INSTRUMENTED_SERVICE_PORTS,
+    PackageSearchMode,
+    RedirectHTTPS,
+    Role,
+    SERVICE_ROLES,
+    SESSION_SETTINGS,
+    Store,
+    WORKER_SERVICES,
+)
 from database import (
     DatabaseConnectionContext,
+    enable_pg_stat_statements,
     fetch_postgres_relation_data,
-    grant_role,
+    get_slow_queries,
+    get_table_bloat,
+    grant_roles,
+    maintain_table,
+    reset_pg_stat_statements,
+    select_read_only_endpoint,
+    set_role_settings,
+    SLOW_QUERIES_ORDER,
 )
 from haproxy import (
     create_grpc_service,
     create_http_service,
     create_https_service,
+    create_stats_service,
     create_ubuntu_installer_attach_service,
     ERROR_FILES,
     get_haproxy_error_files,
@@ -77,22 +115,51 @@ from haproxy import (
     HTTPS_SERVICE,
     PORTS,
     SERVER_OPTIONS,
+    STATS_SERVICE,
     UBUNTU_INSTALLER_ATTACH_SERVICE,
 )
-from helpers import get_modified_env_vars, logger, migrate_service_conf
+from hash_id_databases import (
+    is_running as hash_id_databases_running,
+    LOG_FILE as HASH_ID_DATABASES_LOG_FILE,
+    read_status as read_hash_id_databases_status,
+)
+from helpers import (
+    command_stats,
+    get_args_with_secrets_removed,
+    get_modified_env_vars,
+    logger,
+    migrate_service_conf,
+    run_command,
+)
+from hook_stats import (
+    append_record,
+    format_durations,
+    get_hook_name,
+    HOOK_STATS_SIZE,
+    HookProfiler,
+    summarise,
+)
 from settings_files import (
     AMQP_USERNAME,
     configure_for_deployment_mode,
     DEFAULT_POSTGRES_PORT,
     generate_cookie_encryption_key,
     generate_secret_token,
+    get_db_host,
     get_postgres_roles,
+    get_store_connections,
+    get_store_hosts,
+    get_store_users,
+    HashIdDatabasesReadException,
     merge_service_conf,
     prepend_default_settings,
     update_db_conf,
     update_default_settings,
     update_service_conf,
+    update_store_hosts,
+    update_tracing_conf,
     VHOSTS,
+    write_hash_id_databases,
     write_license_file,
     write_ssl_cert,
 )
@@ -104,10 +171,31 @@ NRPE_D_DIR = "/etc/nagios/nrpe.d"
 POSTFIX_CF = "/etc/postfix/main.cf"
 SCHEMA_SCRIPT = "/usr/bin/landscape-schema"
 BOOTSTRAP_ACCOUNT_SCRIPT = "/opt/canonical/landscape/bootstrap-account"
-AUTOREGISTRATION_SCRIPT = os.path.join(os.path.dirname(__file__), "autoregistration.py")
-HASH_ID_DATABASES = "/opt/canonical/landscape/hash-id-databases-ignore-maintenance"
+MAINTENANCE_SCRIPT = os.path.join(os.path.dirname(__file__), "maintenance.py")
+HASH_ID_DATABASES_RUNNER = os.path.join(
+    os.path.dirname(__file__), "hash_id_databases.py"
+)
+HASH_ID_DATABASES_CRON = "/etc/cron.d/landscape-hash-id-databases"
 UPDATE_WSL_DISTRIBUTIONS_SCRIPT = "/opt/canonical/landscape/update-wsl-distributions"
 
+APT_TIMEOUT = 30 * 60
+"""Seconds installing the Landscape packages may take."""
+APT_RETRIES = 3
+"""
+Times to retry the package commands, which fail while another process holds the
+dpkg lock or the archive is unreachable.
+"""
+SCHEMA_TIMEOUT = 3 * 60 * 60
+"""Seconds `landscape-schema` may take, which is long on large databases."""
+MAINTENANCE_TIMEOUT = 30 * 60
+"""Seconds the `MAINTENANCE_SCRIPT` steps may take."""
+
+DB_CONNECTION_BUDGET_STATUS = "Database connection budget"
+"""The start of the blocked status when the connection budget is exceeded."""
+
+RESOURCE_CHUNK_SIZE = 1024 * 1024
+"""Bytes of a resource read at a time, to hash it without loading it whole."""
+
 LANDSCAPE_SERVER = "landscape-server"
 LANDSCAPE_PACKAGES = (
     LANDSCAPE_SERVER,
@@ -126,11 +214,35 @@ DEFAULT_SERVICES = (
     "landscape-hostagent-messenger",
     "landscape-hostagent-consumer",
 )
+LANDSCAPE_PACKAGE_SEARCH = "landscape-package-search"
+LANDSCAPE_PACKAGE_UPLOAD = "landscape-package-upload"
 LEADER_SERVICES = (
-    "landscape-package-search",
-    "landscape-package-upload",
+    LANDSCAPE_PACKAGE_SEARCH,
+    LANDSCAPE_PACKAGE_UPLOAD,
 )
 
+ROLE_SERVICES = {
+    Role.WEB: (
+        "landscape-api",
+        "landscape-appserver",
+        LANDSCAPE_PACKAGE_SEARCH,
+        LANDSCAPE_PACKAGE_UPLOAD,
+    ),
+    Role.MESSAGE: (
+        "landscape-msgserver",
+        "landscape-pingserver",
+        "landscape-hostagent-messenger",
+    ),
+    Role.BACKGROUND: (
+        "landscape-async-frontend",
+        "landscape-job-handler",
+        "landscape-hostagent-consumer",
+    ),
+}
+"""
+The Landscape services that run on a unit configured with each `Role`.
+"""
+
 OPENID_CONFIG_VALS = (
     "openid_provider_url",
     "openid_logout_url",
@@ -147,44 +259,24 @@ PROXY_ENV_MAPPING = {
     "JUJU_CHARM_HTTPS_PROXY": "--with-https-proxy",
     "JUJU_CHARM_NO_PROXY": "--with-no-proxy",
 }
+PROXY_SECRET_ARGS = ("with-http-proxy", "with-https-proxy")
+"""The proxy URLs can hold credentials, so they are not logged."""
 
-METRIC_INSTRUMENTED_SERVICE_PORTS = [
-    ("appserver", 8080),
-    ("pingserver", 8070),
-    ("message-server", 8090),
-    ("api", 9080),
-    ("package-upload", 9100),
-    ("package-search", 9099),
-]
+METRICS_RULES_DIR = os.path.join(os.path.dirname(__file__), "prometheus_alert_rules")
 """
-Default ports for Landscape services in a self-hosted deployment.
-
-Currently this var is only used for metrics configuration, so it only includes the
-applicable services.
-
-TODO all service configuration should be configurable through Juju and passed to the
-Landscape server configuration file.
+The location of Prometheus metrics alerts rules for the COS relation. The rules
+for the services of a role are in a subdirectory named after it, which is only
+provided by units with that role.
 """
 
-METRICS_RULES_DIR = os.path.join(os.path.dirname(__file__), "prometheus_alert_rules")
-"""The location of Prometheus metrics alerts rules for the COS relation."""
-
-
-def get_args_with_secrets_removed(args, arg_names):
-    """
-    We log args passed in the command line. But we want to remove secrets.
+TRACING_PROTOCOL = "otlp_http"
+"""The protocol the Landscape services export their traces with."""
 
-    Returns a copy of the args passed in with secrets associated with arg_names
-    redacted.
-    """
-    args = args.copy()
-    for arg_name in arg_names:
-        dash_arg_name = "--" + arg_name
-        if dash_arg_name in args:
-            idx = args.index(dash_arg_name) + 1
-            if idx < len(args):
-                args[idx] = "REDACTED"
-    return args
+DASHBOARDS_DIR = "./src/grafana_dashboards"
+"""
+The location of the Grafana dashboards for the COS relation. Relative to the
+charm directory, which the dashboard UIDs are derived from.
+"""
 
 
 def _get_ssl_cert(ssl_cert, ssl_key):
@@ -240,9 +332,14 @@ class LandscapeServerCharm(CharmBase):
     def __init__(self, *args):
         super().__init__(*args)
 
+        self._profiler = HookProfiler(get_hook_name())
+        self.framework.observe(self.framework.on.pre_commit, self._record_hook_stats)
+        self.framework.observe(self.framework.on.pre_commit, self._export_metrics)
+
         # Lifecycle
         self.framework.observe(self.on.config_changed, self._on_config_changed)
         self.framework.observe(self.on.install, self._on_install)
+        self.framework.observe(self.on.upgrade_charm, self._on_upgrade_charm)
         self.framework.observe(self.on.start, self._update_status)
         self.framework.observe(self.on.update_status, self._update_status)
 
@@ -260,6 +357,10 @@ class LandscapeServerCharm(CharmBase):
             self.framework.observe(
                 self.database.on.endpoints_changed, self._database_relation_changed
             )
+            self.framework.observe(
+                self.database.on.read_only_endpoints_changed,
+                self._database_relation_changed,
+            )
 
         # Legacy Postgres relation
         elif self.model.get_relation("db") is not None:
@@ -300,6 +401,13 @@ class LandscapeServerCharm(CharmBase):
         self.framework.observe(
             self.on.website_relation_departed, self._website_relation_departed
         )
+
+        self.framework.observe(
+            self.on.cos_agent_relation_changed, self._cos_agent_relation_changed
+        )
+        self.framework.observe(
+            self.on.cos_agent_relation_broken, self._cos_agent_relation_changed
+        )
         self.framework.observe(
             self.on.nrpe_external_master_relation_joined,
             self._nrpe_external_master_relation_joined,
@@ -320,6 +428,9 @@ class LandscapeServerCharm(CharmBase):
         self.framework.observe(
             self.on.replicas_relation_changed, self._on_replicas_relation_changed
         )
+        self.framework.observe(
+            self.on.replicas_relation_departed, self._on_replicas_relation_departed
+        )
 
         # Actions
         self.framework.observe(self.on.pause_action, self._pause)
@@ -329,9 +440,15 @@ class LandscapeServerCharm(CharmBase):
         self.framework.observe(
             self.on.hash_id_databases_action, self._hash_id_databases
         )
+        self.framework.observe(
+            self.on.hash_id_databases_status_action, self._hash_id_databases_status
+        )
         self.framework.observe(
             self.on.migrate_service_conf_action, self._migrate_service_conf
         )
+        self.framework.observe(self.on.db_maintenance_action, self._db_maintenance)
+        self.framework.observe(self.on.slow_queries_action, self._slow_queries)
+        self.framework.observe(self.on.hook_stats_action, self._hook_stats)
 
         # State
         self._stored.set_default(
@@ -350,45 +467,161 @@ class LandscapeServerCharm(CharmBase):
         self._stored.set_default(secret_token=None)
         self._stored.set_default(cookie_encryption_key=None)
         self._stored.set_default(enable_ubuntu_installer_attach=False)
+        self._stored.set_default(hash_id_databases_generation="")
+        self._stored.set_default(hash_id_databases_pending="")
+        self._stored.set_default(hash_id_databases_sync_started="")
+        self._stored.set_default(hash_id_databases_resource="")
+        self._stored.set_default(schema_bootstrap="")
+        self._stored.set_default(schema_bootstrap_waiting=False)
+        self._stored.set_default(maintenance_inputs={})
+        self._stored.set_default(db_session_settings="")
+        self._stored.set_default(hook_stats="[]")
+        self._stored.set_default(charm_metrics="{}")
+        self._stored.set_default(installed_at=0.0)
+        self._stored.set_default(first_active_at=0.0)
+        self._stored.set_default(ready_since={})
 
         self.root_gid = group_exists("root").gr_gid
 
+        try:
+            self.charm_config = LandscapeCharmConfiguration.validate(self.model.config)
+        except ValidationError as e:
+            logger.error(f"Invalid configuration: {e.errors()}")
+            self.charm_config = DEFAULT_CONFIGURATION
+            self.unit.status = BlockedStatus(
+                "Invalid configuration. See `juju debug-log`."
+            )
+
         self._grafana_agent = COSAgentProvider(
             self,
             scrape_configs=self._generate_scrape_configs,
             metrics_rules_dir=METRICS_RULES_DIR,
+            # The rules of the services in the web role are in a subdirectory.
+            recurse_rules_dirs=Role.WEB in self.charm_config.roles,
+            dashboard_dirs=[DASHBOARDS_DIR],
+            tracing_protocols=[TRACING_PROTOCOL],
             refresh_events=[
                 self.on.config_changed,
                 self.on.upgrade_charm,
+                self.on.leader_elected,
+                self.on.website_relation_changed,
+                self.on.website_relation_departed,
             ],
         )
-        try:
-            self.charm_config = LandscapeCharmConfiguration.validate(self.model.config)
-        except ValidationError as e:
-            logger.error(f"Invalid configuration: {e.errors()}")
-            self.charm_config = DEFAULT_CONFIGURATION
-            self.unit.status = BlockedStatus(
-                "Invalid configuration. See `juju debug-log`."
-            )
 
     def _generate_scrape_configs(self) -> list[dict]:
         """
-        Return a scrape config for every metric-instrumented Landscape service.
+        Return a scrape config for every metric-instrumented Landscape service that
+        runs in one of this unit's roles, with a target for each of its workers,
+        and one for the charm's own metrics.
         """
-        return [
+        roles = self.charm_config.roles
+
+        scrape_configs = []
+        for service, port in METRIC_INSTRUMENTED_SERVICE_PORTS:
+            if SERVICE_ROLES[service] not in roles:
+                continue
+
+            workers = 1
+            if service in WORKER_SERVICES:
+                workers = self.charm_config.worker_counts
+
+            scrape_configs.append(
+                {
+                    **self._scrape_job_settings(service),
+                    "metrics_path": "/metrics",
+                    "static_configs": [
+                        {
+                            "targets": [f"localhost:{port + i}"],
+                            "labels": {
+                                "landscape_service": f"{service}",
+                                "worker": str(i),
+                                "unit": self.unit.name,
+                            },
+                        }
+                        for i in range(workers)
+                    ],
+                }
+            )
+
+        scrape_configs.append(
             {
-                "scrape_interval": self.charm_config.prometheus_scrape_interval,
-                "metrics_path": "/metrics",
+                "job_name": "charm",
+                **self._scrape_job_settings("charm"),
+                "metrics_path": METRICS_PATH,
                 "static_configs": [
                     {
-                        "targets": [f"localhost:{port}"],
-                        "labels": {"landscape_service": f"{service}"},
-                    },
+                        "targets": [f"localhost:{METRICS_PORT}"],
+                        "labels": {"unit": self.unit.name},
+                    }
                 ],
             }
-            for service, port in METRIC_INSTRUMENTED_SERVICE_PORTS
+        )
+        scrape_configs.extend(self._generate_haproxy_scrape_configs())
+
+        return scrape_configs
+
+    def _generate_haproxy_scrape_configs(self) -> list[dict]:
+        """
+        Return a scrape config for the statistics frontend of every related HAProxy
+        unit, if it is enabled. Only the leader scrapes them, so that each HAProxy
+        unit is scraped once.
+        """
+        port = self.charm_config.haproxy_stats_port
+        if not port or not self.unit.is_leader():
+            return []
+
+        static_configs = [
+            {
+                "targets": [f"{relation.data[unit]['private-address']}:{port}"],
+                "labels": {"haproxy_unit": unit.name},
+            }
+            for relation in self.model.relations.get("website", [])
+            for unit in sorted(relation.units, key=lambda unit: unit.name)
+            if relation.data[unit].get("private-address")
+        ]
+        if not static_configs:
+            return []
+
+        return [
+            {
+                "job_name": "haproxy",
+                **self._scrape_job_settings("haproxy"),
+                "metrics_path": "/metrics",
+                "static_configs": static_configs,
+            }
         ]
 
+    def _scrape_job_settings(self, job: str) -> dict:
+        """
+        Return the scrape interval of `job`, and the relabelling that drops the
+        metrics not matched by `prometheus_metric_keep`, if it is set, and those
+        matched by `prometheus_metric_drop`.
+        """
+        config = self.charm_config
+        settings = {
+            "scrape_interval": config.prometheus_scrape_interval_overrides.get(
+                job, config.prometheus_scrape_interval
+            ),
+        }
+
+        metric_relabel_configs = [
+            {
+                "source_labels": ["__name__"],
+                "regex": "|".join(patterns),
+                "action": action,
+            }
+            for action, patterns in (
+                ("keep", config.prometheus_metric_keep),
+                ("drop", config.prometheus_metric_drop),
+            )
+            if patterns
+        ]
+        if metric_relabel_configs:
+            settings["metric_relabel_configs"] = metric_relabel_configs
+
+        return settings
+
     def _on_config_changed(self, _) -> None:
         """
         Handle configuration changes.
@@ -447,13 +680,29 @@ class LandscapeServerCharm(CharmBase):
         for relation in self.model.relations.get("website", []):
             self._update_haproxy_connection(relation)
 
+        # The checks follow the roles and the leader services this unit runs.
+        for relation in self.model.relations.get("nrpe-external-master", []):
+            self._update_nrpe_checks(relation)
+
         self._configure_openid()
         self._configure_oidc()
 
+        if not self.unit.is_leader():
+            self._update_package_search_host(self._stored.leader_ip)
+
+        self._configure_hash_id_databases_schedule()
+        self._configure_leader_services()
+
         service_conf_updates = {
             service: {"workers": str(self.charm_config.worker_counts)}
             for service in ("landscape", "api", "message-server", "pingserver")
         }
+        service_conf_updates["job-handler"] = {
+            "workers": str(self.charm_config.job_handler_workers)
+        }
+        service_conf_updates["async-frontend"] = {
+            "workers": str(self.charm_config.async_frontend_workers)
+        }
 
         if root_url := self.charm_config.root_url:
             service_conf_updates["global"] = {"root-url": root_url}
@@ -473,6 +722,14 @@ class LandscapeServerCharm(CharmBase):
             db_kargs["user"] = config_user
         if landscape_password := self.charm_config.db_landscape_password:
             db_kargs["password"] = landscape_password
+        store_hosts = self.charm_config.db_store_hosts
+        if any(location.get("password") for location in store_hosts.values()):
+            logger.warning(
+                "db_store_hosts holds database passwords, which anyone who can run "
+                "`juju config` can read. Leave them out to use the password of "
+                "the main database."
+            )
+        update_store_hosts(store_hosts)
         if db_kargs:
             update_db_conf(**db_kargs)
             if self._migrate_schema_bootstrap():
@@ -480,9 +737,14 @@ class LandscapeServerCharm(CharmBase):
                 self._stored.ready["db"] = True
             else:
                 return
+        elif self.charm_config.db_store_hosts and self._stored.ready["db"]:
+            # Bootstrap the stores on clusters that were added since.
+            if not self._migrate_schema_bootstrap():
+                return
 
-        self._bootstrap_account()
-        self._set_autoregistration()
+        self._run_db_maintenance()
+        self._configure_db_session_settings()
+        self._configure_tracing()
 
         secret_token = self._get_secret_token()
         cookie_encryption_key = self._get_cookie_encryption_key()
@@ -554,6 +816,10 @@ class LandscapeServerCharm(CharmBase):
 
     def _on_install(self, event: InstallEvent) -> None:
         """Handle the install event."""
+        if not self._stored.installed_at:
+            self._stored.installed_at = time.time()
+        install_metrics_service()
+
         self.unit.status = MaintenanceStatus("Installing apt packages")
 
         landscape_ppa_key = self.charm_config.landscape_ppa_key
@@ -606,29 +872,43 @@ class LandscapeServerCharm(CharmBase):
                     f"{add_apt_repository_env['no_proxy']}"
                 )
 
-            check_call(
-                ["add-apt-repository", "-y", landscape_ppa], env=add_apt_repository_env
-            )
+            with self._profiler.step("add-apt-repository"):
+                run_command(
+                    ["add-apt-repository", "-y", landscape_ppa],
+                    env=add_apt_repository_env,
+                    retries=APT_RETRIES,
+                )
 
             if self.charm_config.min_install:
                 logger.info("Not installing hashids..")
-                check_call(
-                    [
-                        "apt",
-                        "install",
-                        LANDSCAPE_SERVER,
-                        "--no-install-recommends",
-                        "-y",
-                    ]
-                )
+                with self._profiler.step("apt-install"):
+                    run_command(
+                        [
+                            "apt",
+                            "install",
+                            LANDSCAPE_SERVER,
+                            "--no-install-recommends",
+                            "-y",
+                        ],
+                        timeout=APT_TIMEOUT,
+                        retries=APT_RETRIES,
+                    )
             else:
                 # Explicitly ensure cache is up-to-date after adding the PPA.
-                apt.add_package(
-                    [LANDSCAPE_SERVER, "landscape-hashids"], update_cache=True
+                with self._profiler.step("apt-install"):
+                    apt.add_package(
+                        [LANDSCAPE_SERVER, "landscape-hashids"], update_cache=True
+                    )
+                run_command(
+                    ["apt-mark", "hold", "landscape-hashids"], retries=APT_RETRIES
                 )
-                check_call(["apt-mark", "hold", "landscape-hashids"])
-            check_call(["apt-mark", "hold", LANDSCAPE_SERVER])
-        except (PackageNotFoundError, PackageError, CalledProcessError) as exc:
+            run_command(["apt-mark", "hold", LANDSCAPE_SERVER], retries=APT_RETRIES)
+        except (
+            PackageNotFoundError,
+            PackageError,
+            CalledProcessError,
+            TimeoutExpired,
+        ) as exc:
             logger.error("Failed to install packages")
             raise exc  # This will trigger juju's exponential retry
 
@@ -648,6 +928,8 @@ class LandscapeServerCharm(CharmBase):
                 license_file, user_exists("landscape").pw_uid, self.root_gid
             )
 
+        self._install_hash_id_databases_resource()
+
         self.unit.status = ActiveStatus("Unit is ready")
 
         # Indicate that this install is a charm install.
@@ -655,9 +937,71 @@ class LandscapeServerCharm(CharmBase):
 
         self._update_ready_status()
 
+    def _on_upgrade_charm(self, event: UpgradeCharmEvent) -> None:
+        """
+        Install a newly attached `hash-id-databases` resource, and the charm
+        metrics service on units installed before it existed.
+        """
+        install_metrics_service()
+
+        if self._install_hash_id_databases_resource():
+            for relation in self.model.relations.get("website", []):
+                self._update_haproxy_connection(relation)
+
+            self._update_ready_status()
+
+    def _install_hash_id_databases_resource(self) -> bool:
+        """
+        Unpack the pre-generated hash-id databases from the `hash-id-databases`
+        resource, if one is attached and has not been unpacked already.
+
+        :returns: True if hash-id databases were unpacked.
+        """
+        try:
+            archive = self.model.resources.fetch("hash-id-databases")
+        except (ModelError, NameError):
+            logger.debug("No hash-id-databases resource attached")
+            return False
+
+        if not os.path.getsize(archive):
+            # An empty file is used as a placeholder for no resource.
+            return False
+
+        sha256 = hashlib.sha256()
+        with open(archive, "rb") as archive_fp:
+            for chunk in iter(lambda: archive_fp.read(RESOURCE_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+
+        if digest == self._stored.hash_id_databases_resource:
+            return False
+
+        prev_status = self.unit.status
+        if isinstance(prev_status, UnknownStatus):
+            # Juju does not accept setting the unknown status back.
+            prev_status = WaitingStatus("Waiting on relations")
+        self.unit.status = MaintenanceStatus("Installing hash-id databases")
+
+        try:
+            write_hash_id_databases(
+                str(archive), user_exists("landscape").pw_uid, self.root_gid
+            )
+        except HashIdDatabasesReadException as e:
+            logger.error("Failed to install hash-id databases: %s", e)
+            return False
+        finally:
+            self.unit.status = prev_status
+
+        logger.info("Installed hash-id databases from resource %s", digest)
+        self._stored.hash_id_databases_resource = digest
+
+        return True
+
     def _update_status(self, event: UpdateStatusEvent) -> None:
         """Called at regular intervals by juju."""
-        self._update_ready_status()
+        self._publish_hash_id_databases_generation()
+        self._check_hash_id_databases_sync()
+        self._check_db_connection_budget()
 
     def _update_ready_status(self, restart_services=False) -> None:
         """If all relations are prepared, updates unit status to Active."""
@@ -671,6 +1015,20 @@ class LandscapeServerCharm(CharmBase):
             )
             return
 
+        budget = self._db_connection_budget()
+        max_connections = self.charm_config.db_max_connections
+        if max_connections and budget > max_connections:
+            logger.error(
+                "The database connection budget of %d exceeds db_max_connections %d",
+                budget,
+                max_connections,
+            )
+            self.unit.status = BlockedStatus(
+                f"{DB_CONNECTION_BUDGET_STATUS} {budget} exceeds "
+                f"db_max_connections {max_connections}"
+            )
+            return
+
         if self._stored.running and not restart_services:
             self.unit.status = ActiveStatus("Unit is ready")
             return
@@ -681,6 +1039,42 @@ class LandscapeServerCharm(CharmBase):
 
         self._stored.running = self._start_services()
 
+    def _check_db_connection_budget(self) -> None:
+        """
+        Re-evaluate the database connection budget, which grows and shrinks with
+        the number of units, unblocking the unit if it now fits.
+        """
+        status = self.unit.status
+        if isinstance(status, BlockedStatus) and status.message.startswith(
+            DB_CONNECTION_BUDGET_STATUS
+        ):
+            self.unit.status = WaitingStatus("Waiting on relations")
+
+        self._update_ready_status()
+
+    def _db_connection_budget(self) -> int:
+        """
+        The most database connections the units of this application may open: the
+        number of units, times the Landscape processes each runs, times
+        `db_connections_per_process`.
+        """
+        roles = self.charm_config.roles
+        processes = 0
+        if Role.WEB in roles:
+            processes += 2 * self.charm_config.worker_counts
+        if Role.MESSAGE in roles:
+            processes += 2 * self.charm_config.worker_counts
+        if Role.BACKGROUND in roles:
+            processes += self.charm_config.job_handler_workers
+            processes += self.charm_config.async_frontend_workers
+
+        units = 1
+        peer_relation = self.model.get_relation("replicas")
+        if peer_relation is not None:
+            units += len(peer_relation.units)
+
+        return units * processes * self.charm_config.db_connections_per_process
+
     def _start_services(self) -> bool:
         """
         Starts all Landscape Server systemd services. Returns True if
@@ -690,20 +1084,39 @@ class LandscapeServerCharm(CharmBase):
         is_leader = self.unit.is_leader()
         deployment_mode = self.charm_config.deployment_mode
         is_standalone = deployment_mode == "standalone"
+        roles = self.charm_config.roles
+        web = Role.WEB in roles
+        message = Role.MESSAGE in roles
+        background = Role.BACKGROUND in roles
+        worker_counts = str(self.charm_config.worker_counts)
 
         update_default_settings(
             {
                 "RUN_ALL": "no",
-                "RUN_APISERVER": str(self.charm_config.worker_counts),
-                "RUN_ASYNC_FRONTEND": "yes",
-                "RUN_JOBHANDLER": "yes",
-                "RUN_APPSERVER": str(self.charm_config.worker_counts),
-                "RUN_MSGSERVER": str(self.charm_config.worker_counts),
-                "RUN_PINGSERVER": str(self.charm_config.worker_counts),
-                "RUN_CRON": "yes" if is_leader else "no",
-                "RUN_PACKAGESEARCH": "yes" if is_leader else "no",
+                "RUN_APISERVER": worker_counts if web else "no",
+                "RUN_ASYNC_FRONTEND": (
+                    str(self.charm_config.async_frontend_workers)
+                    if background
+                    else "no"
+                ),
+                "RUN_JOBHANDLER": (
+                    str(self.charm_config.job_handler_workers) if background else "no"
+                ),
+                "RUN_APPSERVER": worker_counts if web else "no",
+                "RUN_MSGSERVER": worker_counts if message else "no",
+                "RUN_PINGSERVER": worker_counts if message else "no",
+                "RUN_CRON": "yes" if is_leader and background else "no",
+                "RUN_PACKAGESEARCH": (
+                    "yes"
+                    if LANDSCAPE_PACKAGE_SEARCH in self._leader_services() and web
+                    else "no"
+                ),
                 "RUN_PACKAGEUPLOADSERVER": (
-                    "yes" if is_leader and is_standalone else "no"
+                    "yes"
+                    if LANDSCAPE_PACKAGE_UPLOAD in self._leader_services()
+                    and is_standalone
+                    and web
+                    else "no"
                 ),
                 "RUN_PPPA_PROXY": "no",
             }
@@ -712,10 +1125,11 @@ class LandscapeServerCharm(CharmBase):
         logger.info("Starting services")
 
         try:
-            check_call([LSCTL, "restart"], env=get_modified_env_vars())
+            with self._profiler.step("lsctl-restart"):
+                run_command([LSCTL, "restart"], env=get_modified_env_vars())
             self.unit.status = ActiveStatus("Unit is ready")
             return True
-        except CalledProcessError as e:
+        except (CalledProcessError, TimeoutExpired) as e:
             logger.error("Starting services failed with output: %s", e.output)
             self.unit.status = BlockedStatus("Failed to start services")
             return False
@@ -790,7 +1204,7 @@ class LandscapeServerCharm(CharmBase):
         if not self._migrate_schema_bootstrap():
             return
 
-        if not self._update_wsl_distributions():
+        if not self._run_db_maintenance(update_wsl_distributions=True):
             return
 
         self._stored.ready["db"] = True
@@ -798,7 +1212,12 @@ class LandscapeServerCharm(CharmBase):
         self._update_ready_status(restart_services=True)
 
     def _database_relation_changed(
-        self, _: DatabaseCreatedEvent | DatabaseEndpointsChangedEvent
+        self,
+        _: (
+            DatabaseCreatedEvent
+            | DatabaseEndpointsChangedEvent
+            | DatabaseReadOnlyEndpointsChangedEvent
+        ),
     ) -> None:
         """
         Handle the modern Postgres charm interface (`database` relation).
@@ -862,20 +1281,31 @@ class LandscapeServerCharm(CharmBase):
             user = db_ctx.username
             logger.debug("Using the username provided by the relation.")
 
+        # The standbys are only known to be in use if the primary is not overridden.
+        read_only_host = None
+        if not config_host:
+            read_only_host = select_read_only_endpoint(
+                db_ctx.read_only_endpoints, int(self.unit.name.split("/")[-1])
+            )
+            logger.debug("Using the read-only endpoint: %s", read_only_host)
+
         logger.debug("Updating the `stores` and `schema` sections in `service.conf`...")
 
-        update_db_conf(
+        # A new standby or primary elsewhere need not affect this unit's
+        # endpoints, so only restart the services if they changed.
+        stores_changed = update_db_conf(
             host=host,
             port=port,
             user=user,
             password=password,
             schema_password=schema_password,
+            read_only_host=read_only_host,
         )
 
         if not self.unit.is_leader():
             self._stored.ready["db"] = True
             self.unit.status = ActiveStatus("Unit is ready")
-            self._update_ready_status(restart_services=True)
+            self._update_ready_status(restart_services=stores_changed)
             return
 
         roles = get_postgres_roles(db_ctx.version)
@@ -889,26 +1319,20 @@ class LandscapeServerCharm(CharmBase):
         supports_charmed_roles = roles.owner == "charmed_dba"
 
         if supports_charmed_roles:
-            grant_role(
-                host=host,
-                port=port,
-                relation_user=relation_username,
-                relation_password=relation_password,
-                role="charmed_dml",
-                user=roles.application,
-            )
-
+            grants = [("charmed_dml", roles.application)]
             if roles.superuser:
-                grant_role(
+                grants.append(("charmed_dba", roles.superuser))
+
+            with self._profiler.step("grant-roles"):
+                grant_roles(
                     host=host,
                     port=port,
                     relation_user=relation_username,
                     relation_password=relation_password,
-                    role="charmed_dba",
-                    user=roles.superuser,
+                    grants=grants,
                 )
 
-        if not self._update_wsl_distributions():
+        if not self._run_db_maintenance(update_wsl_distributions=True):
             logger.info(
                 "Updating WSL distributions failed trying to update the `database` "
                 "relation!"
@@ -919,7 +1343,9 @@ class LandscapeServerCharm(CharmBase):
         self._stored.ready["db"] = True
         self.unit.status = ActiveStatus("Unit is ready")
 
-        self._update_ready_status(restart_services=True)
+        self._configure_db_session_settings()
+
+        self._update_ready_status(restart_services=stores_changed)
 
     @cached_property
     def _proxy_settings(self) -> List[str]:
@@ -944,10 +1370,25 @@ class LandscapeServerCharm(CharmBase):
         """
         Migrates schema along with the bootstrap command which ensures that the
         databases and the landscape user exists, and that proxy settings are set.
-        In addition, creates admin if configured.
+
+        The bootstrap only needs to run once per landscape-server version, database
+        endpoint, proxy settings and owner role. The leader runs it and publishes
+        the one it bootstrapped to the peer relation. Non-leaders wait for the
+        leader to publish their version and endpoint instead of running it.
 
         :returns: True on success.
         """
+        if not self.unit.is_leader():
+            return self._check_peer_schema_bootstrap()
+
+        marker = self._schema_bootstrap_marker()
+        if marker and (settings := self._schema_bootstrap_settings(owner_role)):
+            marker = f"{marker}#{settings}"
+
+        if marker and marker == self._stored.schema_bootstrap:
+            logger.info("Schema already bootstrapped for %s", marker)
+            return True
+
         call = [SCHEMA_SCRIPT, "--bootstrap"]
 
         if owner_role:
@@ -957,34 +1398,286 @@ class LandscapeServerCharm(CharmBase):
             call.extend(self._proxy_settings)
 
         try:
-            check_call(call, env=get_modified_env_vars())
-            self._bootstrap_account()
-            self._set_autoregistration()
-            return True
+            with self._profiler.step("schema-bootstrap"):
+                run_command(
+                    call,
+                    env=get_modified_env_vars(),
+                    timeout=SCHEMA_TIMEOUT,
+                    secret_args=PROXY_SECRET_ARGS,
+                )
         except CalledProcessError as e:
             logger.error(
                 "Landscape Server schema update failed with return code %d",
                 e.returncode,
             )
             self.unit.status = BlockedStatus("Failed to update database schema")
+            return
+        except TimeoutExpired:
+            self.unit.status = BlockedStatus("Failed to update database schema")
+            return
+
+        if marker:
+            self._stored.schema_bootstrap = marker
+            self._publish_schema_bootstrap(marker)
 
-    def _update_wsl_distributions(self) -> bool | None:
-        logger.info("Updating WSL distributions...")
+        return True
+
+    def _check_peer_schema_bootstrap(self) -> bool:
+        """
+        Whether the leader published a schema bootstrap for this unit's
+        landscape-server version and database endpoints. If not, wait for it.
+        """
+        marker = self._schema_bootstrap_marker()
+        published = (self._get_peer_schema_bootstrap() or "").partition("#")[0]
+        if marker and marker == published:
+            logger.info("Schema already bootstrapped for %s", marker)
+            self._stored.schema_bootstrap_waiting = False
+            return True
+
+        logger.info("Waiting for the leader to bootstrap the schema for %s", marker)
+        self._stored.schema_bootstrap_waiting = True
+        self.unit.status = WaitingStatus("Waiting for the leader to bootstrap schema")
+        return False
+
+    def _resume_schema_bootstrap(self) -> None:
+        """
+        Finish setting up the database on a non-leader that waited for the leader
+        to bootstrap the schema, once the leader published it.
+        """
+        if not self._stored.schema_bootstrap_waiting:
+            return
+
+        if not self._check_peer_schema_bootstrap():
+            return
+
+        self._stored.ready["db"] = True
+        self.unit.status = WaitingStatus("Waiting on relations")
+        self._run_db_maintenance()
+        self._configure_tracing()
+
+    def _schema_bootstrap_marker(self) -> str | None:
+        """
+        Identify a schema bootstrap by the installed landscape-server version and
+        the database endpoints of the stores in `service.conf`.
+
+        :returns: None if either is unknown, in which case the leader always runs
+            the bootstrap.
+        """
+        db_host = get_db_host()
+        if not db_host:
+            return None
 
         try:
-            check_call(
-                [UPDATE_WSL_DISTRIBUTIONS_SCRIPT],
-                env=get_modified_env_vars(),
-            )
+            installed = apt.DebianPackage.from_installed_package(LANDSCAPE_SERVER)
+        except PackageNotFoundError:
+            return None
+
+        store_hosts = "".join(
+            f",{store}={host}" for store, host in sorted(get_store_hosts().items())
+        )
+
+        return f"{installed.version}@{db_host}{store_hosts}"
+
+    def _schema_bootstrap_settings(self, owner_role: str | None) -> str:
+        """
+        A digest of the owner role and proxy settings the schema is bootstrapped
+        with, so that the bootstrap runs again when they change. The proxy URLs can
+        hold credentials, so they are not published as is.
+
+        :returns: An empty string if neither is set.
+        """
+        if not owner_role and not self._proxy_settings:
+            return ""
+
+        settings = json.dumps([owner_role, self._proxy_settings])
+        return hashlib.sha256(settings.encode()).hexdigest()[:16]
+
+    def _get_peer_schema_bootstrap(self) -> str | None:
+        peer_relation = self.model.get_relation("replicas")
+        if peer_relation is None:
+            return None
+
+        return peer_relation.data[self.app].get("schema-bootstrap")
+
+    def _publish_schema_bootstrap(self, marker: str) -> None:
+        if not self.unit.is_leader():
+            return
+
+        peer_relation = self.model.get_relation("replicas")
+        if peer_relation is None:
+            return
+
+        peer_relation.data[self.app].update({"schema-bootstrap": marker})
+
+    def _configure_db_session_settings(self) -> None:
+        """
+        Set the `db_session_settings` of the role the Landscape services connect
+        to each store with, if they or the stores changed since they were last
+        set. Nothing is changed on the database until the option is first used.
+        """
+        if not self.unit.is_leader() or not self._stored.ready["db"]:
+            return
+
+        settings = self.charm_config.db_session_settings
+        if not settings and not self._stored.db_session_settings:
+            return
+
+        stores = get_store_connections()
+        users = get_store_users()
+        inputs = hashlib.sha256(
+            json.dumps(
+                {
+                    store: [
+                        db.host,
+                        db.port,
+                        db.database,
+                        users[store],
+                        settings.get(Store(store), {}),
+                    ]
+                    for store, db in stores.items()
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+        if inputs == self._stored.db_session_settings:
+            return
+
+        # Each store is its own database, so their settings are set in parallel.
+        failed = False
+        with (
+            self._profiler.step("db-session-settings"),
+            ThreadPoolExecutor(max_workers=len(Store)) as executor,
+        ):
+            futures = {
+                executor.submit(
+                    set_role_settings,
+                    db,
+                    users[store],
+                    settings.get(Store(store), {}),
+                    reset=list(SESSION_SETTINGS),
+                ): store
+                for store, db in stores.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (CalledProcessError, TimeoutExpired) as e:
+                    logger.error(
+                        "Setting the session settings of %s failed: %s",
+                        futures[future],
+                        e,
+                    )
+                    failed = True
+
+        if not failed:
+            self._stored.db_session_settings = inputs
+
+    def _run_db_maintenance(self, update_wsl_distributions: bool = False) -> bool:
+        """
+        Bootstrap the admin account, set autoregistration and, if requested, update
+        the stock WSL distributions in a single `MAINTENANCE_SCRIPT` process.
+
+        Only the steps whose inputs changed since their last successful run are
+        run.
+
+        :returns: False if the WSL distributions could not be updated.
+        """
+        steps = {}
+
+        if bootstrap_args := self._get_bootstrap_account_args():
+            steps["bootstrap-account"] = {"args": bootstrap_args}
+
+        if self.unit.is_leader() and (
+            self._stored.account_bootstrapped or "bootstrap-account" in steps
+        ):
+            steps["autoregistration"] = {"on": self.charm_config.autoregistration}
+
+        if update_wsl_distributions:
+            logger.info("Updating WSL distributions...")
+            schema = self._schema_bootstrap_marker()
+            steps["update-wsl-distributions"] = {"schema": schema}
+
+        # bootstrap-account runs until it succeeds once, which
+        # `account_bootstrapped` records, so its inputs are not kept. They hold
+        # the admin password, which should not be stored, even hashed.
+        self._stored.maintenance_inputs.pop("bootstrap-account", None)
+        inputs = {
+            name: hashlib.sha256(
+                json.dumps(params, sort_keys=True).encode()
+            ).hexdigest()
+            for name, params in steps.items()
+            if name != "bootstrap-account"
+        }
+        if update_wsl_distributions and not schema:
+            # The inputs of the WSL distributions are unknown, always update them.
+            inputs.pop("update-wsl-distributions", None)
+
+        steps = {
+            name: params
+            for name, params in steps.items()
+            if name not in inputs
+            or inputs[name] != self._stored.maintenance_inputs.get(name)
+        }
+
+        if not steps:
             return True
-        except CalledProcessError as e:
+
+        try:
+            with self._profiler.step("db-maintenance"):
+                result = run_command(
+                    ["python3", MAINTENANCE_SCRIPT],
+                    input=json.dumps(steps),
+                    capture_output=True,
+                    text=True,
+                    env=get_modified_env_vars(),
+                    timeout=MAINTENANCE_TIMEOUT,
+                    check=False,
+                )
+        except TimeoutExpired:
             logger.error(
-                "Failed to update WSL distributions with return code %d", e.returncode
+                "Maintenance steps timed out after %s seconds", MAINTENANCE_TIMEOUT
             )
+            step_results = {}
+        else:
+            try:
+                step_results = json.loads(result.stdout.splitlines()[-1])
+            except (IndexError, ValueError):
+                logger.error("Maintenance steps failed: %s", result.stderr)
+                step_results = {}
+
+        for name in steps:
+            step_result = step_results.get(name, {"ok": False, "error": ""})
+
+            if step_result["ok"]:
+                logger.info(
+                    "Maintenance step %s took %.2fs", name, step_result["duration"]
+                )
+                if name in inputs:
+                    self._stored.maintenance_inputs[name] = inputs[name]
+            else:
+                logger.error(
+                    "Maintenance step %s failed: %s", name, step_result["error"]
+                )
+
+        if "bootstrap-account" in steps:
+            error = step_results.get("bootstrap-account", {}).get("error", "")
+            if step_results.get("bootstrap-account", {}).get("ok"):
+                logger.info("Admin account successfully bootstrapped!")
+                self._stored.account_bootstrapped = True
+            elif "DuplicateAccountError" in error:
+                logger.error("Cannot bootstrap b/c account is already there!")
+                self._stored.account_bootstrapped = True
+
+        if "update-wsl-distributions" in steps and not step_results.get(
+            "update-wsl-distributions", {}
+        ).get("ok"):
             logger.info(
                 "Try updating the stock WSL distributions again later by running '%s'.",
                 UPDATE_WSL_DISTRIBUTIONS_SCRIPT,
             )
+            return False
+
+        return True
 
     def _amqp_relation_joined(self, event: RelationJoinedEvent) -> None:
         relation_name = event.relation.name
@@ -1081,6 +1774,10 @@ class LandscapeServerCharm(CharmBase):
             service_ports=PORTS,
             server_options=SERVER_OPTIONS,
             redirect_https=self.charm_config.redirect_https,
+            roles=self.charm_config.roles,
+            serve_package_upload=LANDSCAPE_PACKAGE_UPLOAD in self._leader_services(),
+            serve_hashid_databases=self._serves_hash_id_databases(),
+            request_timing_logs=self.charm_config.haproxy_request_timing_logs,
         )
 
         https_service = create_https_service(
@@ -1093,11 +1790,18 @@ class LandscapeServerCharm(CharmBase):
             error_files=error_files,
             service_ports=PORTS,
             server_options=SERVER_OPTIONS,
+            roles=self.charm_config.roles,
+            serve_package_upload=LANDSCAPE_PACKAGE_UPLOAD in self._leader_services(),
+            serve_hashid_databases=self._serves_hash_id_databases(),
+            request_timing_logs=self.charm_config.haproxy_request_timing_logs,
         )
 
         services = [http_service, https_service]
 
-        if self.charm_config.enable_hostagent_messenger:
+        if (
+            self.charm_config.enable_hostagent_messenger
+            and Role.MESSAGE in self.charm_config.roles
+        ):
             grpc_service = create_grpc_service(
                 grpc_service=asdict(GRPC_SERVICE),
                 ssl_cert=ssl_cert,
@@ -1124,6 +1828,15 @@ class LandscapeServerCharm(CharmBase):
                 )
             )
 
+        if self.charm_config.haproxy_stats_port:
+            services.append(
+                create_stats_service(
+                    stats_service=asdict(STATS_SERVICE),
+                    port=self.charm_config.haproxy_stats_port,
+                    allowed_networks=self.charm_config.haproxy_stats_allowed_networks,
+                )
+            )
+
         relation.data[self.unit].update({"services": yaml.safe_dump(services)})
         self._stored.ready["haproxy"] = True
         self.unit.status = WaitingStatus("")
@@ -1159,21 +1872,121 @@ class LandscapeServerCharm(CharmBase):
 
         self._update_ready_status()
 
+    def _cos_agent_relation_changed(self, _) -> None:
+        """
+        Restart the Landscape services to export their traces to the tracing
+        endpoint of the Grafana machine agent, once it is known or when it changes.
+        """
+        if self._configure_tracing():
+            self._update_ready_status(restart_services=True)
+
+    def _configure_tracing(self) -> bool:
+        """
+        Configure the Landscape services to export traces to the OTLP receiver of
+        the `cos-agent` relation, if `tracing_sample_ratio` is set and the receiver
+        is connected to a tracing backend.
+
+        :returns: Whether the tracing configuration changed.
+        """
+        endpoint = None
+        relation = self.model.get_relation("cos-agent")
+        if (
+            relation
+            and self.charm_config.tracing_sample_ratio
+            and self._grafana_agent.is_ready(relation)
+        ):
+            try:
+                endpoint = self._grafana_agent.get_tracing_endpoint(
+                    TRACING_PROTOCOL, relation
+                )
+            except ProtocolNotFoundError:
+                logger.info("The cos-agent relation has no tracing endpoint yet")
+
+        return update_tracing_conf(endpoint, self.charm_config.tracing_sample_ratio)
+
     def _website_relation_departed(self, event: RelationDepartedEvent) -> None:
         event.relation.data[self.unit].update({"services": ""})
 
     def _nrpe_external_master_relation_joined(self, event: RelationJoinedEvent) -> None:
         self._update_nrpe_checks(event.relation)
 
-    def _update_nrpe_checks(self, relation: Relation):
-        logger.debug("Configuring NRPE checks")
+    def _role_services(self) -> set[str]:
+        """
+        Return the Landscape services that belong to this unit's roles.
+        """
+        role_services = set()
+        for role in self.charm_config.roles:
+            role_services.update(ROLE_SERVICES[role])
+
+        return role_services
+
+    def _leader_services(self) -> tuple[str, ...]:
+        """
+        Return the `LEADER_SERVICES` that this unit should run.
 
+        Every unit runs package-search when `package_search_mode` is `local`, and
+        package-upload when `package_upload_shared_storage` is set.
+        """
         if self.unit.is_leader():
-            services_to_add = DEFAULT_SERVICES + LEADER_SERVICES
-            services_to_remove = ()
+            return LEADER_SERVICES
+
+        services = ()
+        if self.charm_config.package_search_mode == PackageSearchMode.LOCAL:
+            services += (LANDSCAPE_PACKAGE_SEARCH,)
+        if self.charm_config.package_upload_shared_storage:
+            services += (LANDSCAPE_PACKAGE_UPLOAD,)
+
+        return services
+
+    def _serves_hash_id_databases(self) -> bool:
+        """
+        Whether this unit should publish servers for the hash-id-databases
+        backends.
+
+        Non-leaders only do so once they have generated their own copy, or
+        unpacked the charm resource. Leftover or partially written files do not
+        count.
+        """
+        if self.unit.is_leader():
+            return True
+
+        return self.charm_config.hash_id_databases_all_units and bool(
+            self._stored.hash_id_databases_generation
+            or self._stored.hash_id_databases_resource
+        )
+
+    def _update_package_search_host(self, leader_ip: str | None) -> None:
+        """
+        Point this non-leader unit's package-search clients at the leader, or at
+        its own package-search service when `package_search_mode` is `local` and
+        the unit runs it in its web role.
+        """
+        local = self.charm_config.package_search_mode == PackageSearchMode.LOCAL
+        if local and SERVICE_ROLES["package-search"] in self.charm_config.roles:
+            host = "localhost"
+        elif leader_ip:
+            host = leader_ip
         else:
-            services_to_add = DEFAULT_SERVICES
-            services_to_remove = LEADER_SERVICES
+            return
+
+        update_service_conf(
+            {
+                "package-search": {
+                    "host": host,
+                },
+            }
+        )
+
+    def _update_nrpe_checks(self, relation: Relation):
+        logger.debug("Configuring NRPE checks")
+
+        role_services = self._role_services()
+
+        candidates = DEFAULT_SERVICES + self._leader_services()
+        services_to_add = tuple(s for s in candidates if s in role_services)
+        services_to_remove = tuple(
+            s for s in DEFAULT_SERVICES + LEADER_SERVICES if s not in services_to_add
+        )
 
         monitors = {
             "monitors": {
@@ -1289,15 +2102,7 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
         if not self.unit.is_leader():
             peer_relation = self.model.get_relation("replicas")
             leader_ip = peer_relation.data[self.app].get("leader-ip")
-
-            if leader_ip:
-                update_service_conf(
-                    {
-                        "package-search": {
-                            "host": leader_ip,
-                        },
-                    }
-                )
+            self._update_package_search_host(leader_ip)
 
         self._leader_changed()
 
@@ -1317,24 +2122,28 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
             for relation in haproxy_relations:
                 self._update_haproxy_connection(relation)
 
-            # Enable leader services on this unit.
-            paused_services = (s for s in LEADER_SERVICES if not service_running(s))
-            for service in paused_services:
-                try:
-                    service_resume(service)
-                except SystemdError as e:
-                    logger.warn(str(e))
-        else:
-            # Disable leader services on this unit. Requests will be directed to the
-            # leader anyways.
-            for service in LEADER_SERVICES:
-                try:
-                    service_pause(service)
-                except SystemdError as e:
-                    logger.warn(str(e))
+        self._configure_hash_id_databases_schedule()
+        self._configure_leader_services()
 
         self._update_ready_status(restart_services=True)
 
+    def _configure_leader_services(self) -> None:
+        """
+        Enable the leader services this unit runs, if it runs their role. Disable
+        the others; requests will be directed to the leader anyways.
+        """
+        role_services = self._role_services()
+        unit_services = [s for s in self._leader_services() if s in role_services]
+
+        for service in LEADER_SERVICES:
+            try:
+                if service not in unit_services:
+                    service_pause(service)
+                elif not service_running(service):
+                    service_resume(service)
+            except SystemdError as e:
+                logger.warn(str(e))
+
     def _on_replicas_relation_joined(self, event: RelationJoinedEvent) -> None:
         if self.unit.is_leader():
             ip = str(self.model.get_binding(event.relation).network.bind_address)
@@ -1342,6 +2151,11 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
 
         event.relation.data[self.unit].update({"unit-data": self.unit.name})
 
+        self._check_db_connection_budget()
+
+    def _on_replicas_relation_departed(self, _: RelationDepartedEvent) -> None:
+        self._check_db_connection_budget()
+
     def _on_replicas_relation_changed(self, event: RelationChangedEvent) -> None:
         leader_ip_value = event.relation.data[self.app].get("leader-ip")
 
@@ -1349,14 +2163,11 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
             self._stored.leader_ip = leader_ip_value
 
         if not self.unit.is_leader():
-            if leader_ip_value:
-                update_service_conf(
-                    {
-                        "package-search": {
-                            "host": leader_ip_value,
-                        },
-                    }
-                )
+            self._update_package_search_host(leader_ip_value)
+            self._resume_schema_bootstrap()
+            self._sync_hash_id_databases(
+                event.relation.data[self.app].get("hash-id-databases-generation")
+            )
 
         self._leader_changed()
 
@@ -1396,7 +2207,9 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
             postfix_config_file.write("\n".join(new_lines))
 
         # Restart postfix.
-        if not service_reload("postfix"):
+        with self._profiler.step("postfix-reload"):
+            reloaded = service_reload("postfix")
+        if not reloaded:
             self.unit.status = BlockedStatus("postfix configuration failed")
         else:
             self.unit.status = WaitingStatus("Waiting on relations")
@@ -1436,8 +2249,11 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
         )
         self.unit.status = WaitingStatus("Waiting on relations")
 
-    def _bootstrap_account(self):
-        """If admin account details are provided, create admin"""
+    def _get_bootstrap_account_args(self) -> list[str] | None:
+        """
+        If admin account details are provided, get the arguments of
+        `BOOTSTRAP_ACCOUNT_SCRIPT` that create the admin.
+        """
         if not self.unit.is_leader():
             return
         if self._stored.account_bootstrapped:  # Admin already created
@@ -1466,7 +2282,7 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
         karg["system_email"] = self.charm_config.system_email
 
         # Collect command line arguments
-        args = [BOOTSTRAP_ACCOUNT_SCRIPT]
+        args = []
         for key, value in karg.items():
             if not value:
                 continue
@@ -1475,63 +2291,17 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
 
         secret_args = ["admin_password", "registration_key"]
         logged_args = get_args_with_secrets_removed(args, secret_args)
-        logger.info(logged_args)
-
-        try:
-            result = subprocess.run(
-                args, capture_output=True, text=True, env=get_modified_env_vars()
-            )
-        except FileNotFoundError:
-            logger.error("Bootstrap script not found!")
-            logger.error(BOOTSTRAP_ACCOUNT_SCRIPT)
-            return
-        logger.info(result.stdout)
-        if result.returncode:
-            if "DuplicateAccountError" in result.stderr:
-                logger.error("Cannot bootstrap b/c account is already there!")
-                self._stored.account_bootstrapped = True
-            else:
-                logger.error(result.stderr)
-        else:
-            logger.info("Admin account successfully bootstrapped!")
-            self._stored.account_bootstrapped = True
-
-    def _set_autoregistration(self) -> None:
-        """Turns autoregistration on or off.
-
-        Only the leader does this to prevent unnecessary DB writes.
-        We can only do this after the initial account is bootstrapped.
-        """
-        on = "on" if self.charm_config.autoregistration else "off"
-
-        if not self.unit.is_leader():
-            return
-
-        if not self._stored.account_bootstrapped:
-            logger.error("Cannot modify autoregistration because no account exists.")
-            return
-
-        logger.info("Setting autoregistration...")
-        result = subprocess.run(
-            ["python3", AUTOREGISTRATION_SCRIPT, on],
-            capture_output=True,
-            text=True,
-            env=get_modified_env_vars(),
-        )
-
-        logger.info(result.stdout)
+        logger.info([BOOTSTRAP_ACCOUNT_SCRIPT] + logged_args)
 
-        if result.returncode:
-            logger.error(result.stderr)
+        return args
 
     def _pause(self, event: ActionEvent) -> None:
         self.unit.status = MaintenanceStatus("Stopping services")
         event.log("Stopping services")
 
         try:
-            check_call([LSCTL, "stop"], env=get_modified_env_vars())
-        except CalledProcessError as e:
-            logger.error("Stopping services failed with return code %d", e.returncode)
+            run_command([LSCTL, "stop"], env=get_modified_env_vars())
+        except (CalledProcessError, TimeoutExpired):
             self.unit.status = BlockedStatus("Failed to stop services")
             event.fail("Failed to stop services")
         else:
@@ -1543,21 +2313,25 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
         self.unit.status = MaintenanceStatus("Starting services")
         event.log("Starting services")
 
+        start_output = ""
         try:
-            start_result = subprocess.run(
+            start_output = run_command(
                 [LSCTL, "start"],
                 capture_output=True,
                 text=True,
                 env=get_modified_env_vars(),
-            )
-            check_call([LSCTL, "status"], env=get_modified_env_vars())
-        except CalledProcessError as e:
-            logger.error("Starting services failed with return code %d", e.returncode)
-            logger.error("Failed to start services: %s", start_result.stdout)
+                check=False,
+            ).stdout
+            run_command([LSCTL, "status"], env=get_modified_env_vars())
+        except (CalledProcessError, TimeoutExpired):
+            logger.error("Failed to start services: %s", start_output)
             self.unit.status = MaintenanceStatus("Stopping services")
-            subprocess.run([LSCTL, "stop"], env=get_modified_env_vars())
+            try:
+                run_command([LSCTL, "stop"], env=get_modified_env_vars(), check=False)
+            except TimeoutExpired:
+                pass
             self.unit.status = BlockedStatus("Failed to start services")
-            event.fail(f"Failed to start services: {start_result.stdout}")
+            event.fail(f"Failed to start services: {start_output}")
         else:
             self._stored.running = True
             self._stored.paused = False
@@ -1582,13 +2356,17 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
             try:
                 event.log(f"Upgrading {package}...")
                 if package == LANDSCAPE_SERVER:
-                    check_call(["apt-mark", "unhold", LANDSCAPE_SERVER])
+                    run_command(
+                        ["apt-mark", "unhold", LANDSCAPE_SERVER], retries=APT_RETRIES
+                    )
                 pkg = apt.DebianPackage.from_apt_cache(package)
                 pkg.ensure(state=apt.PackageState.Latest)
                 installed = apt.DebianPackage.from_installed_package(package)
                 event.log(f"Upgraded to {installed.version}...")
                 if package == LANDSCAPE_SERVER:
-                    check_call(["apt-mark", "hold", LANDSCAPE_SERVER])
+                    run_command(
+                        ["apt-mark", "hold", LANDSCAPE_SERVER], retries=APT_RETRIES
+                    )
             except PackageNotFoundError as e:
                 logger.error(
                     f"Could not upgrade package {package}. Reason: {e.message}"
@@ -1612,34 +2390,383 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
         event.log("Running schema migration...")
 
         try:
-            subprocess.run(
-                [SCHEMA_SCRIPT], check=True, text=True, env=get_modified_env_vars()
+            run_command(
+                [SCHEMA_SCRIPT],
+                text=True,
+                env=get_modified_env_vars(),
+                timeout=SCHEMA_TIMEOUT,
             )
         except CalledProcessError as e:
             logger.error("Schema migration failed with error code %s", e.returncode)
             event.fail(f"Schema migration failed with error code {e.returncode}")
             self.unit.status = BlockedStatus("Failed schema migration")
+        except TimeoutExpired:
+            event.fail(f"Schema migration timed out after {SCHEMA_TIMEOUT} seconds")
+            self.unit.status = BlockedStatus("Failed schema migration")
         else:
             self.unit.status = prev_status
 
     def _hash_id_databases(self, event: ActionEvent) -> None:
+        if hash_id_databases_running():
+            event.fail("Hashing ID databases is already in progress")
+            return
+
+        if event.params.get("background"):
+            event.log("Starting hash_id_databases in the background")
+            try:
+                self._start_hash_id_databases()
+            except OSError as e:
+                logger.error("Starting hash_id_databases failed: %s", e)
+                event.fail(f"Starting hash_id_databases failed: {e}")
+                return
+            event.set_results(
+                {"state": "started", "log-file": HASH_ID_DATABASES_LOG_FILE}
+            )
+            return
+
         prev_status = self.unit.status
         self.unit.status = MaintenanceStatus("Hashing ID databases...")
         event.log("Running hash_id_databases")
 
         try:
-            subprocess.run(
-                ["sudo", "-u", "landscape", HASH_ID_DATABASES],
-                check=True,
+            process = subprocess.Popen(
+                ["python3", HASH_ID_DATABASES_RUNNER],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
                 text=True,
                 env=get_modified_env_vars(),
             )
-        except CalledProcessError as e:
-            logger.error("Hashing ID databases failed with error code %s", e.returncode)
-            event.fail(f"Hashing ID databases failed with error code {e.returncode}")
+            for line in process.stdout:
+                event.log(line.rstrip())
+            returncode = process.wait()
+        except OSError as e:
+            logger.error("Running hash_id_databases failed: %s", e)
+            event.fail(f"Running hash_id_databases failed: {e}")
+            return
         finally:
             self.unit.status = prev_status
 
+        if returncode:
+            logger.error("Hashing ID databases failed with error code %s", returncode)
+            event.fail(f"Hashing ID databases failed with error code {returncode}")
+            return
+
+        self._publish_hash_id_databases_generation()
+        self._hash_id_databases_status(event)
+
+    def _hash_id_databases_status(self, event: ActionEvent) -> None:
+        status = read_hash_id_databases_status()
+
+        if hash_id_databases_running():
+            status["state"] = "running"
+
+        event.set_results({key: str(value) for key, value in status.items()})
+
+    def _record_hook_stats(self, _: PreCommitEvent) -> None:
+        """
+        Keep the timing of this hook, before the framework saves the stored
+        state.
+        """
+        records = append_record(
+            json.loads(self._stored.hook_stats),
+            self._profiler.record(),
+            HOOK_STATS_SIZE,
+        )
+        self._stored.hook_stats = json.dumps(records)
+
+    def _export_metrics(self, _: PreCommitEvent) -> None:
+        """
+        Add this hook and the commands it ran to the charm's metrics, note when
+        the unit first became active and when each relation became ready, and
+        write out the metrics for the charm metrics service.
+        """
+        now = time.time()
+
+        counters = update_counters(
+            json.loads(self._stored.charm_metrics),
+            self._profiler.record(),
+            command_stats,
+        )
+        self._stored.charm_metrics = json.dumps(counters)
+
+        if not self._stored.first_active_at and isinstance(
+            self.unit.status, ActiveStatus
+        ):
+            self._stored.first_active_at = now
+
+        for name, ready in self._stored.ready.items():
+            if not ready:
+                self._stored.ready_since.pop(name, None)
+            elif name not in self._stored.ready_since:
+                self._stored.ready_since[name] = now
+
+        write_metrics(
+            render_charm_metrics(
+                counters,
+                self._stored.installed_at,
+                self._stored.first_active_at,
+                dict(self._stored.ready),
+                dict(self._stored.ready_since),
+            )
+        )
+
+    def _hook_stats(self, event: ActionEvent) -> None:
+        """
+        Report the p50, p95 and maximum duration of the recently run hooks and
+        of the steps they ran, in seconds.
+        """
+        summary = summarise(json.loads(self._stored.hook_stats))
+
+        results = {}
+        for hook, stats in summary.items():
+            results[hook] = {"duration": format_durations(stats["duration"])}
+            if stats["steps"]:
+                results[hook]["steps"] = {
+                    name: format_durations(step)
+                    for name, step in stats["steps"].items()
+                }
+
+        event.set_results(results)
+
+    def _publish_hash_id_databases_generation(self) -> None:
+        """
+        Tell the other units when the leader has regenerated the hash-id
+        databases, so they can regenerate their own copy.
+
+        The generation is the time the last successful run finished, so runs
+        started in the background or by the schedule are published by the next
+        hook after they finish.
+        """
+        if not self.unit.is_leader():
+            return
+
+        generation = read_hash_id_databases_status().get("last-success")
+        if not generation or generation == self._stored.hash_id_databases_generation:
+            return
+
+        peer_relation = self.model.get_relation("replicas")
+        if peer_relation is None:
+            return
+
+        peer_relation.data[self.app].update(
+            {"hash-id-databases-generation": generation}
+        )
+        self._stored.hash_id_databases_generation = generation
+
+    def _start_hash_id_databases(self) -> None:
+        """
+        Start regenerating the hash-id databases in a process detached from the
+        hook, logging to `HASH_ID_DATABASES_LOG_FILE`.
+        """
+        with open(HASH_ID_DATABASES_LOG_FILE, "a") as log_fp:
+            subprocess.Popen(
+                ["python3", HASH_ID_DATABASES_RUNNER],
+                stdout=log_fp,
+                stderr=subprocess.STDOUT,
+                env=get_modified_env_vars(),
+                start_new_session=True,
+            )
+
+    def _sync_hash_id_databases(self, generation: str | None) -> None:
+        """
+        Regenerate this non-leader's hash-id databases if the leader published a
+        newer generation.
+
+        The hash-id databases are derived from the package database, which all
+        units share, so regenerating them locally replicates the leader's copy.
+        This takes hours, so it runs in the background and is followed by
+        `_check_hash_id_databases_sync` in later hooks.
+        """
+        if not self.charm_config.hash_id_databases_all_units:
+            return
+
+        if not generation or generation == self._stored.hash_id_databases_generation:
+            return
+
+        if generation != self._stored.hash_id_databases_pending:
+            # A run started for an older generation does not count.
+            self._stored.hash_id_databases_pending = generation
+            self._stored.hash_id_databases_sync_started = ""
+
+        self._check_hash_id_databases_sync()
+
+    def _check_hash_id_databases_sync(self) -> None:
+        """
+        Start regenerating the pending hash-id databases generation, unless a run
+        is in progress. Once a run started for it has succeeded, publish servers
+        for the hash-id-databases backends. If it failed, start another.
+        """
+        generation = self._stored.hash_id_databases_pending
+        if not generation or not self.charm_config.hash_id_databases_all_units:
+            return
+
+        if hash_id_databases_running():
+            return
+
+        started = self._stored.hash_id_databases_sync_started
+        if started:
+            status = read_hash_id_databases_status()
+            if status.get("started", "") < started:
+                logger.error(
+                    "Hashing ID databases (generation %s) did not start", generation
+                )
+            elif status.get("state") != "succeeded":
+                logger.error(
+                    "Hashing ID databases (generation %s) failed with error code %s. "
+                    "See %s",
+                    generation,
+                    status.get("returncode"),
+                    HASH_ID_DATABASES_LOG_FILE,
+                )
+            else:
+                logger.info("Regenerated hash-id databases (generation %s)", generation)
+                self._stored.hash_id_databases_generation = generation
+                self._stored.hash_id_databases_pending = ""
+                self._stored.hash_id_databases_sync_started = ""
+
+                for relation in self.model.relations.get("website", []):
+                    self._update_haproxy_connection(relation)
+                return
+
+        logger.info("Regenerating hash-id databases (generation %s)", generation)
+        started = datetime.now(timezone.utc).isoformat()
+        try:
+            self._start_hash_id_databases()
+        except OSError as e:
+            logger.error("Starting hash_id_databases failed: %s", e)
+            return
+
+        self._stored.hash_id_databases_sync_started = started
+
+    def _configure_hash_id_databases_schedule(self) -> None:
+        """
+        Install or remove the cron job that regenerates the hash-id databases on
+        the `hash_id_databases_schedule`.
+
+        Only the leader regenerates them on the schedule. With
+        `hash_id_databases_all_units`, the others follow each generation it
+        publishes, so they would otherwise regenerate twice per period.
+        """
+        schedule = self.charm_config.hash_id_databases_schedule
+
+        if not schedule or not self.unit.is_leader():
+            if os.path.exists(HASH_ID_DATABASES_CRON):
+                os.remove(HASH_ID_DATABASES_CRON)
+            return
+
+        with open(HASH_ID_DATABASES_CRON, "w") as cron_fp:
+            cron_fp.write(
+                f"""# The following was added by the landscape-server charm
+# Modifying it will be overwritten on the next configuration change
+{schedule} root python3 {HASH_ID_DATABASES_RUNNER} >> {HASH_ID_DATABASES_LOG_FILE} 2>&1
+"""
+            )
+
+    def _db_maintenance(self, event: ActionEvent) -> None:
+        stores = get_store_connections()
+        if not stores:
+            event.fail("The database has not been configured yet")
+            return
+
+        if event.params.get("stores"):
+            requested = {s.strip() for s in event.params["stores"].split(",")}
+            if unknown := requested - stores.keys():
+                event.fail(f"Unknown stores: {', '.join(sorted(unknown))}")
+                return
+            stores = {s: db for s, db in stores.items() if s in requested}
+
+        tables = []
+        for store, db in stores.items():
+            try:
+                tables.extend((store, table) for table in get_table_bloat(db))
+            except (CalledProcessError, TimeoutExpired) as e:
+                event.fail(f"Reading the tables of {store} failed: {e}")
+                return
+
+        event.log(f"Maintaining {len(tables)} tables in {len(stores)} databases...")
+
+        reports = defaultdict(list)
+        failed = 0
+        with ThreadPoolExecutor(max_workers=event.params["concurrency"]) as executor:
+            futures = {
+                executor.submit(
+                    maintain_table,
+                    stores[store],
+                    table,
+                    event.params["reindex"],
+                    event.params["timeout"],
+                ): store
+                for store, table in tables
+            }
+            for future in as_completed(futures):
+                table = future.result()
+                event.log(f"{futures[future]} {table}")
+                reports[futures[future]].append(str(table))
+                failed += bool(table.error)
+
+        event.set_results(
+            {store: "\n".join(sorted(report)) for store, report in reports.items()}
+        )
+        if failed:
+            event.fail(f"Maintenance failed on {failed} tables")
+
+    def _slow_queries(self, event: ActionEvent) -> None:
+        stores = get_store_connections()
+        if not stores:
+            event.fail("The database has not been configured yet")
+            return
+
+        # The statistics are kept per server, so each server is queried once
+        # for all of the Landscape databases on it that share a store user. The
+        # stores reached with other users are queried with their own credentials.
+        logins = defaultdict(list)
+        for db in stores.values():
+            logins[(db.host, db.port, db.username, db.password)].append(db)
+
+        for db, *_ in logins.values():
+            if not enable_pg_stat_statements(db):
+                event.log(
+                    f"Could not create the pg_stat_statements extension on {db.host}"
+                )
+
+        limit = event.params["limit"]
+        results = {}
+        for order_by, result in zip(
+            SLOW_QUERIES_ORDER, ("by-total-time", "by-mean-time")
+        ):
+            queries = []
+            for dbs in logins.values():
+                try:
+                    queries.extend(
+                        get_slow_queries(
+                            dbs[0], [db.database for db in dbs], order_by, limit
+                        )
+                    )
+                except (CalledProcessError, TimeoutExpired) as e:
+                    event.fail(
+                        f"Reading pg_stat_statements on {dbs[0].host} failed, "
+                        f"is it in shared_preload_libraries? {e}"
+                    )
+                    return
+
+            key = "total_ms" if order_by == "total_exec_time" else "mean_ms"
+            queries.sort(key=lambda query: getattr(query, key), reverse=True)
+            results[result] = "\n".join(str(query) for query in queries[:limit])
+
+        if event.params["reset"]:
+            servers = {}
+            for db, *_ in logins.values():
+                servers.setdefault((db.host, db.port), db)
+
+            for db in servers.values():
+                try:
+                    reset_pg_stat_statements(db)
+                except (CalledProcessError, TimeoutExpired) as e:
+                    event.fail(f"Resetting pg_stat_statements on {db.host} failed: {e}")
+                    return
+
+        event.set_results(results)
+
     def _migrate_service_conf(self, event: ActionEvent) -> None:
         migrate_service_conf()
 
@@ -1653,13 +2780,15 @@ command[check_{service}]=/usr/local/lib/nagios/plugins/check_systemd.py {service
             self.unit.status = MaintenanceStatus(
                 "Installing `landscape-ubuntu-installer-attach`"
             )
-            apt.add_package(LANDSCAPE_UBUNTU_INSTALLER_ATTACH, update_cache=True)
+            with self._profiler.step("apt-install"):
+                apt.add_package(LANDSCAPE_UBUNTU_INSTALLER_ATTACH, update_cache=True)
             self._stored.enable_ubuntu_installer_attach = True
         elif currently_enabled and not enable:
             self.unit.status = MaintenanceStatus(
                 "Removing `landscape-ubuntu-installer-attach`"
             )
-            apt.remove_package(LANDSCAPE_UBUNTU_INSTALLER_ATTACH)
+            with self._profiler.step("apt-remove"):
+                apt.remove_package(LANDSCAPE_UBUNTU_INSTALLER_ATTACH)
             self._stored.enable_ubuntu_installer_attach = False
 
 
@@ -0,0 +1,210 @@
+# Copyright 2025 Canonical Ltd
+
+"""
+The charm's own operational metrics, in the Prometheus text format. They are
+accumulated in stored state, written to `METRICS_FILE` at the end of every hook
+and served on localhost by `METRICS_SERVICE` for the cos-agent to scrape.
+"""
+
+import os
+
+from charms.operator_libs_linux.v1.systemd import daemon_reload, service_enable
+
+from helpers import CommandStats
+
+METRICS_DIR = "/var/lib/landscape-charm-metrics"
+METRICS_FILE = os.path.join(METRICS_DIR, "metrics.txt")
+METRICS_PATH = "/metrics.txt"
+METRICS_PORT = 9470
+
+METRICS_SERVICE = "landscape-charm-metrics"
+METRICS_SERVICE_FILE = f"/etc/systemd/system/{METRICS_SERVICE}.service"
+METRICS_SERVICE_UNIT = f"""\
+# The following was added by the landscape-server charm
+# Modifying it will be overwritten on the next upgrade
+[Unit]
+Description=Landscape Server charm metrics
+After=network.target
+
+[Service]
+ExecStart=/usr/bin/python3 -m http.server {METRICS_PORT} --bind 127.0.0.1 \
+--directory {METRICS_DIR}
+User=nobody
+StandardError=null
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def install_metrics_service() -> None:
+    """Install and start the service that serves `METRICS_FILE`."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+    try:
+        with open(METRICS_SERVICE_FILE) as unit_fp:
+            current = unit_fp.read()
+    except FileNotFoundError:
+        current = None
+
+    if current != METRICS_SERVICE_UNIT:
+        with open(METRICS_SERVICE_FILE, "w") as unit_fp:
+            unit_fp.write(METRICS_SERVICE_UNIT)
+        daemon_reload()
+
+    service_enable("--now", METRICS_SERVICE)
+
+
+def update_counters(
+    counters: dict, record: dict, command_stats: dict[str, CommandStats]
+) -> dict:
+    """
+    Add a hook record from `HookProfiler.record` and the commands the hook ran
+    to the cumulative `counters`, which are kept as JSON between hooks.
+    """
+    hooks = counters.setdefault("hooks", {})
+    count, total = hooks.get(record["hook"], (0, 0.0))
+    hooks[record["hook"]] = (count + 1, total + record["duration"])
+
+    steps = counters.setdefault("steps", {})
+    for name, duration in record["steps"].items():
+        count, total = steps.get(name, (0, 0.0))
+        steps[name] = (count + 1, total + duration)
+
+    commands = counters.setdefault("commands", {})
+    for name, stats in command_stats.items():
+        command = commands.setdefault(
+            name, {"duration": 0.0, "timeouts": 0, "exit_codes": {}}
+        )
+        command["duration"] += stats.duration
+        command["timeouts"] += stats.timeouts
+        for code, runs in stats.exit_codes.items():
+            exit_codes = command["exit_codes"]
+            exit_codes[str(code)] = exit_codes.get(str(code), 0) + runs
+
+    return counters
+
+
+def _labels(**labels: str) -> str:
+    escaped = {
+        name: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for name, value in labels.items()
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+def render(
+    counters: dict,
+    installed: float,
+    first_active: float,
+    ready: dict[str, bool],
+    ready_since: dict[str, float],
+) -> str:
+    """Return the metrics in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name: str, kind: str, description: str, samples: list) -> None:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{labels} {value}")
+
+    metric(
+        "landscape_charm_hook_duration_seconds",
+        "summary",
+        "Time taken to run each charm hook.",
+        [
+            (suffix, _labels(hook=hook), value)
+            for hook, (count, total) in sorted(counters.get("hooks", {}).items())
+            for suffix, value in (("_count", count), ("_sum", round(total, 3)))
+        ],
+    )
+    metric(
+        "landscape_charm_step_duration_seconds",
+        "summary",
+        "Time taken by the major steps of the charm hooks, such as lsctl-restart "
+        "and schema-bootstrap.",
+        [
+            (suffix, _labels(step=step), value)
+            for step, (count, total) in sorted(counters.get("steps", {}).items())
+            for suffix, value in (("_count", count), ("_sum", round(total, 3)))
+        ],
+    )
+
+    commands = sorted(counters.get("commands", {}).items())
+    metric(
+        "landscape_charm_command_runs_total",
+        "counter",
+        "Commands run by the charm, by exit code.",
+        [
+            ("", _labels(command=name, exit_code=code), runs)
+            for name, command in commands
+            for code, runs in sorted(command["exit_codes"].items())
+        ],
+    )
+    metric(
+        "landscape_charm_command_timeouts_total",
+        "counter",
+        "Commands run by the charm that timed out.",
+        [
+            ("", _labels(command=name), command["timeouts"])
+            for name, command in commands
+        ],
+    )
+    metric(
+        "landscape_charm_command_duration_seconds_total",
+        "counter",
+        "Time spent running commands.",
+        [
+            ("", _labels(command=name), round(command["duration"], 3))
+            for name, command in commands
+        ],
+    )
+
+    if installed:
+        metric(
+            "landscape_charm_install_timestamp_seconds",
+            "gauge",
+            "When the charm was installed on the unit.",
+            [("", "", installed)],
+        )
+    if installed and first_active:
+        metric(
+            "landscape_charm_install_to_active_seconds",
+            "gauge",
+            "Time from installing the charm to the unit first being active.",
+            [("", "", round(first_active - installed, 3))],
+        )
+
+    metric(
+        "landscape_charm_relation_ready",
+        "gauge",
+        "Whether each relation the unit needs is ready.",
+        [
+            ("", _labels(relation=name), int(value))
+            for name, value in sorted(ready.items())
+        ],
+    )
+    metric(
+        "landscape_charm_relation_ready_timestamp_seconds",
+        "gauge",
+        "When each relation the unit needs last became ready.",
+        [
+            ("", _labels(relation=name), since)
+            for name, since in sorted(ready_since.items())
+        ],
+    )
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(metrics: str) -> None:
+    """Atomically replace `METRICS_FILE` with `metrics`."""
+    os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
+
+    tmp_file = METRICS_FILE + ".tmp"
+    with open(tmp_file, "w") as metrics_fp:
+        metrics_fp.write(metrics)
+    os.chmod(tmp_file, 0o644)
+    os.replace(tmp_file, METRICS_FILE)
@@ -3,10 +3,12 @@ Configuration for the Landscape charm.
 """
 
 from enum import Enum
+import ipaddress
 from pathlib import Path
+import re
 from typing import Any
 
-from pydantic import BaseModel, root_validator
+from pydantic import BaseModel, Field, root_validator, validator
 import yaml
 
 
@@ -20,6 +22,120 @@ class RedirectHTTPS(str, Enum):
     DEFAULT = "default"
 
 
+class PackageSearchMode(str, Enum):
+    """
+    Keywords to specify which units run the package-search service.
+    """
+
+    LEADER = "leader"
+    LOCAL = "local"
+
+
+class Role(str, Enum):
+    """
+    Groups of Landscape services that a unit can be dedicated to.
+    """
+
+    WEB = "web"
+    MESSAGE = "message"
+    BACKGROUND = "background"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+SERVICE_ROLES = {
+    "appserver": Role.WEB,
+    "pingserver": Role.MESSAGE,
+    "message-server": Role.MESSAGE,
+    "api": Role.WEB,
+    "package-upload": Role.WEB,
+    "package-search": Role.WEB,
+}
+"""
+The `Role` each Landscape service that is served through HAProxy or scraped for
+metrics belongs to.
+"""
+
+WORKER_SERVICES = ("appserver", "pingserver", "message-server", "api")
+"""
+The services that run `worker_counts` processes, on consecutive ports from their
+base port.
+"""
+
+METRIC_INSTRUMENTED_SERVICE_PORTS = [
+    ("appserver", 8080),
+    ("pingserver", 8070),
+    ("message-server", 8090),
+    ("api", 9080),
+    ("package-upload", 9100),
+    ("package-search", 9099),
+]
+"""
+Default ports for Landscape services in a self-hosted deployment.
+
+Currently this var is only used for metrics configuration, so it only includes the
+applicable services.
+
+TODO all service configuration should be configurable through Juju and passed to the
+Landscape server configuration file.
+"""
+
+
+class Store(str, Enum):
+    """
+    The Landscape databases, as named in the `[stores]` section of `service.conf`.
+    """
+
+    MAIN = "main"
+    ACCOUNT = "account-1"
+    RESOURCE = "resource-1"
+    PACKAGE = "package"
+    SESSION = "session"
+    KNOWLEDGE = "knowledge"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+_TIME = r"\d+(us|ms|s|min|h|d)?"
+_MEMORY = r"\d+(B|kB|MB|GB|TB)?"
+
+SESSION_SETTINGS = {
+    "statement_timeout": _TIME,
+    "lock_timeout": _TIME,
+    "idle_in_transaction_session_timeout": _TIME,
+    "work_mem": _MEMORY,
+    "tcp_keepalives_idle": _TIME,
+    "tcp_keepalives_interval": _TIME,
+    "tcp_keepalives_count": r"\d+",
+    "tcp_user_timeout": _TIME,
+}
+"""
+The PostgreSQL session settings that can be set for the stores with
+`db_session_settings`, and the pattern their values must match.
+"""
+
+_DURATION = r"(\d+y)?(\d+w)?(\d+d)?(\d+h)?(\d+m)?(\d+s)?(\d+ms)?"
+"""A Prometheus `<duration>`, such as `1h30m`."""
+
+_UNSUPPORTED_RE2 = re.compile(r"(?<!\\)(?:\\\\)*(\(\?(?:=|!|<=|<!|P=|>)|\\[1-9])")
+"""
+Lookarounds, backreferences and atomic groups, which Python accepts but the RE2
+syntax of Prometheus does not.
+"""
+
+SCRAPE_JOBS = (
+    *(service for service, _ in METRIC_INSTRUMENTED_SERVICE_PORTS),
+    "charm",
+    "haproxy",
+)
+"""
+The scrape jobs provided over the cos-agent relation, whose interval can be set
+with `prometheus_scrape_interval_overrides`.
+"""
+
+
 # NOTE: the charm currently uses Pydantic 1.10
 
 
@@ -31,6 +147,8 @@ class LandscapeCharmConfiguration(BaseModel):
     landscape_ppa: str
     landscape_ppa_key: str
     worker_counts: int
+    job_handler_workers: int = Field(ge=1)
+    async_frontend_workers: int = Field(ge=1)
     license_file: str | None = None
     openid_provider_url: str | None = None
     openid_logout_url: str | None = None
@@ -58,16 +176,221 @@ class LandscapeCharmConfiguration(BaseModel):
     db_port: str | None = None
     db_schema_user: str | None = None
     db_schema_password: str | None = None
+    db_store_hosts: dict[Store, dict[str, str]] = {}
+    db_session_settings: dict[Store, dict[str, str]] = {}
+    db_max_connections: int = Field(ge=0)
+    db_connections_per_process: int = Field(ge=1)
     deployment_mode: str
     additional_service_config: str | None = None
     secret_token: str | None = None
     cookie_encryption_key: str | None = None
     min_install: bool
     prometheus_scrape_interval: str
+    prometheus_scrape_interval_overrides: dict[str, str] = {}
+    prometheus_metric_keep: list[str] = []
+    prometheus_metric_drop: list[str] = []
+    tracing_sample_ratio: float = Field(ge=0.0, le=1.0)
     autoregistration: bool
     redirect_https: RedirectHTTPS
+    haproxy_stats_port: int = Field(ge=0, le=65535)
+    haproxy_stats_allowed_networks: list[str] = []
+    haproxy_request_timing_logs: bool
     enable_hostagent_messenger: bool
     enable_ubuntu_installer_attach: bool
+    roles: frozenset[Role]
+    package_search_mode: PackageSearchMode
+    hash_id_databases_all_units: bool
+    hash_id_databases_schedule: str | None = None
+    package_upload_shared_storage: bool
+
+    @validator("roles", pre=True)
+    def split_roles(cls, value):
+        """
+        Parse the comma-separated `roles` string into a set of `Role`s.
+        """
+        if isinstance(value, str):
+            value = [role.strip() for role in value.split(",") if role.strip()]
+
+        if not value:
+            raise ValueError("At least one role must be provided.")
+
+        return value
+
+    @validator("db_store_hosts", pre=True)
+    def split_store_hosts(cls, value):
+        """
+        Parse the comma-separated `store=[user[:password]@]host[:port]` entries of
+        `db_store_hosts` into a mapping of store to its `host`, `port`, `user` and
+        `password`.
+        """
+        if not isinstance(value, str):
+            return value or {}
+
+        store_hosts = {}
+        for entry in value.split(","):
+            if not entry.strip():
+                continue
+
+            store, _, location = entry.strip().partition("=")
+            credentials, _, address = location.strip().rpartition("@")
+            user, _, password = credentials.partition(":")
+            host, _, port = address.partition(":")
+
+            if not host:
+                raise ValueError(f"Invalid store host: {entry.strip()}")
+
+            store_hosts[store.strip()] = {
+                "host": host,
+                "port": port,
+                "user": user,
+                "password": password,
+            }
+
+        return store_hosts
+
+    @validator("db_session_settings", pre=True)
+    def split_session_settings(cls, value):
+        """
+        Parse the comma-separated `[store.]setting=value` entries of
+        `db_session_settings` into a mapping of store to its session settings.
+        Settings without a store apply to all of them, unless overridden.
+        """
+        if not isinstance(value, str):
+            return value or {}
+
+        defaults = {}
+        overrides = {}
+        for entry in value.split(","):
+            if not entry.strip():
+                continue
+
+            name, _, setting_value = entry.strip().partition("=")
+            store, _, setting = name.strip().rpartition(".")
+            setting_value = setting_value.strip()
+
+            pattern = SESSION_SETTINGS.get(setting)
+            if not pattern:
+                raise ValueError(f"Unsupported session setting: {setting}")
+            if not re.fullmatch(pattern, setting_value):
+                raise ValueError(f"Invalid value for {setting}: {setting_value}")
+
+            if store:
+                overrides.setdefault(Store(store), {})[setting] = setting_value
+            else:
+                defaults[setting] = setting_value
+
+        if not defaults and not overrides:
+            return {}
+
+        return {store: {**defaults, **overrides.get(store, {})} for store in Store}
+
+    @validator("haproxy_stats_allowed_networks", pre=True)
+    def split_networks(cls, value):
+        """
+        Parse the comma-separated `haproxy_stats_allowed_networks` into a list of
+        networks in CIDR notation.
+        """
+        if isinstance(value, str):
+            value = [network.strip() for network in value.split(",")]
+
+        return [
+            str(ipaddress.ip_network(network, strict=False))
+            for network in value or []
+            if network
+        ]
+
+    @validator("prometheus_scrape_interval")
+    def check_scrape_interval(cls, value):
+        """
+        `prometheus_scrape_interval` must be a Prometheus duration.
+        """
+        if not value or not re.fullmatch(_DURATION, value):
+            raise ValueError(f"Invalid scrape interval: {value}")
+
+        return value
+
+    @validator("prometheus_scrape_interval_overrides", pre=True)
+    def split_scrape_interval_overrides(cls, value):
+        """
+        Parse the comma-separated `job=interval` entries of
+        `prometheus_scrape_interval_overrides` into a mapping of scrape job to
+        its interval.
+        """
+        if not isinstance(value, str):
+            return value or {}
+
+        overrides = {}
+        for entry in value.split(","):
+            if not entry.strip():
+                continue
+
+            job, _, interval = entry.strip().partition("=")
+            job = job.strip()
+            interval = interval.strip()
+
+            if job not in SCRAPE_JOBS:
+                raise ValueError(f"Unknown scrape job: {job}")
+            if not interval or not re.fullmatch(_DURATION, interval):
+                raise ValueError(f"Invalid scrape interval for {job}: {interval}")
+
+            overrides[job] = interval
+
+        return overrides
+
+    @validator("prometheus_metric_keep", "prometheus_metric_drop", pre=True)
+    def split_metric_patterns(cls, value):
+        """
+        Parse the comma-separated metric name patterns of `prometheus_metric_keep`
+        and `prometheus_metric_drop`, which must be valid RE2 regular expressions.
+        """
+        if isinstance(value, str):
+            value = [pattern.strip() for pattern in value.split(",")]
+
+        patterns = [pattern for pattern in value or [] if pattern]
+        for pattern in patterns:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Invalid metric pattern {pattern}: {e}")
+
+            unsupported = _UNSUPPORTED_RE2.search(pattern)
+            if unsupported:
+                raise ValueError(
+                    f"Invalid metric pattern {pattern}: Prometheus does not support "
+                    f"{unsupported.group(1)}"
+                )
+
+        return patterns
+
+    @validator("hash_id_databases_schedule")
+    def cron_schedule(cls, value):
+        """
+        The schedule must be a cron schedule, i.e. five time fields or a
+        nickname such as `@daily`.
+        """
+        if not value:
+            return None
+
+        fields = value.split()
+        if not (len(fields) == 5 or (len(fields) == 1 and value.startswith("@"))):
+            raise ValueError(f"Invalid cron schedule: {value}")
+
+        return " ".join(fields)
+
+    @root_validator(skip_on_failure=True)
+    def haproxy_stats_restricted(cls, values):
+        """
+        The HAProxy statistics are only exposed to `haproxy_stats_allowed_networks`,
+        so at least one must be given to enable them.
+        """
+        if values.get("haproxy_stats_port") and not values.get(
+            "haproxy_stats_allowed_networks"
+        ):
+            raise ValueError(
+                "haproxy_stats_allowed_networks must be set to enable "
+                "haproxy_stats_port."
+            )
+        return values
 
     @root_validator(skip_on_failure=True)
     def openid_oidc_exclusive(cls, values):
@@ -1,9 +1,80 @@
-from dataclasses import dataclass
-from subprocess import CalledProcessError, check_call
+from dataclasses import dataclass, field
+from subprocess import CalledProcessError, TimeoutExpired
+import time
 
 from charms.data_platform_libs.v0.data_interfaces import DatabaseRequires
 
-from helpers import get_modified_env_vars, logger
+from helpers import get_modified_env_vars, logger, run_command
+
+PSQL_TIMEOUT = 30
+"""Seconds a `psql` session may take, including connecting."""
+
+MAINTENANCE_OPTIONS = "-c lock_timeout=5s"
+"""
+Give up on a table rather than queue behind, and block, the application's
+locks on it.
+"""
+
+MAINTENANCE_GRACE = 10
+"""
+Seconds `psql` is given past the maintenance `statement_timeout`, so that the
+server cancels the statement before the client is killed.
+"""
+
+INVALID_INDEXES_SQL = """\
+SELECT format('%I.%I', n.nspname, c.relname)
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE i.indrelid = {table}::regclass
+    AND NOT i.indisvalid
+    AND c.relname ~ '_ccnew[0-9]*$';
+"""
+"""The invalid indexes a failed `REINDEX CONCURRENTLY` of a table leaves."""
+
+TABLE_BLOAT_SQL = """\
+SELECT format('%I.%I', schemaname, relname),
+    pg_total_relation_size(relid),
+    n_live_tup,
+    n_dead_tup
+FROM pg_stat_user_tables
+ORDER BY n_dead_tup DESC;
+"""
+
+SLOW_QUERIES_SQL = """\
+SELECT d.datname,
+    s.calls,
+    round(s.total_exec_time::numeric, 1),
+    round(s.mean_exec_time::numeric, 1),
+    s.rows,
+    left(regexp_replace(s.query, '\\s+', ' ', 'g'), {query_length})
+FROM pg_stat_statements s
+JOIN pg_database d ON d.oid = s.dbid
+WHERE d.datname IN ({databases})
+ORDER BY s.{order_by} DESC
+LIMIT {limit};
+"""
+
+SLOW_QUERIES_ORDER = ("total_exec_time", "mean_exec_time")
+"""The `pg_stat_statements` columns the slow queries can be ranked by."""
+
+SLOW_QUERY_LENGTH = 200
+"""Characters of each statement included in the slow query report."""
+
+GRANT_ROLE_SQL = """\
+DO $grant$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_auth_members m
+        JOIN pg_roles r ON r.oid = m.roleid
+        JOIN pg_roles u ON u.oid = m.member
+        WHERE r.rolname = {role} AND u.rolname = {user}
+    ) THEN
+        EXECUTE format('GRANT %I TO %I', {role}, {user});
+    END IF;
+END
+$grant$;
+"""
 
 
 @dataclass
@@ -13,6 +84,61 @@ class DatabaseConnectionContext:
     username: str | None = None
     password: str | None = None
     version: str | None = None
+    read_only_endpoints: str | None = None
+    database: str | None = None
+
+
+@dataclass
+class TableMaintenance:
+    """
+    The bloat estimate and maintenance timings of a table in a Landscape database.
+    """
+
+    table: str
+    size: int
+    """Total size in bytes, including indexes and TOAST."""
+    dead_tuples_ratio: float
+    vacuum_seconds: float | None = None
+    reindex_seconds: float | None = None
+    error: str | None = None
+    invalid_indexes: list[str] = field(default_factory=list)
+    """Invalid indexes left by a failed reindex that could not be dropped."""
+
+    def __str__(self) -> str:
+        summary = (
+            f"{self.table}: size={self.size // 1024 ** 2}MiB "
+            f"dead={self.dead_tuples_ratio:.1%}"
+        )
+        if self.vacuum_seconds is not None:
+            summary += f" vacuum={self.vacuum_seconds}s"
+        if self.reindex_seconds is not None:
+            summary += f" reindex={self.reindex_seconds}s"
+        if self.error:
+            summary += f" error={self.error}"
+        if self.invalid_indexes:
+            summary += f" invalid_indexes={','.join(self.invalid_indexes)}"
+
+        return summary
+
+
+@dataclass
+class SlowQuery:
+    """
+    The execution statistics of a statement from `pg_stat_statements`.
+    """
+
+    database: str
+    calls: int
+    total_ms: float
+    mean_ms: float
+    rows: int
+    query: str
+
+    def __str__(self) -> str:
+        return (
+            f"{self.database}: calls={self.calls} total={self.total_ms}ms "
+            f"mean={self.mean_ms}ms rows={self.rows} {self.query}"
+        )
 
 
 @dataclass
@@ -67,11 +193,30 @@ def fetch_postgres_relation_data(
             username=data["username"],
             password=data["password"],
             version=data["version"],
+            read_only_endpoints=data.get("read-only-endpoints"),
         )
 
     return DatabaseConnectionContext()
 
 
+def select_read_only_endpoint(
+    read_only_endpoints: str | None, unit_number: int
+) -> str | None:
+    """
+    Pick one of the comma-separated `host:port` read-only endpoints for this unit,
+    so that the units spread their read-only queries across the standbys.
+    """
+    endpoints = sorted(
+        endpoint.strip()
+        for endpoint in (read_only_endpoints or "").split(",")
+        if endpoint.strip()
+    )
+    if not endpoints:
+        return None
+
+    return endpoints[unit_number % len(endpoints)]
+
+
 def get_postgres_owner_role_from_version(
     version: str,
 ) -> str:
@@ -92,18 +237,10 @@ def get_postgres_owner_role_from_version(
     return owner_role
 
 
-def execute_psql(
-    host: str,
-    port: str,
-    relation_user: str,
-    relation_password: str,
-    sql: str,
-    database: str = "postgres",
-) -> None:
-    """
-    :raises `CalledProcessError`: The command failed.
-    """
-    cmd = [
+def _psql_command(
+    host: str, port: str, relation_user: str, database: str, sql: str
+) -> list[str]:
+    return [
         "psql",
         "-h",
         host,
@@ -117,39 +254,150 @@ def execute_psql(
         sql,
     ]
 
+
+def _psql_env(
+    relation_password: str, timeout: float | None, options: str | None
+) -> dict[str, str]:
     env = get_modified_env_vars()
     env["PGPASSWORD"] = relation_password
 
-    try:
-        check_call(cmd, env=env)
-    except CalledProcessError as e:
-        logger.error(
-            "Running `psql` failed: (exit %s): %s",
-            e.returncode,
-            e,
-        )
-        raise e
+    if timeout is not None:
+        env["PGCONNECT_TIMEOUT"] = str(int(timeout))
+    if options:
+        env["PGOPTIONS"] = options
 
+    return env
 
-def grant_role(
+
+def execute_psql(
     host: str,
     port: str,
     relation_user: str,
     relation_password: str,
-    user: str,
+    sql: str,
+    database: str = "postgres",
+    timeout: float | None = PSQL_TIMEOUT,
+    options: str | None = None,
+) -> None:
+    """
+    `options` are passed to the server as `PGOPTIONS`, e.g. `-c lock_timeout=5s`.
+
+    :raises `CalledProcessError`: The command failed.
+    :raises `TimeoutExpired`: The command took longer than `timeout` seconds.
+    """
+    cmd = _psql_command(host, port, relation_user, database, sql)
+    env = _psql_env(relation_password, timeout, options)
+
+    run_command(cmd, env=env, timeout=timeout)
+
+
+def query_psql(
+    host: str,
+    port: str,
+    relation_user: str,
+    relation_password: str,
+    sql: str,
+    database: str = "postgres",
+    timeout: float | None = PSQL_TIMEOUT,
+) -> list[list[str]]:
+    """
+    Run a query and return its rows, each a list of column values.
+
+    :raises `CalledProcessError`: The command failed.
+    :raises `TimeoutExpired`: The command took longer than `timeout` seconds.
+    """
+    cmd = _psql_command(host, port, relation_user, database, sql)
+    cmd.extend(["--no-align", "--tuples-only", "--field-separator", "\t"])
+    env = _psql_env(relation_password, timeout, None)
+
+    output = run_command(
+        cmd, env=env, timeout=timeout, capture_output=True, text=True
+    ).stdout
+
+    return [line.split("\t") for line in output.splitlines() if line]
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _quote_identifier(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def set_role_settings(
+    db: DatabaseConnectionContext,
     role: str,
+    settings: dict[str, str],
+    reset: list[str],
+    timeout: float = PSQL_TIMEOUT,
+) -> None:
+    """
+    Set the session `settings` of `role` when it connects to the `db` database,
+    and reset the `reset` settings that are not in `settings`, in a single
+    transaction.
+
+    The setting names must already be validated, only the values are quoted.
+
+    :raises `CalledProcessError`: Setting them failed. None were set.
+    :raises `TimeoutExpired`: Setting them took longer than `timeout`.
+    """
+    target = (
+        f"ROLE {_quote_identifier(role)} IN DATABASE {_quote_identifier(db.database)}"
+    )
+    statements = ["BEGIN;"]
+    statements.extend(
+        f"ALTER {target} SET {setting} = {_quote_literal(value)};"
+        for setting, value in sorted(settings.items())
+    )
+    statements.extend(
+        f"ALTER {target} RESET {setting};"
+        for setting in sorted(reset)
+        if setting not in settings
+    )
+    statements.append("COMMIT;")
+
+    execute_psql(
+        host=db.host,
+        port=db.port,
+        relation_user=db.username,
+        relation_password=db.password,
+        sql="\n".join(statements),
+        database=db.database,
+        timeout=timeout,
+    )
+
+
+def grant_roles(
+    host: str,
+    port: str,
+    relation_user: str,
+    relation_password: str,
+    grants: list[tuple[str, str]],
+    timeout: float = PSQL_TIMEOUT,
 ) -> None:
     """
     Because Charmed Postgres 16 now forces us to use one of the existing
-    roles, we have to grant it to the `landscape` (application) Postgres
-    user.
+    roles, we have to grant them to the Landscape Postgres users.
 
-    NOTE: We cannot manually add it to the `pg_hba.conf` because it's generated
+    NOTE: We cannot manually add them to the `pg_hba.conf` because it's generated
     by Patroni.
 
-    :raises `CalledProcessError`: Granting the role failed.
+    Each `(role, user)` in `grants` is granted in a single `psql` session and
+    transaction. Grants that already exist in `pg_auth_members` are skipped.
+
+    :raises `CalledProcessError`: Granting the roles failed. None were granted.
+    :raises `TimeoutExpired`: Granting the roles took longer than `timeout`.
     """
-    sql = f"GRANT {role} TO {user};"
+    statements = [
+        "BEGIN;",
+        f"SET LOCAL statement_timeout = '{int(timeout)}s';",
+    ]
+    statements.extend(
+        GRANT_ROLE_SQL.format(role=_quote_literal(role), user=_quote_literal(user))
+        for role, user in grants
+    )
+    statements.append("COMMIT;")
 
     try:
         execute_psql(
@@ -157,15 +405,220 @@ def grant_role(
             port=port,
             relation_user=relation_user,
             relation_password=relation_password,
-            sql=sql,
+            sql="\n".join(statements),
+            timeout=timeout,
         )
 
-    except CalledProcessError as e:
+    except (CalledProcessError, TimeoutExpired) as e:
         logger.error(
-            "Failed to grant %s to %s (exit %s): %s",
-            role,
-            user,
-            e.returncode,
+            "Failed to grant %s: %s",
+            ", ".join(f"{role} to {user}" for role, user in grants),
             e,
         )
         raise e
+
+
+def get_table_bloat(db: DatabaseConnectionContext) -> list[TableMaintenance]:
+    """
+    Estimate the bloat of each table in the `db` database by its ratio of dead
+    tuples, most dead tuples first.
+
+    :raises `CalledProcessError`: Reading the table statistics failed.
+    """
+    rows = query_psql(
+        host=db.host,
+        port=db.port,
+        relation_user=db.username,
+        relation_password=db.password,
+        sql=TABLE_BLOAT_SQL,
+        database=db.database,
+        timeout=PSQL_TIMEOUT,
+    )
+
+    tables = []
+    for table, size, live, dead in rows:
+        total = int(live) + int(dead)
+        tables.append(
+            TableMaintenance(
+                table=table,
+                size=int(size),
+                dead_tuples_ratio=int(dead) / total if total else 0.0,
+            )
+        )
+
+    return tables
+
+
+def _maintenance_options(timeout: float) -> str:
+    return f"{MAINTENANCE_OPTIONS} -c statement_timeout={int(timeout)}s"
+
+
+def maintain_table(
+    db: DatabaseConnectionContext,
+    table: TableMaintenance,
+    reindex: bool,
+    timeout: float,
+) -> TableMaintenance:
+    """
+    Run `VACUUM (ANALYZE)` and, if `reindex`, `REINDEX CONCURRENTLY` on `table`.
+    Neither blocks reads or writes, so the Landscape services can keep running.
+    The server cancels a statement that takes longer than `timeout` seconds.
+
+    Failures are recorded in `table.error` rather than raised, so that one table
+    does not stop the maintenance of the others.
+    """
+    statements = [("vacuum_seconds", f"VACUUM (ANALYZE) {table.table};")]
+    if reindex:
+        statements.append(
+            ("reindex_seconds", f"REINDEX TABLE CONCURRENTLY {table.table};")
+        )
+
+    for timing, sql in statements:
+        start = time.monotonic()
+        try:
+            execute_psql(
+                host=db.host,
+                port=db.port,
+                relation_user=db.username,
+                relation_password=db.password,
+                sql=sql,
+                database=db.database,
+                timeout=timeout + MAINTENANCE_GRACE,
+                options=_maintenance_options(timeout),
+            )
+        except (CalledProcessError, TimeoutExpired) as e:
+            table.error = str(e)
+            if timing == "reindex_seconds":
+                _drop_invalid_indexes(db, table, timeout)
+            break
+
+        setattr(table, timing, round(time.monotonic() - start, 2))
+
+    return table
+
+
+def _drop_invalid_indexes(
+    db: DatabaseConnectionContext, table: TableMaintenance, timeout: float
+) -> None:
+    """
+    Drop the invalid `_ccnew` indexes that a failed or cancelled `REINDEX
+    CONCURRENTLY` of `table` left behind, which would otherwise slow down its
+    writes. Those that cannot be dropped are kept in `table.invalid_indexes`.
+    """
+    try:
+        rows = query_psql(
+            host=db.host,
+            port=db.port,
+            relation_user=db.username,
+            relation_password=db.password,
+            sql=INVALID_INDEXES_SQL.format(table=_quote_literal(table.table)),
+            database=db.database,
+            timeout=PSQL_TIMEOUT,
+        )
+    except (CalledProcessError, TimeoutExpired) as e:
+        table.error += f"; checking for invalid indexes failed: {e}"
+        return
+
+    for (index,) in rows:
+        try:
+            execute_psql(
+                host=db.host,
+                port=db.port,
+                relation_user=db.username,
+                relation_password=db.password,
+                sql=f"DROP INDEX CONCURRENTLY IF EXISTS {index};",
+                database=db.database,
+                timeout=timeout + MAINTENANCE_GRACE,
+                options=_maintenance_options(timeout),
+            )
+        except (CalledProcessError, TimeoutExpired):
+            logger.error("Dropping the invalid index %s failed", index)
+            table.invalid_indexes.append(index)
+        else:
+            logger.info("Dropped the invalid index %s", index)
+
+
+def enable_pg_stat_statements(db: DatabaseConnectionContext) -> bool:
+    """
+    Create the `pg_stat_statements` extension in the `db` database if it does not
+    exist. The server must also load it through `shared_preload_libraries`.
+
+    :return: Whether the extension could be created.
+    """
+    try:
+        execute_psql(
+            host=db.host,
+            port=db.port,
+            relation_user=db.username,
+            relation_password=db.password,
+            sql="CREATE EXTENSION IF NOT EXISTS pg_stat_statements;",
+            database=db.database,
+            timeout=PSQL_TIMEOUT,
+        )
+    except (CalledProcessError, TimeoutExpired):
+        return False
+
+    return True
+
+
+def get_slow_queries(
+    db: DatabaseConnectionContext,
+    databases: list[str],
+    order_by: str,
+    limit: int,
+) -> list[SlowQuery]:
+    """
+    Get the `limit` statements run on `databases` with the highest `order_by`,
+    one of `SLOW_QUERIES_ORDER`. The statistics are shared by every database of
+    the server `db` connects to.
+
+    :raises `CalledProcessError`: Reading `pg_stat_statements` failed.
+    :raises `TimeoutExpired`: Reading `pg_stat_statements` took too long.
+    """
+    if order_by not in SLOW_QUERIES_ORDER:
+        raise ValueError(f"Cannot order slow queries by {order_by}")
+
+    rows = query_psql(
+        host=db.host,
+        port=db.port,
+        relation_user=db.username,
+        relation_password=db.password,
+        sql=SLOW_QUERIES_SQL.format(
+            query_length=SLOW_QUERY_LENGTH,
+            databases=", ".join(_quote_literal(d) for d in databases),
+            order_by=order_by,
+            limit=int(limit),
+        ),
+        database=db.database,
+        timeout=PSQL_TIMEOUT,
+    )
+
+    return [
+        SlowQuery(
+            database=database,
+            calls=int(calls),
+            total_ms=float(total_ms),
+            mean_ms=float(mean_ms),
+            rows=int(rows_),
+            query=query,
+        )
+        for database, calls, total_ms, mean_ms, rows_, query in rows
+    ]
+
+
+def reset_pg_stat_statements(db: DatabaseConnectionContext) -> None:
+    """
+    Discard the statistics of every statement on the server `db` connects to.
+
+    :raises `CalledProcessError`: Resetting the statistics failed.
+    :raises `TimeoutExpired`: Resetting the statistics took too long.
+    """
+    execute_psql(
+        host=db.host,
+        port=db.port,
+        relation_user=db.username,
+        relation_password=db.password,
+        sql="SELECT pg_stat_statements_reset();",
+        database=db.database,
+        timeout=PSQL_TIMEOUT,
+    )
@@ -8,7 +8,7 @@ from enum import Enum
 import os
 from typing import Iterable, Mapping
 
-from config import RedirectHTTPS
+from config import RedirectHTTPS, Role, SERVICE_ROLES, WORKER_SERVICES
 
 
 class ACL(str, Enum):
@@ -70,6 +70,22 @@ class Service:
 DEFAULT_REDIRECT_SCHEME = "redirect scheme https unless ping OR repository"
 
 
+REQUEST_ID_HEADER = "X-Request-ID"
+
+REQUEST_TIMING_OPTIONS = [
+    "unique-id-format %{+X}o\\ %ci:%cp_%fi:%fp_%Ts_%rt:%pid",
+    f"unique-id-header {REQUEST_ID_HEADER}",
+    # Tq: receiving the request, Tw: waiting in the queues, Tc: connecting to the
+    # server, Tr: waiting for the server's response, Tt: total.
+    'log-format "%ci:%cp [%tr] %ft %b/%s Tq=%Tq Tw=%Tw Tc=%Tc Tr=%Tr Tt=%Tt '
+    '%ST %B %tsc %ac/%fc/%bc/%sc/%rc %sq/%bq id=%ID %{+Q}r"',
+]
+"""
+Service options that tag each request with an ID, passed to the servers in the
+`REQUEST_ID_HEADER`, and log it with the time spent in each step of the request.
+"""
+
+
 HTTP_SERVICE = Service(
     service_name="landscape-http",
     service_host="0.0.0.0",
@@ -152,6 +168,26 @@ GRPC_SERVICE = Service(
 )
 
 
+DEFAULT_STATS_ACL = "acl stats_client always_false"
+
+
+STATS_SERVICE = Service(
+    service_name="landscape-haproxy-stats",
+    service_host="0.0.0.0",
+    service_port=8404,
+    service_options=[
+        "mode http",
+        # A default that denies all clients, replaced by the allowed networks.
+        DEFAULT_STATS_ACL,
+        "http-request deny unless stats_client",
+        "http-request use-service prometheus-exporter if { path /metrics }",
+        "stats enable",
+        "stats uri /stats",
+        "stats refresh 10s",
+    ],
+)
+
+
 UBUNTU_INSTALLER_ATTACH_SERVICE = Service(
     service_name="landscape-ubuntu-installer-attach",
     service_host="0.0.0.0",
@@ -246,6 +282,10 @@ def create_http_service(
     service_ports: "HAProxyServicePorts",
     server_options: "HAProxyServerOptions",
     redirect_https: RedirectHTTPS | None = None,
+    roles: Iterable[Role] = tuple(Role),
+    serve_package_upload: bool | None = None,
+    serve_hashid_databases: bool | None = None,
+    request_timing_logs: bool = False,
 ) -> dict:
     """
     Create the Landscape HTTP `services` configurations for HAProxy.
@@ -254,29 +294,36 @@ def create_http_service(
     hashid-databases backends. However, when the leader is lost, haproxy will fail as
     the service options will reference a (no longer) existing backend. To prevent that,
     all units should declare all backends, even if a unit should not have any servers on
-    a specific backend.
-    """
-    (appservers, pingservers, message_servers, api_servers) = [
-        [
-            (
-                f"landscape-{name}-{unit_name}-{i}",
-                server_ip,
-                service_ports[name] + i,
-                server_options,
-            )
-            for i in range(worker_counts)
-        ]
-        for name in ("appserver", "pingserver", "message-server", "api")
-    ]
+    a specific backend. The same applies to backends for services outside of this
+    unit's `roles`.
 
-    package_upload_servers = [
-        (
-            f"landscape-package-upload-{unit_name}-0",
-            server_ip,
-            service_ports["package-upload"],
-            server_options,
-        )
-    ]
+    `serve_package_upload` and `serve_hashid_databases` default to `is_leader`. Set
+    them to let non-leaders serve package uploads from shared storage or replicated
+    hash-id databases.
+
+    If `request_timing_logs`, requests are tagged with an ID and logged with their
+    timings, see `REQUEST_TIMING_OPTIONS`.
+    """
+    if serve_package_upload is None:
+        serve_package_upload = is_leader
+    if serve_hashid_databases is None:
+        serve_hashid_databases = is_leader
+
+    (
+        appservers,
+        pingservers,
+        message_servers,
+        api_servers,
+        package_upload_servers,
+    ) = _get_servers(
+        server_ip=server_ip,
+        unit_name=unit_name,
+        worker_counts=worker_counts,
+        serve_package_upload=serve_package_upload,
+        service_ports=service_ports,
+        server_options=server_options,
+        roles=roles,
+    )
 
     http_service["servers"] = appservers
     http_service["backends"] = [
@@ -294,22 +341,78 @@ def create_http_service(
         },
         {
             "backend_name": "landscape-http-package-upload",
-            "servers": package_upload_servers if is_leader else [],
+            "servers": package_upload_servers,
         },
         {
             "backend_name": "landscape-http-hashid-databases",
-            "servers": appservers if is_leader else [],
+            "servers": appservers if serve_hashid_databases else [],
         },
     ]
 
     http_service["error_files"] = [asdict(ef) for ef in error_files]
 
+    if request_timing_logs:
+        http_service["service_options"].extend(REQUEST_TIMING_OPTIONS)
+
     if redirect_https:
         _configure_redirect_https(http_service, redirect_https)
 
     return http_service
 
 
+def _get_servers(
+    server_ip: str,
+    unit_name: str,
+    worker_counts: int,
+    serve_package_upload: bool,
+    service_ports: "HAProxyServicePorts",
+    server_options: "HAProxyServerOptions",
+    roles: Iterable[Role],
+) -> tuple[list, list, list, list, list]:
+    """
+    Return the appserver, pingserver, message-server, API, and package-upload
+    servers of this unit.
+
+    Services that do not belong to one of the unit's `roles` have no servers.
+    """
+    roles = set(roles)
+    (appservers, pingservers, message_servers, api_servers) = [
+        (
+            [
+                (
+                    f"landscape-{name}-{unit_name}-{i}",
+                    server_ip,
+                    service_ports[name] + i,
+                    server_options,
+                )
+                for i in range(worker_counts)
+            ]
+            if SERVICE_ROLES[name] in roles
+            else []
+        )
+        for name in WORKER_SERVICES
+    ]
+
+    package_upload_servers = []
+    if serve_package_upload and Role.WEB in roles:
+        package_upload_servers.append(
+            (
+                f"landscape-package-upload-{unit_name}-0",
+                server_ip,
+                service_ports["package-upload"],
+                server_options,
+            )
+        )
+
+    return (
+        appservers,
+        pingservers,
+        message_servers,
+        api_servers,
+        package_upload_servers,
+    )
+
+
 def _configure_redirect_https(
     http_service: dict,
     redirect_https: RedirectHTTPS,
@@ -351,6 +454,10 @@ def create_https_service(
     error_files: Iterable["HAProxyErrorFile"],
     service_ports: "HAProxyServicePorts",
     server_options: "HAProxyServerOptions",
+    roles: Iterable[Role] = tuple(Role),
+    serve_package_upload: bool | None = None,
+    serve_hashid_databases: bool | None = None,
+    request_timing_logs: bool = False,
 ) -> dict:
     """
     Create the Landscape HTTPS `services` configurations for HAProxy.
@@ -359,29 +466,36 @@ def create_https_service(
     hashid-databases backends. However, when the leader is lost, haproxy will fail as
     the service options will reference a (no longer) existing backend. To prevent that,
     all units should declare all backends, even if a unit should not have any servers on
-    a specific backend.
-    """
-    (appservers, pingservers, message_servers, api_servers) = [
-        [
-            (
-                f"landscape-{name}-{unit_name}-{i}",
-                server_ip,
-                service_ports[name] + i,
-                server_options,
-            )
-            for i in range(worker_counts)
-        ]
-        for name in ("appserver", "pingserver", "message-server", "api")
-    ]
+    a specific backend. The same applies to backends for services outside of this
+    unit's `roles`.
 
-    package_upload_servers = [
-        (
-            f"landscape-package-upload-{unit_name}-0",
-            server_ip,
-            service_ports["package-upload"],
-            server_options,
-        )
-    ]
+    `serve_package_upload` and `serve_hashid_databases` default to `is_leader`. Set
+    them to let non-leaders serve package uploads from shared storage or replicated
+    hash-id databases.
+
+    If `request_timing_logs`, requests are tagged with an ID and logged with their
+    timings, see `REQUEST_TIMING_OPTIONS`.
+    """
+    if serve_package_upload is None:
+        serve_package_upload = is_leader
+    if serve_hashid_databases is None:
+        serve_hashid_databases = is_leader
+
+    (
+        appservers,
+        pingservers,
+        message_servers,
+        api_servers,
+        package_upload_servers,
+    ) = _get_servers(
+        server_ip=server_ip,
+        unit_name=unit_name,
+        worker_counts=worker_counts,
+        serve_package_upload=serve_package_upload,
+        service_ports=service_ports,
+        server_options=server_options,
+        roles=roles,
+    )
 
     https_service["servers"] = appservers
     https_service["backends"] = [
@@ -399,16 +513,20 @@ def create_https_service(
         },
         {
             "backend_name": "landscape-https-package-upload",
-            "servers": package_upload_servers if is_leader else [],
+            "servers": package_upload_servers,
         },
         {
             "backend_name": "landscape-https-hashid-databases",
-            "servers": appservers if is_leader else [],
+            "servers": appservers if serve_hashid_databases else [],
         },
     ]
 
     https_service["error_files"] = [asdict(ef) for ef in error_files]
     https_service["crts"] = [ssl_cert]
+
+    if request_timing_logs:
+        https_service["service_options"].extend(REQUEST_TIMING_OPTIONS)
+
     return https_service
 
 
@@ -468,6 +586,27 @@ def create_ubuntu_installer_attach_service(
     return ubuntu_installer_attach_service
 
 
+def create_stats_service(
+    stats_service: dict,
+    port: int,
+    allowed_networks: Iterable[str],
+) -> dict:
+    """
+    Create the HAProxy statistics and Prometheus exporter `services` configuration,
+    only accessible from `allowed_networks`.
+
+    The frontend answers every request itself, so it has no servers.
+    """
+    index = stats_service["service_options"].index(DEFAULT_STATS_ACL)
+    stats_service["service_options"][
+        index
+    ] = f"acl stats_client src {' '.join(allowed_networks)}"
+    stats_service["service_port"] = port
+    stats_service["servers"] = []
+
+    return stats_service
+
+
 def get_haproxy_error_files(error_files_config: dict) -> list[HAProxyErrorFile]:
     error_files_location = error_files_config["location"]
     error_files = []
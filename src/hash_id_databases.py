@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+This script regenerates the hash-id databases at low CPU and IO priority and
+records the status, duration and time of each run. It is used by the
+`hash-id-databases` action and by the schedule configured with
+`hash_id_databases_schedule`. Only one run can be in progress at a time.
+"""
+
+from datetime import datetime, timezone
+import fcntl
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+HASH_ID_DATABASES = "/opt/canonical/landscape/hash-id-databases-ignore-maintenance"
+STATUS_FILE = "/var/lib/landscape/hash-id-databases-status.json"
+LOCK_FILE = "/run/lock/landscape-hash-id-databases.lock"
+LOG_FILE = "/var/log/landscape/hash-id-databases.log"
+
+EX_TEMPFAIL = 75
+"""Exit code when a run is already in progress."""
+
+
+def _read_status_file() -> dict:
+    try:
+        with open(STATUS_FILE) as status_fp:
+            return json.load(status_fp)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def read_status() -> dict:
+    """
+    Return the status of the last run, or an empty dict if there was none. A run
+    that is still marked as running but no longer holds the lock was killed, and
+    is reported as failed.
+    """
+    status = _read_status_file()
+    if status.get("state") == "running" and not is_running():
+        status["state"] = "failed"
+    return status
+
+
+def write_status(status: dict) -> None:
+    """Atomically replace the status file with `status`."""
+    tmp_file = STATUS_FILE + ".tmp"
+    with open(tmp_file, "w") as status_fp:
+        json.dump(status, status_fp)
+    os.replace(tmp_file, STATUS_FILE)
+
+
+def is_running() -> bool:
+    """Return True if a run currently holds the lock."""
+    try:
+        with open(LOCK_FILE, "a") as lock_fp:
+            fcntl.flock(lock_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    return False
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def main() -> int:
+    """Regenerates the hash-id databases unless a run is already in progress."""
+    lock_fp = open(LOCK_FILE, "a")
+    try:
+        fcntl.flock(lock_fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print("Hashing ID databases is already in progress", file=sys.stderr)
+        return EX_TEMPFAIL
+
+    # Record the run as failed if it is stopped.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+
+    status = _read_status_file()
+    status.update({"state": "running", "started": _now()})
+    status.pop("finished", None)
+    write_status(status)
+
+    start = time.monotonic()
+    returncode = None
+    try:
+        process = subprocess.Popen(
+            [
+                "nice",
+                "-n",
+                "19",
+                "ionice",
+                "-c",
+                "3",
+                "sudo",
+                "-u",
+                "landscape",
+                HASH_ID_DATABASES,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+
+        for line in process.stdout:
+            print(line, end="", flush=True)
+
+        returncode = process.wait()
+    finally:
+        status.update(
+            {
+                "state": "succeeded" if returncode == 0 else "failed",
+                "finished": _now(),
+                "duration": round(time.monotonic() - start, 1),
+                "returncode": returncode,
+            }
+        )
+        if returncode == 0:
+            status["last-success"] = status["finished"]
+        write_status(status)
+
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
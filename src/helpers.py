@@ -1,12 +1,38 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
 import logging
 import os
 import subprocess
 import sys
+import threading
+import time
 
 logger = logging.getLogger("landscape-charm")
 
 MIGRATE_SERVICE_CONF_SCRIPT = "/opt/canonical/landscape/migrate-service-conf"
 
+DEFAULT_COMMAND_TIMEOUT = 600
+"""Seconds a command may run for, unless its caller sets its own timeout."""
+
+REDACTED = "REDACTED"
+
+
+@dataclass
+class CommandStats:
+    """The runs of one command in this hook."""
+
+    runs: int = 0
+    duration: float = 0.0
+    timeouts: int = 0
+    exit_codes: dict[int, int] = field(default_factory=dict)
+
+
+command_stats: dict[str, CommandStats] = defaultdict(CommandStats)
+"""The runs of each command in this hook, keyed by the command's name."""
+
+_command_stats_lock = threading.Lock()
+"""Guards `command_stats`, as commands are also run from worker threads."""
+
 
 def get_modified_env_vars():
     """
@@ -20,20 +46,125 @@ def get_modified_env_vars():
     return env_vars
 
 
+def get_args_with_secrets_removed(args, arg_names):
+    """
+    We log args passed in the command line. But we want to remove secrets.
+
+    Returns a copy of the args passed in with secrets associated with arg_names
+    redacted, whether given as `--name value` or `--name=value`.
+    """
+    args = list(args)
+    for arg_name in arg_names:
+        dash_arg_name = "--" + arg_name
+        for idx, arg in enumerate(args):
+            if arg == dash_arg_name and idx + 1 < len(args):
+                args[idx + 1] = REDACTED
+            elif arg.startswith(dash_arg_name + "="):
+                args[idx] = f"{dash_arg_name}={REDACTED}"
+    return args
+
+
+def _command_name(args) -> str:
+    """
+    The name of the command for logs and metrics: the script run by `python3`,
+    or the program itself.
+    """
+    name = os.path.basename(args[0])
+    if name.startswith("python") and len(args) > 1:
+        name = os.path.basename(args[1])
+    return name
+
+
+def _record_run(name: str, duration: float, returncode: int | None) -> None:
+    with _command_stats_lock:
+        stats = command_stats[name]
+        stats.runs += 1
+        stats.duration += duration
+        if returncode is None:
+            stats.timeouts += 1
+        else:
+            stats.exit_codes[returncode] = stats.exit_codes.get(returncode, 0) + 1
+
+
+def run_command(
+    args: list[str],
+    *,
+    timeout: float | None = DEFAULT_COMMAND_TIMEOUT,
+    retries: int = 0,
+    backoff: float = 5.0,
+    secret_args: tuple[str, ...] = (),
+    check: bool = True,
+    **kwargs,
+) -> subprocess.CompletedProcess:
+    """
+    Run `args`, keeping the duration and exit code of each run in
+    `command_stats`. The remaining `kwargs` are passed to `subprocess.run`.
+
+    With `check`, a failed command is run up to `retries` more times, waiting
+    `backoff` seconds before the first retry and doubling the wait each time.
+    The values of `secret_args` options are redacted from the logs.
+
+    :raises `CalledProcessError`: The command failed on every attempt, if
+        `check` is set.
+    :raises `TimeoutExpired`: The command took longer than `timeout` seconds.
+        It is killed and not retried.
+    """
+    name = _command_name(args)
+    logged_args = " ".join(get_args_with_secrets_removed(args, secret_args))
+
+    for attempt in range(retries + 1):
+        if attempt:
+            delay = backoff * 2 ** (attempt - 1)
+            logger.info("Retrying `%s` in %s seconds", logged_args, delay)
+            time.sleep(delay)
+
+        start = time.monotonic()
+        try:
+            result = subprocess.run(args, timeout=timeout, check=check, **kwargs)
+        except subprocess.TimeoutExpired:
+            _record_run(name, time.monotonic() - start, None)
+            logger.error(
+                "Running `%s` timed out after %s seconds", logged_args, timeout
+            )
+            raise
+        except subprocess.CalledProcessError as e:
+            duration = time.monotonic() - start
+            _record_run(name, duration, e.returncode)
+            logger.error(
+                "Running `%s` failed (exit %s) after %.1f seconds",
+                logged_args,
+                e.returncode,
+                duration,
+            )
+            if attempt == retries:
+                raise
+        else:
+            duration = time.monotonic() - start
+            _record_run(name, duration, result.returncode)
+            logger.debug(
+                "Ran `%s` (exit %s) in %.1f seconds",
+                logged_args,
+                result.returncode,
+                duration,
+            )
+            return result
+
+
 def migrate_service_conf() -> None:
     if os.path.isfile(MIGRATE_SERVICE_CONF_SCRIPT):
         try:
-            migrate_result = subprocess.run(
+            migrate_result = run_command(
                 [MIGRATE_SERVICE_CONF_SCRIPT],
                 capture_output=True,
                 text=True,
-                check=True,
                 env=get_modified_env_vars(),
             )
         except subprocess.CalledProcessError as e:
             logger.error(
                 "Migrating service.conf failed with return code %s", e.returncode
             )
-            logger.error("Failed to migrate service.conf: %s", migrate_result)
+            logger.error("Failed to migrate service.conf: %s", e.stdout)
+        except subprocess.TimeoutExpired:
+            logger.error("Migrating service.conf timed out")
         else:
             logger.info("Migrated service.conf: %s", migrate_result)
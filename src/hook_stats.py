@@ -0,0 +1,122 @@
+# Copyright 2025 Canonical Ltd
+
+"""
+Timing of the charm's hooks and of the major steps they run, kept in a bounded
+ring buffer per hook and summarised by the `hook-stats` action.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import math
+import os
+import time
+
+HOOK_STATS_SIZE = 50
+"""
+The number of runs of each hook to keep, so that frequent hooks such as
+update-status do not evict the rare ones.
+"""
+
+
+def get_hook_name() -> str:
+    """Return the name of the hook or action being dispatched."""
+    dispatch_path = os.environ.get("JUJU_DISPATCH_PATH", "")
+    name = dispatch_path.removeprefix("hooks/").replace("/", "-").replace("_", "-")
+    return name or "unknown"
+
+
+class HookProfiler:
+    """Measures the duration of a hook and of the named steps within it."""
+
+    def __init__(self, hook: str):
+        self.hook = hook
+        self.steps: dict[str, float] = {}
+        self._start = time.monotonic()
+
+    @contextmanager
+    def step(self, name: str):
+        """Time the body of the block, adding to any earlier run of `name`."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            self.steps[name] = self.steps.get(name, 0.0) + duration
+
+    def record(self) -> dict:
+        """Return the timing of the hook so far."""
+        return {
+            "hook": self.hook,
+            "time": datetime.now(timezone.utc).isoformat(),
+            "duration": round(time.monotonic() - self._start, 3),
+            "steps": {name: round(value, 3) for name, value in self.steps.items()},
+        }
+
+
+def append_record(records: list[dict], record: dict, size: int) -> list[dict]:
+    """
+    Return `records` with `record` appended, keeping only the last `size` runs
+    of its hook.
+    """
+    records = records + [record]
+    excess = sum(r["hook"] == record["hook"] for r in records) - size
+
+    kept = []
+    for r in records:
+        if excess > 0 and r["hook"] == record["hook"]:
+            excess -= 1
+            continue
+        kept.append(r)
+
+    return kept
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Return the nearest-rank `percent` percentile of `values`."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarise(records: list[dict]) -> dict[str, dict]:
+    """
+    Return the number of runs and the p50, p95 and maximum duration of each
+    hook and of each step it ran, keyed by hook and then by step.
+    """
+    durations: dict[str, list[float]] = {}
+    step_durations: dict[str, dict[str, list[float]]] = {}
+
+    for record in records:
+        hook = record["hook"]
+        durations.setdefault(hook, []).append(record["duration"])
+        steps = step_durations.setdefault(hook, {})
+        for name, duration in record["steps"].items():
+            steps.setdefault(name, []).append(duration)
+
+    return {
+        hook: {
+            "duration": _summarise_durations(values),
+            "steps": {
+                name: _summarise_durations(step_values)
+                for name, step_values in sorted(step_durations[hook].items())
+            },
+        }
+        for hook, values in sorted(durations.items())
+    }
+
+
+def _summarise_durations(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values),
+    }
+
+
+def format_durations(durations: dict) -> str:
+    """Format a summary from `summarise` for the `hook-stats` action."""
+    return (
+        f"p50={durations['p50']:.2f}s p95={durations['p95']:.2f}s "
+        f"max={durations['max']:.2f}s n={durations['count']}"
+    )
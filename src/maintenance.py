@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+This script runs the database-side setup steps of the charm in a single
+process, so the Landscape model and configuration are only loaded once. The
+steps to run are read as JSON from stdin and the outcome and duration of each
+step are written as JSON to the last line of stdout.
+
+It's in a seperate script to avoid polluting the charm source with landscape
+imports.
+"""
+
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import json
+import logging
+import runpy
+import sys
+import time
+
+from canonical.landscape.application import setup_logging
+from canonical.landscape.setup import load_config
+import transaction
+
+from autoregistration import set_autoregistration
+
+BOOTSTRAP_ACCOUNT_SCRIPT = "/opt/canonical/landscape/bootstrap-account"
+UPDATE_WSL_DISTRIBUTIONS_SCRIPT = "/opt/canonical/landscape/update-wsl-distributions"
+
+SCRIPT_OUTPUT_LENGTH = 2000
+"""Characters of the output of a failed script included in its error."""
+
+
+def _run_script(path: str, args: list[str]) -> None:
+    """
+    Runs a packaged Landscape script in this interpreter. Its output is kept
+    off our stdout, and is the error if it fails, so that the charm can log
+    why and recognise errors such as `DuplicateAccountError`.
+    """
+    argv = sys.argv
+    sys.argv = [path, *args]
+    output = io.StringIO()
+
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = output.getvalue().strip()[-SCRIPT_OUTPUT_LENGTH:]
+            raise RuntimeError(f"{path} exited with {e.code}: {error}")
+    finally:
+        sys.argv = argv
+
+
+def _bootstrap_account(params: dict) -> None:
+    _run_script(BOOTSTRAP_ACCOUNT_SCRIPT, params["args"])
+
+
+def _autoregistration(params: dict) -> None:
+    if not set_autoregistration(params["on"]):
+        raise RuntimeError("No account exists")
+
+
+def _update_wsl_distributions(params: dict) -> None:
+    _run_script(UPDATE_WSL_DISTRIBUTIONS_SCRIPT, [])
+
+
+STEPS = {
+    "bootstrap-account": _bootstrap_account,
+    "autoregistration": _autoregistration,
+    "update-wsl-distributions": _update_wsl_distributions,
+}
+"""The steps that can be run, in the order they are run."""
+
+
+def main() -> int:
+    """Runs the requested steps, each in its own transaction."""
+    requested = json.load(sys.stdin)
+
+    setup_logging("maintenance", level=logging.INFO)
+    load_config("maintenance")
+
+    results = {}
+    for name, step in STEPS.items():
+        if name not in requested:
+            continue
+
+        start = time.monotonic()
+        try:
+            with transaction.manager:
+                step(requested[name])
+        except Exception as e:
+            logging.exception("%s failed", name)
+            results[name] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        else:
+            results[name] = {"ok": True}
+
+        results[name]["duration"] = round(time.monotonic() - start, 2)
+
+    print(json.dumps(results), flush=True)
+
+    return 0 if all(result["ok"] for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
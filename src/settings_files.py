@@ -12,16 +12,25 @@ from configparser import ConfigParser
 import os
 import secrets
 from string import ascii_letters, digits
+import tarfile
+from typing import Iterable
 from urllib.error import URLError
 from urllib.request import urlopen
 
-from database import get_postgres_owner_role_from_version, PostgresRoles
+from config import Store
+from database import (
+    DatabaseConnectionContext,
+    get_postgres_owner_role_from_version,
+    PostgresRoles,
+)
 from helpers import migrate_service_conf
 
 CONFIGS_DIR = "/opt/canonical/landscape/configs"
 
 DEFAULT_SETTINGS = "/etc/default/landscape-server"
 
+HASH_ID_DATABASES_DIR = "/var/lib/landscape/hash-id-databases"
+
 LICENSE_FILE = "/etc/landscape/license.txt"
 LICENSE_FILE_PROTOCOLS = (
     "file://",
@@ -49,6 +58,10 @@ class SSLCertReadException(Exception):
     pass
 
 
+class HashIdDatabasesReadException(Exception):
+    pass
+
+
 class ServiceConfMissing(Exception):
     pass
 
@@ -124,12 +137,14 @@ def update_default_settings(updates: dict) -> None:
         settings_file.write("".join(new_lines))
 
 
-def update_service_conf(updates: dict) -> None:
+def update_service_conf(updates: dict, remove_sections: Iterable[str] = ()) -> None:
     """
     Updates the Landscape Server configuration file.
 
     `updates` is a mapping of {section => {key => value}}, to be applied
         to the config file.
+    `remove_sections` are removed from the config file before `updates` are
+        applied.
     """
     if not os.path.isfile(SERVICE_CONF):
         # Landscape server will not overwrite this file on install, so we
@@ -139,6 +154,9 @@ def update_service_conf(updates: dict) -> None:
     config = ConfigParser()
     config.read(SERVICE_CONF)
 
+    for section in remove_sections:
+        config.remove_section(section)
+
     for section, data in updates.items():
         for key, value in data.items():
             if not config.has_section(section):
@@ -202,17 +220,64 @@ def write_ssl_cert(ssl_cert: str) -> None:
         raise SSLCertReadException("Unable to decode b64-encoded SSL certificate")
 
 
+def write_hash_id_databases(archive: str, uid: int, gid: int) -> None:
+    """
+    Unpacks the pre-generated hash-id databases in the `archive` tarball to
+    HASH_ID_DATABASES_DIR and sets up their ownership for `uid` and `gid`.
+
+    raises HashIdDatabasesReadException if `archive` is not a tarball or
+    contains anything other than files and directories below its root.
+    """
+    try:
+        with tarfile.open(archive) as tar:
+            members = tar.getmembers()
+
+            for member in members:
+                if (
+                    not (member.isfile() or member.isdir())
+                    or os.path.isabs(member.name)
+                    or ".." in member.name.split("/")
+                ):
+                    raise HashIdDatabasesReadException(
+                        f"Refusing to unpack {member.name} from hash-id databases"
+                    )
+
+            if not any(member.isfile() for member in members):
+                raise HashIdDatabasesReadException("No hash-id databases in archive")
+
+            os.makedirs(HASH_ID_DATABASES_DIR, exist_ok=True)
+            tar.extractall(HASH_ID_DATABASES_DIR, members=members)
+    except tarfile.TarError:
+        raise HashIdDatabasesReadException("Unable to read hash-id databases archive")
+
+    os.chown(HASH_ID_DATABASES_DIR, uid, gid)
+    for root, dirs, files in os.walk(HASH_ID_DATABASES_DIR):
+        for name in dirs + files:
+            os.chown(os.path.join(root, name), uid, gid)
+
+
 def update_db_conf(
     host=None,
     password=None,
     schema_password=None,
     port=DEFAULT_POSTGRES_PORT,
     user=None,
-):
-    """Postgres specific settings override"""
+    read_only_host=None,
+) -> bool:
+    """
+    Postgres specific settings override
+
+    The read-only stores use `read_only_host` if given, or the primary otherwise.
+
+    :returns: Whether the `[stores]` section, which the Landscape services
+        connect with, changed.
+    """
     to_update = defaultdict(dict)
     if host:  # Note that host is required if port is changed
         to_update["stores"]["host"] = "{}:{}".format(host, port)
+        to_update["stores"]["read-only-host"] = to_update["stores"]["host"]
+    if read_only_host:
+        to_update["stores"]["read-only-host"] = read_only_host
     if password:
         to_update["stores"]["password"] = password
         to_update["schema"]["store_password"] = password
@@ -220,8 +285,157 @@ def update_db_conf(
         to_update["schema"]["store_password"] = schema_password
     if user:
         to_update["schema"]["store_user"] = user
-    if to_update:
-        update_service_conf(to_update)
+    if not to_update:
+        return False
+
+    config = ConfigParser()
+    config.read(SERVICE_CONF)
+    stores_changed = any(
+        config.get("stores", key, fallback=None) != value
+        for key, value in to_update.get("stores", {}).items()
+    )
+
+    update_service_conf(to_update)
+
+    return stores_changed
+
+
+def update_store_hosts(store_hosts: dict) -> bool:
+    """
+    Place the stores in `store_hosts` on their own PostgreSQL cluster, and the
+    others on the `[stores]` host.
+
+    `store_hosts` is a mapping of {store => {"host", "port", "user", "password"}}.
+    The user and password default to the `[stores]` ones if empty. The
+    `[stores]` read-only host is a standby of the main cluster, which does not
+    hold the moved stores, so they read from their own host.
+
+    :returns: Whether the stores changed.
+    """
+    config = ConfigParser()
+    config.read(SERVICE_CONF)
+
+    if not config.has_section("stores"):
+        config.add_section("stores")
+
+    stores = config["stores"]
+    previous = dict(stores)
+    for store in Store:
+        for key in ("host", "read-only-host", "user", "password"):
+            stores.pop(f"{store}-{key}", None)
+
+    for store, location in sorted(store_hosts.items()):
+        port = location.get("port") or DEFAULT_POSTGRES_PORT
+        stores[f"{store}-host"] = f"{location['host']}:{port}"
+        stores[f"{store}-read-only-host"] = stores[f"{store}-host"]
+        if location.get("user"):
+            stores[f"{store}-user"] = location["user"]
+        if location.get("password"):
+            stores[f"{store}-password"] = location["password"]
+
+    if dict(stores) == previous:
+        return False
+
+    with open(SERVICE_CONF, "w") as config_fp:
+        config.write(config_fp)
+
+    migrate_service_conf()
+
+    return True
+
+
+def update_tracing_conf(endpoint: str | None, sample_ratio: float) -> bool:
+    """
+    Write the OTLP `endpoint` the Landscape services export their traces to, and
+    the ratio of requests they trace, to the `[tracing]` section. Remove the
+    section if there is no `endpoint`.
+
+    :returns: Whether the tracing configuration changed.
+    """
+    config = ConfigParser()
+    config.read(SERVICE_CONF)
+
+    previous = dict(config["tracing"]) if config.has_section("tracing") else {}
+    tracing = {}
+    if endpoint:
+        tracing = {"otlp-endpoint": endpoint, "sample-ratio": str(sample_ratio)}
+
+    if tracing == previous:
+        return False
+
+    update_service_conf({"tracing": tracing} if tracing else {}, ("tracing",))
+
+    return True
+
+
+def get_db_host() -> str | None:
+    """
+    Gets the `host:port` of the main database written in `service.conf`.
+    """
+    config = ConfigParser()
+    config.read(SERVICE_CONF)
+
+    return config.get("stores", "host", fallback=None)
+
+
+def get_store_hosts() -> dict[str, str]:
+    """
+    Gets the `host:port` of the stores placed on their own cluster in
+    `service.conf`.
+    """
+    config = ConfigParser()
+    config.read(SERVICE_CONF)
+
+    return {
+        str(store): config["stores"][f"{store}-host"]
+        for store in Store
+        if config.has_option("stores", f"{store}-host")
+    }
+
+
+def get_store_connections() -> dict[str, DatabaseConnectionContext]:
+    """
+    Gets the connection details of each Landscape store written in
+    `service.conf`, using the schema user that owns them.
+    """
+    config = ConfigParser()
+    config.read(SERVICE_CONF)
+
+    if not config.has_option("stores", "host"):
+        return {}
+
+    stores = config["stores"]
+    user = config.get("schema", "store_user", fallback=stores.get("user"))
+    password = config.get("schema", "store_password", fallback=stores.get("password"))
+
+    connections = {}
+    for store in Store:
+        host, _, port = stores.get(f"{store}-host", stores["host"]).partition(":")
+        connections[str(store)] = DatabaseConnectionContext(
+            host=host,
+            port=port or DEFAULT_POSTGRES_PORT,
+            username=stores.get(f"{store}-user", user),
+            password=stores.get(f"{store}-password", password),
+            database=stores.get(str(store), f"landscape-standalone-{store}"),
+        )
+
+    return connections
+
+
+def get_store_users() -> dict[str, str]:
+    """
+    Gets the role the Landscape services connect to each store with, as written
+    in `service.conf`.
+    """
+    config = ConfigParser()
+    config.read(SERVICE_CONF)
+
+    user = config.get("stores", "user", fallback="landscape")
+
+    return {
+        str(store): config.get("stores", f"{store}-user", fallback=user)
+        for store in Store
+    }
 
 
 def get_postgres_roles(postgresql_version: str) -> PostgresRoles:
@@ -3,6 +3,7 @@ from unittest.mock import patch
 
 import pytest
 
+import charm_metrics
 import settings_files
 
 
@@ -48,3 +49,19 @@ def get_haproxy_error_files():
     with patch("charm.get_haproxy_error_files") as m:
         m.return_value = ()
         yield m
+
+
+@pytest.fixture(autouse=True)
+def charm_metrics_file(tmp_path, monkeypatch):
+    """
+    Redirect the charm metrics to a tempfile, and don't install the service that
+    serves them.
+
+    This is set to `autouse=True` because the metrics are written at the end of
+    every hook.
+    """
+    metrics_file = tmp_path / "charm-metrics" / "metrics.txt"
+    monkeypatch.setattr(charm_metrics, "METRICS_FILE", str(metrics_file))
+
+    with patch("charm.install_metrics_service"):
+        yield metrics_file
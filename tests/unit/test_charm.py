@@ -4,11 +4,14 @@
 # Learn more about testing at
 # https://documentation.ubuntu.com/ops/latest/explanation/testing/
 
+from dataclasses import replace
 from grp import struct_group
+import hashlib
 from io import BytesIO
 import json
 import os
 from pwd import struct_passwd
+import re
 from subprocess import CalledProcessError
 from tempfile import TemporaryDirectory
 import unittest
@@ -16,33 +19,50 @@ from unittest.mock import ANY, call, DEFAULT, Mock, patch
 
 from charms.operator_libs_linux.v0 import apt
 from charms.operator_libs_linux.v0.apt import PackageError, PackageNotFoundError
+from cosl import LZMABase64
 from ops.charm import ActionEvent
 from ops.model import ActiveStatus, BlockedStatus, WaitingStatus
 from ops.testing import (
+    ActionFailed,
     Context,
     Harness,
     MaintenanceStatus,
     PeerRelation,
     Relation,
+    Resource,
     State,
     StoredState,
+    SubordinateRelation,
 )
+import pytest
 
 from charm import (
+    APT_RETRIES,
     DEFAULT_SERVICES,
     get_modified_env_vars,
-    HASH_ID_DATABASES,
+    HASH_ID_DATABASES_CRON,
+    HASH_ID_DATABASES_RUNNER,
+    LANDSCAPE_PACKAGE_SEARCH,
+    LANDSCAPE_PACKAGE_UPLOAD,
     LANDSCAPE_PACKAGES,
     LANDSCAPE_UBUNTU_INSTALLER_ATTACH,
     LandscapeServerCharm,
     LEADER_SERVICES,
     LSCTL,
+    MAINTENANCE_SCRIPT,
+    MAINTENANCE_TIMEOUT,
     METRIC_INSTRUMENTED_SERVICE_PORTS,
     NRPE_D_DIR,
+    PROXY_SECRET_ARGS,
     SCHEMA_SCRIPT,
+    SCHEMA_TIMEOUT,
     UPDATE_WSL_DISTRIBUTIONS_SCRIPT,
 )
+from charm_metrics import METRICS_PATH, METRICS_PORT
+from config import SCRAPE_JOBS, SERVICE_ROLES, SESSION_SETTINGS, Store
+from database import SlowQuery, TableMaintenance
 from haproxy import GRPC_SERVICE, UBUNTU_INSTALLER_ATTACH_SERVICE
+from hook_stats import HOOK_STATS_SIZE
 from settings_files import AMQP_USERNAME, VHOSTS
 from tests.unit.helpers import get_haproxy_services
 
@@ -82,6 +102,119 @@ class TestGrafanaMachineAgentRelation(unittest.TestCase):
         self.assertIn("metrics_scrape_jobs", config)
         self.assertIn("metrics_alert_rules", config)
 
+    def test_dashboards(self):
+        """
+        Landscape provides its Grafana dashboards to the relation.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(relations=[relation])
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        dashboards = [
+            json.loads(LZMABase64.decompress(dashboard))
+            for dashboard in config["dashboards"]
+        ]
+        self.assertEqual(
+            ["Landscape Server Performance"],
+            [dashboard["title"] for dashboard in dashboards],
+        )
+
+    def test_performance_rules(self):
+        """
+        Landscape provides performance alert rules, and the recording rules they
+        are built on.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(relations=[relation])
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        rules = [
+            rule
+            for group in config["metrics_alert_rules"]["groups"]
+            for rule in group["rules"]
+        ]
+        alerts = {rule["alert"]: rule["expr"] for rule in rules if "alert" in rule}
+        records = {rule["record"] for rule in rules if "record" in rule}
+
+        for alert in (
+            "LandscapeServiceLatencyHigh",
+            "LandscapeWorkerSaturated",
+            "LandscapeBackendQueueing",
+            "LandscapeErrorBudgetFastBurn",
+        ):
+            self.assertIn(alert, alerts)
+
+        for expr in alerts.values():
+            for series in re.findall(r"[a-z_]+:[a-z_0-9]+:[a-z_0-9]+", expr):
+                self.assertIn(series, records)
+
+    def test_package_search_rules_need_web_role(self):
+        """
+        The package-search rules are only provided by applications with the web
+        role, as the others never scrape it.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+
+        def alerts(roles: str) -> set[str]:
+            state = State(relations=[relation], config={"roles": roles})
+            result = context.run(context.on.relation_joined(relation), state)
+            config = self._get_cos_agent_relation_config(result)
+            return {
+                rule.get("alert")
+                for group in config["metrics_alert_rules"]["groups"]
+                for rule in group["rules"]
+            }
+
+        self.assertIn("PackageSearchDown", alerts("web,message"))
+        self.assertNotIn("PackageSearchDown", alerts("message,background"))
+        self.assertIn("LandscapeWorkerDown", alerts("message,background"))
+
+    def test_worker_down_ignores_leader_services(self):
+        """
+        `LandscapeWorkerDown` does not select the targets of the services that
+        only run on the leader, which are down on the other units.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(relations=[relation], leader=False)
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        (expr,) = [
+            rule["expr"]
+            for group in config["metrics_alert_rules"]["groups"]
+            for rule in group["rules"]
+            if rule.get("alert") == "LandscapeWorkerDown"
+        ]
+        selector = re.search(r"\bup\{(.*?)\}", expr).group(1)
+        matchers = re.findall(r'(\w+)\s*(=~|!~|!=|=)\s*"([^"]*)"', selector)
+
+        def selected(labels: dict) -> bool:
+            for name, op, value in matchers:
+                label = labels.get(name, "")
+                matches = re.fullmatch(value, label) if "~" in op else label == value
+                if bool(matches) == op.startswith("!"):
+                    return False
+            return True
+
+        services = {
+            static_config["labels"]["landscape_service"]
+            for scrape in config["metrics_scrape_jobs"]
+            for static_config in scrape["static_configs"]
+            if selected(static_config["labels"])
+        }
+        self.assertIn("appserver", services)
+        self.assertNotIn("package-search", services)
+        self.assertNotIn("package-upload", services)
+
     def test_metrics_scrape_configs(self):
         """
         Landscape provides scrape configs for each instrumented Landscape service.
@@ -100,15 +233,141 @@ class TestGrafanaMachineAgentRelation(unittest.TestCase):
         expected_static_configs = [
             {
                 "targets": [f"localhost:{port}"],
-                "labels": {"landscape_service": f"{service}"},
+                "labels": {
+                    "landscape_service": f"{service}",
+                    "worker": "0",
+                    "unit": "landscape-server/0",
+                },
             }
             for service, port in METRIC_INSTRUMENTED_SERVICE_PORTS
         ]
 
-        actual_static_configs = [scrape["static_configs"][0] for scrape in scrape_jobs]
+        actual_static_configs = [
+            scrape["static_configs"][0]
+            for scrape in scrape_jobs
+            if "landscape_service" in scrape["static_configs"][0]["labels"]
+        ]
 
         self.assertListEqual(expected_static_configs, actual_static_configs)
 
+    def test_metrics_scrape_configs_workers(self):
+        """
+        Every worker of the services that run `worker_counts` processes is scraped
+        on its own port.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(relations=[relation], config={"worker_counts": 3})
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        targets = {
+            scrape["static_configs"][0]["labels"]["landscape_service"]: [
+                (static_config["targets"], static_config["labels"]["worker"])
+                for static_config in scrape["static_configs"]
+            ]
+            for scrape in config["metrics_scrape_jobs"]
+            if "landscape_service" in scrape["static_configs"][0]["labels"]
+        }
+
+        self.assertEqual(
+            [
+                (["localhost:8080"], "0"),
+                (["localhost:8081"], "1"),
+                (["localhost:8082"], "2"),
+            ],
+            targets["appserver"],
+        )
+        self.assertEqual(3, len(targets["api"]))
+        self.assertEqual([(["localhost:9099"], "0")], targets["package-search"])
+
+    def test_metrics_scrape_configs_roles(self):
+        """
+        Landscape only provides scrape configs for the services in this unit's roles.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(relations=[relation], config={"roles": "message"})
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        services = {
+            scrape["static_configs"][0]["labels"]["landscape_service"]
+            for scrape in config["metrics_scrape_jobs"]
+            if "landscape_service" in scrape["static_configs"][0]["labels"]
+        }
+
+        self.assertEqual({"pingserver", "message-server"}, services)
+
+    def test_charm_scrape_config(self):
+        """
+        The charm's own metrics are scraped from the charm metrics service.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(relations=[relation])
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        (charm,) = [
+            scrape
+            for scrape in config["metrics_scrape_jobs"]
+            if scrape["job_name"].endswith("charm")
+        ]
+        self.assertEqual(METRICS_PATH, charm["metrics_path"])
+        self.assertEqual(
+            [f"localhost:{METRICS_PORT}"], charm["static_configs"][0]["targets"]
+        )
+
+    def test_haproxy_scrape_configs(self):
+        """
+        The leader scrapes the statistics frontend of each related HAProxy unit.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        website = Relation(
+            "website",
+            remote_units_data={
+                0: {"private-address": "10.0.0.10"},
+                1: {"private-address": "10.0.0.11"},
+            },
+        )
+        state = State(
+            relations=[relation, website],
+            leader=True,
+            config={
+                "haproxy_stats_port": 8404,
+                "haproxy_stats_allowed_networks": "10.0.0.0/24",
+            },
+        )
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        (haproxy,) = [
+            scrape
+            for scrape in config["metrics_scrape_jobs"]
+            if scrape["job_name"].endswith("haproxy")
+        ]
+        self.assertEqual(
+            [["10.0.0.10:8404"], ["10.0.0.11:8404"]],
+            [static_config["targets"] for static_config in haproxy["static_configs"]],
+        )
+
+        state = replace(state, leader=False)
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        self.assertFalse(
+            any(
+                scrape["job_name"].endswith("haproxy")
+                for scrape in config["metrics_scrape_jobs"]
+            )
+        )
+
     def test_scrape_interval(self):
         """
         Landscape exposes a Prometheus scrape interval configuration parameter
@@ -128,6 +387,89 @@ class TestGrafanaMachineAgentRelation(unittest.TestCase):
         for scrape_job in config["metrics_scrape_jobs"]:
             self.assertEqual(scrape_interval, scrape_job["scrape_interval"])
 
+    def test_scrape_interval_overrides(self):
+        """
+        `prometheus_scrape_interval_overrides` sets the interval of some jobs.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(
+            relations=[relation],
+            config={
+                "prometheus_scrape_interval": "1m",
+                "prometheus_scrape_interval_overrides": "pingserver=5m,charm=10m",
+            },
+        )
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        intervals = {
+            scrape["static_configs"][0]["labels"].get("landscape_service")
+            or scrape["job_name"].rpartition("_")[2]: scrape["scrape_interval"]
+            for scrape in config["metrics_scrape_jobs"]
+        }
+        self.assertEqual("5m", intervals["pingserver"])
+        self.assertEqual("10m", intervals["charm"])
+        self.assertEqual("1m", intervals["appserver"])
+
+    def test_metric_instrumented_services_have_roles(self):
+        for service, _ in METRIC_INSTRUMENTED_SERVICE_PORTS:
+            self.assertIn(service, SERVICE_ROLES)
+
+    def test_scrape_jobs_configurable(self):
+        """
+        Every metric-instrumented service has a scrape job whose interval can be
+        overridden.
+        """
+        for service, _ in METRIC_INSTRUMENTED_SERVICE_PORTS:
+            self.assertIn(service, SCRAPE_JOBS)
+
+    def test_metric_relabel_configs(self):
+        """
+        The metric keep and drop lists are relabelling rules of every scrape job.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(
+            relations=[relation],
+            config={
+                "prometheus_metric_keep": "http_.*,up",
+                "prometheus_metric_drop": "http_request_size_bytes_.*",
+            },
+        )
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        for scrape_job in config["metrics_scrape_jobs"]:
+            self.assertEqual(
+                [
+                    {
+                        "source_labels": ["__name__"],
+                        "regex": "http_.*|up",
+                        "action": "keep",
+                    },
+                    {
+                        "source_labels": ["__name__"],
+                        "regex": "http_request_size_bytes_.*",
+                        "action": "drop",
+                    },
+                ],
+                scrape_job["metric_relabel_configs"],
+            )
+
+    def test_no_metric_relabel_configs(self):
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(relations=[relation])
+
+        result = context.run(context.on.relation_joined(relation), state)
+        config = self._get_cos_agent_relation_config(result)
+
+        for scrape_job in config["metrics_scrape_jobs"]:
+            self.assertNotIn("metric_relabel_configs", scrape_job)
+
 
 class TestOnConfigChanged:
     """
@@ -167,6 +509,48 @@ class TestOnConfigChanged:
         assert config["message-server"]["workers"] == str(workers)
         assert config["pingserver"]["workers"] == str(workers)
 
+    def test_background_workers(self, capture_service_conf):
+        """
+        If the `job_handler_workers` and `async_frontend_workers` are provided,
+        update the job-handler and async-frontend sections.
+        """
+        context = Context(LandscapeServerCharm)
+        state = State(config={"job_handler_workers": 4, "async_frontend_workers": 3})
+        context.run(context.on.config_changed(), state)
+
+        config = capture_service_conf.get_config()
+
+        assert config["job-handler"]["workers"] == "4"
+        assert config["async-frontend"]["workers"] == "3"
+
+    def test_db_store_hosts(self, capture_service_conf):
+        """
+        Stores in `db_store_hosts` get their own host and credentials in the stores
+        section. Stores removed from it go back to the main host.
+        """
+        context = Context(LandscapeServerCharm)
+        state = State(
+            config={"db_store_hosts": "package=pkg:secret@10.0.0.5,session=10.0.0.6"}
+        )
+        with patch("charm.logger") as logger:
+            state = context.run(context.on.config_changed(), state)
+
+        assert "passwords" in logger.warning.call_args.args[0]
+        stores = capture_service_conf.get_config()["stores"]
+        assert stores["package-host"] == "10.0.0.5:5432"
+        assert stores["package-user"] == "pkg"
+        assert stores["package-password"] == "secret"
+        assert stores["session-host"] == "10.0.0.6:5432"
+        assert "session-user" not in stores
+
+        state = replace(state, config={"db_store_hosts": "package=10.0.0.5"})
+        context.run(context.on.config_changed(), state)
+
+        stores = capture_service_conf.get_config()["stores"]
+        assert stores["package-host"] == "10.0.0.5:5432"
+        assert "package-user" not in stores
+        assert "session-host" not in stores
+
     def test_hostagent_services_default(self):
         relation = Relation("website")
         state_in = State(relations=[relation], config={})
@@ -204,6 +588,59 @@ class TestOnConfigChanged:
         service_names = (service["service_name"] for service in services)
         assert GRPC_SERVICE.service_name in service_names
 
+    def test_roles_update_nrpe_checks(self):
+        """
+        The NRPE checks follow a change of `roles`.
+        """
+        relation = SubordinateRelation("nrpe-external-master")
+        context = Context(LandscapeServerCharm)
+        state = State(relations=[relation], config={"roles": "message"})
+
+        with patch("charm.NRPE_D_DIR", new="/nonexistent"):
+            state = context.run(context.on.config_changed(), state)
+
+        monitors = state.get_relation(relation.id).local_unit_data["monitors"]
+        assert "landscape-msgserver" in monitors
+        assert "landscape-appserver" not in monitors
+
+    def test_local_package_search_resumes_service(self, capture_service_conf):
+        """
+        Switching `package_search_mode` to `local` resumes the package-search
+        service a non-leader paused, and switching back pauses it again.
+        """
+        context = Context(LandscapeServerCharm)
+        state = State(leader=False, config={"package_search_mode": "local"})
+
+        with patch.multiple(
+            "charm",
+            service_pause=DEFAULT,
+            service_resume=DEFAULT,
+            service_running=DEFAULT,
+        ) as systemd:
+            systemd["service_running"].return_value = False
+            state = context.run(context.on.config_changed(), state)
+
+        systemd["service_resume"].assert_called_once_with(LANDSCAPE_PACKAGE_SEARCH)
+        systemd["service_pause"].assert_called_once_with(LANDSCAPE_PACKAGE_UPLOAD)
+        assert capture_service_conf.get_config()["package-search"]["host"] == (
+            "localhost"
+        )
+
+        with patch.multiple(
+            "charm",
+            service_pause=DEFAULT,
+            service_resume=DEFAULT,
+            service_running=DEFAULT,
+        ) as systemd:
+            context.run(
+                context.on.config_changed(),
+                replace(state, config={"package_search_mode": "leader"}),
+            )
+
+        systemd["service_resume"].assert_not_called()
+        assert systemd["service_pause"].call_count == 2
+        systemd["service_pause"].assert_any_call(LANDSCAPE_PACKAGE_SEARCH)
+
 
 class TestOnConfigChangedEnableUbuntuInstallerAttach:
     """
@@ -422,140 +859,1611 @@ class TestGetSecretToken:
         state_in = State(relations=[relation], config={}, leader=True)
         context = Context(LandscapeServerCharm)
 
-        before_config = capture_service_conf.get_config()
-        assert "landscape" not in before_config.sections()
+        before_config = capture_service_conf.get_config()
+        assert "landscape" not in before_config.sections()
+
+        with patch("charm.generate_secret_token") as mock_token:
+            token = "mytestsecrettoken"
+            mock_token.return_value = token
+            state_out = context.run(context.on.config_changed(), state_in)
+        app_data = state_out.get_relation(relation.id).local_app_data
+        assert app_data.get("secret-token") == token
+
+        after_config = capture_service_conf.get_config()
+        assert after_config["landscape"].get("secret-token") == token
+
+    def test_follower_waits_if_not_provided(self, capture_service_conf):
+        """
+        If the `secret_token` is not provided locally nor in a replica and we
+        are not the leader unit, do nothing. We wait for the leader to generate
+        a token.
+        """
+        relation = PeerRelation("replicas", peers_data={})
+        state = State(relations=[relation], config={}, leader=False)
+        context = Context(LandscapeServerCharm)
+
+        before_config = capture_service_conf.get_config()
+        assert "landscape" not in before_config.sections()
+
+        context.run(context.on.config_changed(), state)
+
+        after_config = capture_service_conf.get_config()
+        assert after_config["landscape"].get("secret-token", None) is None
+
+
+class TestGetCookieEncryptionKey:
+    """
+    Tests for `on.config_changed` hooks that affect the `cookie-encryption-key`
+    configuration.
+    """
+
+    def test_provided_in_config(self, capture_service_conf):
+        """
+        If the `cookie_encryption_key` is provided in the configuration for this unit,
+        return it.
+        """
+        cookie_encryption_key = "testcookieencryptionkeylotsofentropy"
+        context = Context(LandscapeServerCharm)
+        state = State(config={"cookie_encryption_key": cookie_encryption_key})
+        context.run(context.on.config_changed(), state)
+
+        config = capture_service_conf.get_config()
+        assert config["api"]["cookie-encryption-key"] == cookie_encryption_key
+
+    def test_provided_in_replica(self, capture_service_conf):
+        """
+        If the `cookie_encryption_key` is not provided in the configuration
+        for this unit and there is a replica, return the encryption key from
+        it.
+        """
+        cookie_encryption_key = "testcookieencryptionkeylotsofentropy"
+        relation = PeerRelation(
+            "replicas", local_app_data={"cookie-encryption-key": cookie_encryption_key}
+        )
+        state = State(relations=[relation])
+        context = Context(LandscapeServerCharm)
+
+        context.run(context.on.config_changed(), state)
+
+        config = capture_service_conf.get_config()
+        assert config["api"]["cookie-encryption-key"] == cookie_encryption_key
+
+    def test_prefer_local_config(self, capture_service_conf):
+        """
+        If the `cookie_encryption_key` is provided in a replica but also
+        locally, prefer the local version and return it.
+        """
+        local_cookie_encryption_key = "testcookieencryptionkeylotsofentropy"
+        peer_cookie_encryption_key = "thecookieencryptionkeyfromthepeerrelation"
+        relation = PeerRelation(
+            "replicas",
+            peers_data={1: {"cookie-encryption-key": peer_cookie_encryption_key}},
+        )
+        state = State(
+            relations=[relation],
+            config={"cookie_encryption_key": local_cookie_encryption_key},
+        )
+        context = Context(LandscapeServerCharm)
+
+        context.run(context.on.config_changed(), state)
+
+        config = capture_service_conf.get_config()
+        assert config["api"]["cookie-encryption-key"] == local_cookie_encryption_key
+
+    def test_leader_generates_if_not_provided(self, capture_service_conf):
+        """
+        If the `cookie_encryption_key` is not provided locally nor in a replica
+        and we are the leader unit, generate a new cookie encryption key and
+        put it into the peer app relation databag.
+        """
+        relation = PeerRelation("replicas", peers_data={})
+        state_in = State(relations=[relation], config={}, leader=True)
+        context = Context(LandscapeServerCharm)
+
+        before_config = capture_service_conf.get_config()
+        assert "api" not in before_config.sections()
+
+        with patch(
+            "charm.generate_cookie_encryption_key"
+        ) as mock_cookie_encryption_key:
+            cookie_encryption_key = "mytestcookieencryptionkey"
+            mock_cookie_encryption_key.return_value = cookie_encryption_key
+            state_out = context.run(context.on.config_changed(), state_in)
+
+        app_data = state_out.get_relation(relation.id).local_app_data
+        assert app_data.get("cookie-encryption-key") == cookie_encryption_key
+
+        after_config = capture_service_conf.get_config()
+        assert after_config["api"].get("cookie-encryption-key") == cookie_encryption_key
+
+    def test_follower_waits_if_not_provided(self, capture_service_conf):
+        """
+        If the `cookie_encryption_key` is not provided locally nor in a replica
+        and we are not the leader unit, do nothing. We wait for the leader to
+        generate a cookie encryption key.
+        """
+        relation = PeerRelation("replicas", peers_data={})
+        state = State(relations=[relation], config={}, leader=False)
+        context = Context(LandscapeServerCharm)
+
+        before_config = capture_service_conf.get_config()
+        assert "api" not in before_config.sections()
+
+        context.run(context.on.config_changed(), state)
+
+        after_config = capture_service_conf.get_config()
+        assert after_config["api"].get("cookie-encryption-key", None) is None
+
+
+class TestDbConnectionBudget:
+    """
+    Tests for blocking when the units may open more database connections than
+    `db_max_connections`.
+    """
+
+    def _state(self, config: dict, peers: tuple = (1, 2), **kwargs) -> State:
+        return State(
+            config=config,
+            relations=[
+                PeerRelation("replicas", peers_data={peer: {} for peer in peers})
+            ],
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={
+                        "ready": {
+                            "db": True,
+                            "inbound-amqp": True,
+                            "outbound-amqp": True,
+                            "haproxy": True,
+                        },
+                        "running": True,
+                    },
+                )
+            ],
+            **kwargs,
+        )
+
+    def test_over_budget(self):
+        """
+        3 units with 10 processes of 6 connections each need 180 connections.
+        """
+        context = Context(LandscapeServerCharm)
+        state_in = self._state({"db_max_connections": 179})
+
+        state_out = context.run(context.on.update_status(), state_in)
+
+        assert state_out.unit_status == BlockedStatus(
+            "Database connection budget 180 exceeds db_max_connections 179"
+        )
+
+    def test_within_budget(self):
+        context = Context(LandscapeServerCharm)
+        state_in = self._state(
+            {"db_max_connections": 179, "db_connections_per_process": 5}
+        )
+
+        state_out = context.run(context.on.update_status(), state_in)
+
+        assert state_out.unit_status == ActiveStatus("Unit is ready")
+
+    def test_scale_down_unblocks(self):
+        """
+        When a unit leaves and the others fit in the budget, they are unblocked.
+        """
+        context = Context(LandscapeServerCharm)
+        state_in = self._state(
+            {"db_max_connections": 179},
+            peers=(1,),
+            unit_status=BlockedStatus(
+                "Database connection budget 180 exceeds db_max_connections 179"
+            ),
+        )
+        relation = state_in.get_relations("replicas")[0]
+
+        state_out = context.run(
+            context.on.relation_departed(relation, remote_unit=2, departing_unit=2),
+            state_in,
+        )
+
+        assert state_out.unit_status == ActiveStatus("Unit is ready")
+
+    def test_scale_up_blocks(self):
+        context = Context(LandscapeServerCharm)
+        state_in = self._state(
+            {"db_max_connections": 179},
+            unit_status=ActiveStatus("Unit is ready"),
+        )
+        relation = state_in.get_relations("replicas")[0]
+
+        state_out = context.run(
+            context.on.relation_joined(relation, remote_unit=2), state_in
+        )
+
+        assert state_out.unit_status == BlockedStatus(
+            "Database connection budget 180 exceeds db_max_connections 179"
+        )
+
+    def test_other_blocked_status_kept(self):
+        context = Context(LandscapeServerCharm)
+        state_in = self._state(
+            {"db_max_connections": 0},
+            unit_status=BlockedStatus("Failed schema migration"),
+        )
+
+        state_out = context.run(context.on.update_status(), state_in)
+
+        assert state_out.unit_status == BlockedStatus("Failed schema migration")
+
+    def test_disabled(self):
+        context = Context(LandscapeServerCharm)
+        state_in = self._state({"db_max_connections": 0})
+
+        state_out = context.run(context.on.update_status(), state_in)
+
+        assert state_out.unit_status == ActiveStatus("Unit is ready")
+
+
+class TestSchemaBootstrap:
+    """
+    Tests for running `landscape-schema --bootstrap` once per landscape-server
+    version and database endpoint.
+    """
+
+    @pytest.fixture(autouse=True)
+    def installed(self):
+        with patch("charm.apt.DebianPackage.from_installed_package") as p:
+            p.return_value.version = "25.04-0ubuntu1"
+            yield p
+
+    @pytest.fixture(autouse=True)
+    def check_call(self):
+        with patch("charm.run_command") as p:
+            yield p
+
+    def _bootstrap_calls(self, check_call) -> list:
+        return [c for c in check_call.call_args_list if "--bootstrap" in c.args[0]]
+
+    def test_leader_publishes(self, capture_service_conf, check_call):
+        """
+        The leader bootstraps the schema once and publishes it to its peers.
+        """
+        relation = PeerRelation("replicas")
+        context = Context(LandscapeServerCharm)
+        state_in = State(
+            config={"db_host": "db.test", "db_port": "5432"},
+            relations=[relation],
+            leader=True,
+        )
+
+        state_out = context.run(context.on.config_changed(), state_in)
+        state_out = context.run(context.on.config_changed(), state_out)
+
+        assert len(self._bootstrap_calls(check_call)) == 1
+        app_data = state_out.get_relation(relation.id).local_app_data
+        assert app_data["schema-bootstrap"] == "25.04-0ubuntu1@db.test:5432"
+
+    def test_store_hosts(self, capture_service_conf, check_call):
+        """
+        The stores placed on their own cluster are part of the bootstrap.
+        """
+        relation = PeerRelation("replicas")
+        context = Context(LandscapeServerCharm)
+        state_in = State(
+            config={
+                "db_host": "db.test",
+                "db_port": "5432",
+                "db_store_hosts": "package=db2.test",
+            },
+            relations=[relation],
+            leader=True,
+        )
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        app_data = state_out.get_relation(relation.id).local_app_data
+        assert (
+            app_data["schema-bootstrap"]
+            == "25.04-0ubuntu1@db.test:5432,package=db2.test:5432"
+        )
+
+    def test_non_leader_skips(self, capture_service_conf, check_call):
+        """
+        Non-leaders skip the bootstrap the leader published.
+        """
+        relation = PeerRelation(
+            "replicas",
+            local_app_data={"schema-bootstrap": "25.04-0ubuntu1@db.test:5432"},
+        )
+        context = Context(LandscapeServerCharm)
+        state_in = State(
+            config={"db_host": "db.test", "db_port": "5432"},
+            relations=[relation],
+            leader=False,
+        )
+
+        context.run(context.on.config_changed(), state_in)
+
+        assert not self._bootstrap_calls(check_call)
+
+    def test_new_version(self, capture_service_conf, check_call):
+        """
+        The leader bootstraps the schema again for a new landscape-server version.
+        """
+        relation = PeerRelation("replicas")
+        context = Context(LandscapeServerCharm)
+        state_in = State(
+            config={"db_host": "db.test", "db_port": "5432"},
+            relations=[relation],
+            leader=True,
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={"schema_bootstrap": "24.04-0ubuntu1@db.test:5432"},
+                )
+            ],
+        )
+
+        context.run(context.on.config_changed(), state_in)
+
+        assert len(self._bootstrap_calls(check_call)) == 1
+
+    def test_proxy_settings(self, capture_service_conf, check_call, monkeypatch):
+        """
+        The leader bootstraps the schema again when the proxy settings change,
+        without publishing them.
+        """
+        relation = PeerRelation("replicas")
+        context = Context(LandscapeServerCharm)
+        state = State(
+            config={"db_host": "db.test", "db_port": "5432"},
+            relations=[relation],
+            leader=True,
+        )
+        state = context.run(context.on.config_changed(), state)
+
+        monkeypatch.setenv("JUJU_CHARM_HTTP_PROXY", "http://user:pw@proxy.test")
+        state = context.run(context.on.config_changed(), state)
+        state = context.run(context.on.config_changed(), state)
+
+        calls = self._bootstrap_calls(check_call)
+        assert len(calls) == 2
+        assert "http://user:pw@proxy.test" in calls[1].args[0]
+        marker = state.get_relation(relation.id).local_app_data["schema-bootstrap"]
+        assert marker.startswith("25.04-0ubuntu1@db.test:5432#")
+        assert "proxy.test" not in marker
+
+    def test_non_leader_waits(self, capture_service_conf, check_call):
+        """
+        Non-leaders wait for the leader to bootstrap their landscape-server
+        version, and finish setting up the database once it is published.
+        """
+        relation = PeerRelation(
+            "replicas",
+            local_app_data={"schema-bootstrap": "24.04-0ubuntu1@db.test:5432"},
+        )
+        context = Context(LandscapeServerCharm)
+        state_in = State(
+            config={"db_host": "db.test", "db_port": "5432"},
+            relations=[relation],
+            leader=False,
+        )
+
+        state_out = context.run(context.on.config_changed(), state_in)
+
+        assert not self._bootstrap_calls(check_call)
+        assert state_out.unit_status == WaitingStatus(
+            "Waiting for the leader to bootstrap schema"
+        )
+        assert not self._stored(state_out)["ready"]["db"]
+
+        relation = replace(
+            relation,
+            local_app_data={
+                "schema-bootstrap": "25.04-0ubuntu1@db.test:5432#0123456789abcdef"
+            },
+        )
+        state_out = context.run(
+            context.on.relation_changed(relation),
+            replace(state_out, relations=[relation]),
+        )
+
+        assert not self._bootstrap_calls(check_call)
+        assert self._stored(state_out)["ready"]["db"]
+        assert not self._stored(state_out)["schema_bootstrap_waiting"]
+
+    @staticmethod
+    def _stored(state: State) -> dict:
+        return state.get_stored_state(
+            "_stored", owner_path="LandscapeServerCharm"
+        ).content
+
+    def test_not_installed(self, capture_service_conf, check_call, installed):
+        """
+        The bootstrap always runs if the landscape-server version is unknown.
+        """
+        installed.side_effect = PackageNotFoundError
+        context = Context(LandscapeServerCharm)
+        state_in = State(
+            config={"db_host": "db.test", "db_port": "5432"},
+            relations=[PeerRelation("replicas")],
+            leader=True,
+        )
+
+        state_out = context.run(context.on.config_changed(), state_in)
+        context.run(context.on.config_changed(), state_out)
+
+        assert len(self._bootstrap_calls(check_call)) == 2
+
+
+class TestDbMaintenance:
+    """
+    Tests for running the database-side setup steps in `MAINTENANCE_SCRIPT`.
+    """
+
+    def _maintenance_inputs(self, run_mock) -> list[dict]:
+        return [
+            json.loads(c.kwargs["input"])
+            for c in run_mock.call_args_list
+            if c.args[0] == ["python3", MAINTENANCE_SCRIPT]
+        ]
+
+    @patch("charm.subprocess.run")
+    def test_unchanged_steps_skipped(self, run_mock, capture_service_conf):
+        """
+        Steps only run again once their inputs change.
+        """
+        run_mock.return_value.stdout = (
+            '{"autoregistration": {"ok": true, "duration": 0.5}}\n'
+        )
+        context = Context(LandscapeServerCharm)
+        state = State(
+            relations=[PeerRelation("replicas")],
+            leader=True,
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={"account_bootstrapped": True},
+                )
+            ],
+        )
+
+        state = context.run(context.on.config_changed(), state)
+        state = context.run(context.on.config_changed(), state)
+        state = replace(state, config={"autoregistration": True})
+        context.run(context.on.config_changed(), state)
+
+        assert self._maintenance_inputs(run_mock) == [
+            {"autoregistration": {"on": False}},
+            {"autoregistration": {"on": True}},
+        ]
+
+    @patch("charm.subprocess.run")
+    def test_failed_steps_retried(self, run_mock, capture_service_conf):
+        run_mock.return_value.stdout = (
+            '{"autoregistration": {"ok": false, "error": "", "duration": 0.5}}\n'
+        )
+        context = Context(LandscapeServerCharm)
+        state = State(
+            relations=[PeerRelation("replicas")],
+            leader=True,
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={"account_bootstrapped": True},
+                )
+            ],
+        )
+
+        state = context.run(context.on.config_changed(), state)
+        context.run(context.on.config_changed(), state)
+
+        assert len(self._maintenance_inputs(run_mock)) == 2
+
+    @patch("charm.subprocess.run")
+    def test_admin_password_not_stored(self, run_mock, capture_service_conf):
+        """
+        The inputs of bootstrap-account hold the admin password, so they are not
+        kept, and any kept by an earlier revision are removed.
+        """
+        run_mock.return_value.stdout = (
+            '{"bootstrap-account": {"ok": true, "duration": 1.0}, '
+            '"autoregistration": {"ok": true, "duration": 0.5}}\n'
+        )
+        context = Context(LandscapeServerCharm)
+        state = State(
+            relations=[PeerRelation("replicas")],
+            leader=True,
+            config={
+                "admin_email": "hello@ubuntu.com",
+                "admin_name": "Hello Ubuntu",
+                "admin_password": "password",
+                "root_url": "https://landscape.test",
+            },
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={"maintenance_inputs": {"bootstrap-account": "digest"}},
+                )
+            ],
+        )
+
+        state = context.run(context.on.config_changed(), state)
+
+        stored = state.get_stored_state(
+            "_stored", owner_path="LandscapeServerCharm"
+        ).content
+        assert stored["account_bootstrapped"]
+        assert list(stored["maintenance_inputs"]) == ["autoregistration"]
+
+    @patch("charm.subprocess.run")
+    def test_step_errors_logged(self, run_mock, capture_service_conf):
+        run_mock.return_value.stdout = (
+            '{"autoregistration": {"ok": false, "duration": 0.5, '
+            '"error": "RuntimeError: No account exists"}}\n'
+        )
+        context = Context(LandscapeServerCharm)
+        state = State(
+            relations=[PeerRelation("replicas")],
+            leader=True,
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={"account_bootstrapped": True},
+                )
+            ],
+        )
+
+        with patch("charm.logger") as logger:
+            context.run(context.on.config_changed(), state)
+
+        logger.error.assert_any_call(
+            "Maintenance step %s failed: %s",
+            "autoregistration",
+            "RuntimeError: No account exists",
+        )
+
+
+class TestDbSessionSettings:
+    """
+    Tests for setting `db_session_settings` on the stores.
+    """
+
+    SERVICE_CONF = """\
+[stores]
+host = db.test:5432
+user = landscape
+password = app-secret
+
+[schema]
+store_user = schema
+store_password = schema-secret
+"""
+
+    @pytest.fixture(autouse=True)
+    def migrate_schema_bootstrap(self):
+        with patch(
+            "charm.LandscapeServerCharm._migrate_schema_bootstrap", return_value=True
+        ) as migrate_mock:
+            yield migrate_mock
+
+    @staticmethod
+    def _state(config: dict) -> State:
+        return State(
+            relations=[PeerRelation("replicas")],
+            leader=True,
+            config={"db_store_hosts": "package=pkg@db2.test:5433", **config},
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={
+                        "ready": {
+                            "db": True,
+                            "inbound-amqp": False,
+                            "outbound-amqp": False,
+                            "haproxy": False,
+                        }
+                    },
+                )
+            ],
+        )
+
+    @patch("charm.set_role_settings")
+    def test_settings_applied_once(self, set_role_settings_mock, capture_service_conf):
+        """
+        The settings are set on each store for its application role, and only set
+        again once they change. Removed settings are reset.
+        """
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+        context = Context(LandscapeServerCharm)
+        state = self._state(
+            {"db_session_settings": "statement_timeout=60s,package.work_mem=64MB"}
+        )
+
+        state = context.run(context.on.config_changed(), state)
+        state = context.run(context.on.config_changed(), state)
+
+        calls = {c.args[0].database: c for c in set_role_settings_mock.call_args_list}
+        assert len(set_role_settings_mock.call_args_list) == len(Store)
+        package = calls["landscape-standalone-package"]
+        assert package.args[0].host == "db2.test"
+        assert package.args[1:] == (
+            "pkg",
+            {"statement_timeout": "60s", "work_mem": "64MB"},
+        )
+        main = calls["landscape-standalone-main"]
+        assert main.args[1:] == ("landscape", {"statement_timeout": "60s"})
+        assert main.kwargs["reset"] == list(SESSION_SETTINGS)
+
+        set_role_settings_mock.reset_mock()
+        state = replace(state, config={"db_session_settings": ""})
+        context.run(context.on.config_changed(), state)
+
+        assert len(set_role_settings_mock.call_args_list) == len(Store)
+        assert all(c.args[2] == {} for c in set_role_settings_mock.call_args_list)
+
+    @patch("charm.set_role_settings")
+    def test_unused(self, set_role_settings_mock, capture_service_conf):
+        """
+        The roles are left alone until `db_session_settings` is first used.
+        """
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+        context = Context(LandscapeServerCharm)
+
+        context.run(context.on.config_changed(), self._state({}))
+
+        set_role_settings_mock.assert_not_called()
+
+    @patch(
+        "charm.set_role_settings",
+        side_effect=CalledProcessError(1, ["psql", "-c", "ALTER ROLE"]),
+    )
+    def test_failure_retried(self, set_role_settings_mock, capture_service_conf):
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+        context = Context(LandscapeServerCharm)
+        state = self._state({"db_session_settings": "statement_timeout=60s"})
+
+        state = context.run(context.on.config_changed(), state)
+        context.run(context.on.config_changed(), state)
+
+        assert set_role_settings_mock.call_count == 2 * len(Store)
+
+
+class TestTracing:
+    """
+    Tests for exporting traces to the tracing endpoint of the `cos-agent` relation.
+    """
+
+    RECEIVERS = {
+        "receivers": json.dumps(
+            [
+                {
+                    "protocol": {"name": "otlp_http", "type": "http"},
+                    "url": "http://agent.test:4318",
+                }
+            ]
+        )
+    }
+
+    def test_tracing_configured(self, capture_service_conf):
+        """
+        The endpoint and sample ratio are written to the tracing section and the
+        services restarted, once the endpoint is known. The configuration is migrated
+        like every other `service.conf` change.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent", remote_units_data={0: self.RECEIVERS})
+        state = State(relations=[relation], config={"tracing_sample_ratio": 0.25})
+
+        with (
+            patch(
+                "charm.LandscapeServerCharm._update_ready_status"
+            ) as update_ready_status,
+            patch("settings_files.migrate_service_conf") as migrate_service_conf,
+        ):
+            context.run(context.on.relation_changed(relation), state)
+
+        tracing = capture_service_conf.get_config()["tracing"]
+        assert tracing["otlp-endpoint"] == "http://agent.test:4318"
+        assert tracing["sample-ratio"] == "0.25"
+        update_ready_status.assert_called_once_with(restart_services=True)
+        migrate_service_conf.assert_called_once_with()
+
+    def test_tracing_requested(self):
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+
+        result = context.run(
+            context.on.relation_joined(relation), State(relations=[relation])
+        )
+        config = json.loads(result.get_relation(relation.id).local_unit_data["config"])
+
+        assert config["tracing_protocols"] == ["otlp_http"]
+
+    def test_tracing_disabled(self, capture_service_conf):
+        """
+        Tracing is removed from `service.conf` when `tracing_sample_ratio` is 0.
+        """
+        capture_service_conf.tempfile.write_text(
+            "[tracing]\notlp-endpoint = http://agent.test:4318\nsample-ratio = 1.0\n"
+        )
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent", remote_units_data={0: self.RECEIVERS})
+        state = State(relations=[relation], config={"tracing_sample_ratio": 0.0})
+
+        with patch(
+            "charm.LandscapeServerCharm._update_ready_status"
+        ) as update_ready_status:
+            context.run(context.on.relation_changed(relation), state)
+
+        assert "tracing" not in capture_service_conf.get_config()
+        update_ready_status.assert_called_once_with(restart_services=True)
+
+    def test_no_endpoint(self, capture_service_conf):
+        context = Context(LandscapeServerCharm)
+        relation = Relation("cos-agent")
+        state = State(relations=[relation], config={"tracing_sample_ratio": 0.25})
+
+        with patch(
+            "charm.LandscapeServerCharm._update_ready_status"
+        ) as update_ready_status:
+            context.run(context.on.relation_changed(relation), state)
+
+        assert "tracing" not in capture_service_conf.get_config()
+        update_ready_status.assert_not_called()
+
+
+class TestHashIdDatabasesAllUnits:
+    """
+    Tests for serving the hash-id databases from non-leader units.
+    """
+
+    @pytest.fixture(autouse=True)
+    def systemd(self):
+        with patch.multiple(
+            "charm",
+            service_pause=DEFAULT,
+            service_resume=DEFAULT,
+            service_running=DEFAULT,
+            run_command=DEFAULT,
+        ):
+            yield
+
+    def _relation(self, generation: str) -> PeerRelation:
+        return PeerRelation(
+            "replicas",
+            local_app_data={
+                "leader-ip": "10.0.0.1",
+                "hash-id-databases-generation": generation,
+            },
+        )
+
+    @pytest.fixture(autouse=True)
+    def popen(self, tmp_path):
+        log_file = tmp_path / "hash-id-databases.log"
+        with (
+            patch("charm.HASH_ID_DATABASES_LOG_FILE", new=str(log_file)),
+            patch("charm.subprocess.Popen") as popen_mock,
+        ):
+            yield popen_mock
+
+    @pytest.fixture(autouse=True)
+    def running(self):
+        with patch("charm.hash_id_databases_running", return_value=False) as m:
+            yield m
+
+    @staticmethod
+    def _stored(state: State) -> dict:
+        return state.get_stored_state(
+            "_stored", owner_path="LandscapeServerCharm"
+        ).content
+
+    def _syncing_state(self, **kwargs) -> State:
+        return State(
+            leader=False,
+            config={"hash_id_databases_all_units": True},
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={
+                        "hash_id_databases_pending": "2025-01-01T00:00:00+00:00",
+                        "hash_id_databases_sync_started": "2025-01-01T01:00:00+00:00",
+                    },
+                )
+            ],
+            **kwargs,
+        )
+
+    def test_regenerates_on_new_generation(self, popen):
+        """
+        If `hash_id_databases_all_units` is set and the leader publishes a new
+        generation, a non-leader starts regenerating its hash-id databases in the
+        background.
+        """
+        relation = self._relation("2025-01-01T00:00:00+00:00")
+        state_in = State(
+            relations=[relation],
+            leader=False,
+            config={"hash_id_databases_all_units": True},
+        )
+        context = Context(LandscapeServerCharm)
+
+        state_out = context.run(context.on.relation_changed(relation), state_in)
+
+        popen.assert_called_once_with(
+            ["python3", HASH_ID_DATABASES_RUNNER],
+            stdout=ANY,
+            stderr=ANY,
+            env=ANY,
+            start_new_session=True,
+        )
+        stored = self._stored(state_out)
+        assert stored["hash_id_databases_pending"] == "2025-01-01T00:00:00+00:00"
+        assert stored["hash_id_databases_sync_started"]
+        assert stored["hash_id_databases_generation"] == ""
+
+    @patch("charm.read_hash_id_databases_status")
+    def test_publishes_after_success(self, status_mock, popen):
+        """
+        Once the run started for the pending generation has succeeded, a later
+        hook records the generation and updates the HAProxy servers.
+        """
+        status_mock.return_value = {
+            "state": "succeeded",
+            "started": "2025-01-01T01:00:01+00:00",
+        }
+        context = Context(LandscapeServerCharm)
+
+        with patch(
+            "charm.LandscapeServerCharm._update_haproxy_connection"
+        ) as update_haproxy:
+            state_out = context.run(
+                context.on.update_status(),
+                self._syncing_state(relations=[Relation("website")]),
+            )
+
+        stored = self._stored(state_out)
+        assert stored["hash_id_databases_generation"] == "2025-01-01T00:00:00+00:00"
+        assert stored["hash_id_databases_pending"] == ""
+        update_haproxy.assert_called_once()
+        popen.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "status",
+        [
+            {"state": "failed", "started": "2025-01-01T01:00:01+00:00"},
+            {"state": "succeeded", "started": "2024-12-31T00:00:00+00:00"},
+        ],
+    )
+    @patch("charm.read_hash_id_databases_status")
+    def test_retries_failed_run(self, status_mock, popen, status):
+        """
+        A run that failed, or never started, for the pending generation is started
+        again.
+        """
+        status_mock.return_value = status
+        context = Context(LandscapeServerCharm)
+
+        with patch("charm.logger") as logger:
+            state_out = context.run(context.on.update_status(), self._syncing_state())
+
+        popen.assert_called_once()
+        logger.error.assert_called()
+        stored = self._stored(state_out)
+        assert stored["hash_id_databases_generation"] == ""
+        assert stored["hash_id_databases_sync_started"] > "2025-01-01T01:00:00+00:00"
+
+    def test_waits_for_run(self, popen, running):
+        running.return_value = True
+        context = Context(LandscapeServerCharm)
+
+        state_out = context.run(context.on.update_status(), self._syncing_state())
+
+        popen.assert_not_called()
+        stored = self._stored(state_out)
+        assert stored["hash_id_databases_pending"] == "2025-01-01T00:00:00+00:00"
+
+    def test_skips_known_generation(self, popen):
+        """
+        A non-leader does not regenerate a generation it already has.
+        """
+        generation = "2025-01-01T00:00:00+00:00"
+        relation = self._relation(generation)
+        state_in = State(
+            relations=[relation],
+            leader=False,
+            config={"hash_id_databases_all_units": True},
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={"hash_id_databases_generation": generation},
+                )
+            ],
+        )
+        context = Context(LandscapeServerCharm)
+
+        context.run(context.on.relation_changed(relation), state_in)
+
+        popen.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "stored,serves",
+        [
+            ({}, False),
+            ({"hash_id_databases_pending": "2025-01-01T00:00:00+00:00"}, False),
+            ({"hash_id_databases_generation": "2025-01-01T00:00:00+00:00"}, True),
+            ({"hash_id_databases_resource": "0123abcd"}, True),
+        ],
+    )
+    def test_serves_once_generated(self, stored, serves):
+        """
+        A non-leader only serves the hash-id databases once a regeneration
+        succeeded or the resource was unpacked, not while its first run is
+        pending.
+        """
+        state = State(
+            leader=False,
+            config={"hash_id_databases_all_units": True},
+            stored_states=[
+                StoredState(owner_path="LandscapeServerCharm", content=stored)
+            ],
+        )
+        context = Context(LandscapeServerCharm)
+
+        with context(context.on.update_status(), state) as manager:
+            assert manager.charm._serves_hash_id_databases() == serves
+
+    def test_disabled_by_default(self, popen):
+        """
+        By default, non-leaders do not regenerate the hash-id databases.
+        """
+        relation = self._relation("2025-01-01T00:00:00+00:00")
+        state_in = State(relations=[relation], leader=False)
+        context = Context(LandscapeServerCharm)
+
+        context.run(context.on.relation_changed(relation), state_in)
+
+        popen.assert_not_called()
+
+
+class TestHashIdDatabasesAction:
+    """
+    Tests for the `hash-id-databases` and `hash-id-databases-status` actions.
+    """
+
+    @pytest.fixture(autouse=True)
+    def not_running(self):
+        with patch("charm.hash_id_databases_running", return_value=False) as m:
+            yield m
+
+    @patch("charm.read_hash_id_databases_status")
+    @patch("charm.subprocess.Popen")
+    def test_streams_progress(self, popen_mock, status_mock):
+        """
+        The regeneration output is streamed to the action log and the status of the
+        run is returned. The leader publishes the new generation to its peers.
+        """
+        popen_mock.return_value.stdout = ["Generating noble\n", "Generating jammy\n"]
+        popen_mock.return_value.wait.return_value = 0
+        status_mock.return_value = {
+            "state": "succeeded",
+            "duration": 12.5,
+            "last-success": "2025-01-01T00:00:00+00:00",
+        }
+        relation = PeerRelation("replicas")
+        context = Context(LandscapeServerCharm)
+        state_in = State(
+            relations=[relation], leader=True, unit_status=ActiveStatus("Unit is ready")
+        )
+
+        state_out = context.run(context.on.action("hash-id-databases"), state_in)
+
+        popen_mock.assert_called_once_with(
+            ["python3", HASH_ID_DATABASES_RUNNER],
+            stdout=ANY,
+            stderr=ANY,
+            text=True,
+            env=ANY,
+        )
+        assert context.action_logs == [
+            "Running hash_id_databases",
+            "Generating noble",
+            "Generating jammy",
+        ]
+        assert context.action_results["state"] == "succeeded"
+        assert context.action_results["duration"] == "12.5"
+        app_data = state_out.get_relation(relation.id).local_app_data
+        assert app_data["hash-id-databases-generation"] == "2025-01-01T00:00:00+00:00"
+
+    @patch("charm.subprocess.Popen")
+    def test_failure(self, popen_mock):
+        popen_mock.return_value.stdout = []
+        popen_mock.return_value.wait.return_value = 1
+        context = Context(LandscapeServerCharm)
+
+        state = State(unit_status=ActiveStatus("Unit is ready"))
+
+        with pytest.raises(ActionFailed, match="error code 1"):
+            context.run(context.on.action("hash-id-databases"), state)
+
+    @pytest.mark.parametrize("background", [False, True])
+    @patch("charm.subprocess.Popen", side_effect=FileNotFoundError("python3"))
+    def test_runner_not_started(self, popen_mock, tmp_path, background):
+        context = Context(LandscapeServerCharm)
+        state = State(unit_status=ActiveStatus("Unit is ready"))
+
+        with (
+            patch("charm.HASH_ID_DATABASES_LOG_FILE", new=str(tmp_path / "log")),
+            pytest.raises(
+                ActionFailed, match="hash_id_databases failed: python3"
+            ) as failed,
+        ):
+            context.run(
+                context.on.action(
+                    "hash-id-databases", params={"background": background}
+                ),
+                state,
+            )
+
+        assert failed.value.state.unit_status == ActiveStatus("Unit is ready")
+
+    @patch("charm.subprocess.Popen")
+    def test_background(self, popen_mock, tmp_path):
+        """
+        With `background=true`, the regeneration is detached from the action.
+        """
+        log_file = tmp_path / "hash-id-databases.log"
+        context = Context(LandscapeServerCharm)
+
+        with patch("charm.HASH_ID_DATABASES_LOG_FILE", new=str(log_file)):
+            context.run(
+                context.on.action("hash-id-databases", params={"background": True}),
+                State(),
+            )
+
+        popen_mock.assert_called_once_with(
+            ["python3", HASH_ID_DATABASES_RUNNER],
+            stdout=ANY,
+            stderr=ANY,
+            env=ANY,
+            start_new_session=True,
+        )
+        assert context.action_results["state"] == "started"
+
+    @patch("charm.subprocess.Popen")
+    def test_already_running(self, popen_mock, not_running):
+        """
+        A second regeneration cannot start while one is in progress.
+        """
+        not_running.return_value = True
+        context = Context(LandscapeServerCharm)
+
+        with pytest.raises(ActionFailed, match="already in progress"):
+            context.run(context.on.action("hash-id-databases"), State())
+
+        popen_mock.assert_not_called()
+
+    @patch("charm.read_hash_id_databases_status")
+    def test_status(self, status_mock):
+        status_mock.return_value = {
+            "state": "failed",
+            "returncode": 1,
+            "finished": "2025-01-01T00:00:00+00:00",
+        }
+        context = Context(LandscapeServerCharm)
+
+        context.run(context.on.action("hash-id-databases-status"), State())
+
+        assert context.action_results == {
+            "state": "failed",
+            "returncode": "1",
+            "finished": "2025-01-01T00:00:00+00:00",
+        }
+
+
+class TestDbMaintenanceAction:
+    """
+    Tests for the `db-maintenance` action.
+    """
+
+    SERVICE_CONF = """\
+[stores]
+host = db.test:5432
+user = landscape
+password = app-secret
+main = landscape-standalone-main
+package-host = db2.test:5433
+
+[schema]
+store_user = schema
+store_password = schema-secret
+"""
+
+    PARAMS = {"reindex": False, "concurrency": 2, "timeout": 60}
+
+    @patch("charm.maintain_table")
+    @patch("charm.get_table_bloat")
+    def test_reports_tables(self, bloat_mock, maintain_mock, capture_service_conf):
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+        bloat_mock.side_effect = lambda db: [
+            TableMaintenance(table="public.a", size=0, dead_tuples_ratio=0.5)
+        ]
+
+        def maintain(db, table, reindex, timeout):
+            table.vacuum_seconds = 1.5
+            return table
+
+        maintain_mock.side_effect = maintain
+        context = Context(LandscapeServerCharm)
+
+        context.run(
+            context.on.action(
+                "db-maintenance", params={"stores": "main,package", **self.PARAMS}
+            ),
+            State(),
+        )
+
+        assert context.action_results == {
+            "main": "public.a: size=0MiB dead=50.0% vacuum=1.5s",
+            "package": "public.a: size=0MiB dead=50.0% vacuum=1.5s",
+        }
+        main, package = sorted(
+            (c.args[0] for c in maintain_mock.call_args_list),
+            key=lambda db: db.database,
+        )
+        assert (main.host, main.username, main.password) == (
+            "db.test",
+            "schema",
+            "schema-secret",
+        )
+        assert (package.host, package.port, package.database) == (
+            "db2.test",
+            "5433",
+            "landscape-standalone-package",
+        )
+
+    @patch("charm.maintain_table")
+    @patch("charm.get_table_bloat")
+    def test_failed_tables(self, bloat_mock, maintain_mock, capture_service_conf):
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+        bloat_mock.return_value = [
+            TableMaintenance(table="public.a", size=0, dead_tuples_ratio=0.5)
+        ]
+
+        def maintain(db, table, reindex, timeout):
+            table.error = "timed out"
+            return table
+
+        maintain_mock.side_effect = maintain
+        context = Context(LandscapeServerCharm)
+
+        with pytest.raises(ActionFailed, match="failed on 1 tables"):
+            context.run(
+                context.on.action(
+                    "db-maintenance", params={"stores": "main", **self.PARAMS}
+                ),
+                State(),
+            )
+
+    def test_unknown_store(self, capture_service_conf):
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+        context = Context(LandscapeServerCharm)
+
+        with pytest.raises(ActionFailed, match="Unknown stores: mian"):
+            context.run(
+                context.on.action(
+                    "db-maintenance", params={"stores": "mian", **self.PARAMS}
+                ),
+                State(),
+            )
+
+    def test_not_configured(self):
+        context = Context(LandscapeServerCharm)
+
+        with pytest.raises(ActionFailed, match="not been configured"):
+            context.run(context.on.action("db-maintenance"), State())
+
+
+class TestSlowQueriesAction:
+    """
+    Tests for the `slow-queries` action.
+    """
+
+    SERVICE_CONF = TestDbMaintenanceAction.SERVICE_CONF
+
+    @staticmethod
+    def _query(database: str, total_ms: float, mean_ms: float) -> SlowQuery:
+        return SlowQuery(
+            database=database,
+            calls=1,
+            total_ms=total_ms,
+            mean_ms=mean_ms,
+            rows=1,
+            query="SELECT 1",
+        )
+
+    @patch("charm.reset_pg_stat_statements")
+    @patch("charm.get_slow_queries")
+    @patch("charm.enable_pg_stat_statements", return_value=True)
+    def test_reports_queries(
+        self, enable_mock, slow_queries_mock, reset_mock, capture_service_conf
+    ):
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+
+        def slow_queries(db, databases, order_by, limit):
+            if db.host == "db2.test":
+                return [self._query("landscape-standalone-package", 30.0, 30.0)]
+            return [
+                self._query("landscape-standalone-main", 50.0, 5.0),
+                self._query("landscape-standalone-main", 10.0, 10.0),
+            ]
+
+        slow_queries_mock.side_effect = slow_queries
+        context = Context(LandscapeServerCharm)
+
+        context.run(
+            context.on.action("slow-queries", params={"limit": 2, "reset": False}),
+            State(),
+        )
+
+        assert enable_mock.call_count == 2
+        hosts = {c.args[0].host: c.args[1] for c in slow_queries_mock.call_args_list}
+        assert "landscape-standalone-package" not in hosts["db.test"]
+        assert hosts["db2.test"] == ["landscape-standalone-package"]
+        assert context.action_results == {
+            "by-total-time": (
+                "landscape-standalone-main: calls=1 total=50.0ms mean=5.0ms "
+                "rows=1 SELECT 1\n"
+                "landscape-standalone-package: calls=1 total=30.0ms mean=30.0ms "
+                "rows=1 SELECT 1"
+            ),
+            "by-mean-time": (
+                "landscape-standalone-package: calls=1 total=30.0ms mean=30.0ms "
+                "rows=1 SELECT 1\n"
+                "landscape-standalone-main: calls=1 total=10.0ms mean=10.0ms "
+                "rows=1 SELECT 1"
+            ),
+        }
+        reset_mock.assert_not_called()
+
+    @patch("charm.reset_pg_stat_statements")
+    @patch("charm.get_slow_queries", return_value=[])
+    @patch("charm.enable_pg_stat_statements", return_value=False)
+    def test_reset(self, _, __, reset_mock, capture_service_conf):
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+        context = Context(LandscapeServerCharm)
+
+        context.run(
+            context.on.action("slow-queries", params={"limit": 10, "reset": True}),
+            State(),
+        )
+
+        assert reset_mock.call_count == 2
+        assert any("Could not create" in log for log in context.action_logs)
+
+    @patch("charm.reset_pg_stat_statements")
+    @patch("charm.get_slow_queries", return_value=[])
+    @patch("charm.enable_pg_stat_statements", return_value=True)
+    def test_store_credentials(
+        self, enable_mock, slow_queries_mock, reset_mock, capture_service_conf
+    ):
+        """
+        Stores reached with their own user are queried with their credentials,
+        and each server is still reset once.
+        """
+        capture_service_conf.tempfile.write_text(
+            self.SERVICE_CONF.replace(
+                "[stores]\n",
+                "[stores]\naccount-1-user = acct\naccount-1-password = acct-secret\n",
+            )
+        )
+        context = Context(LandscapeServerCharm)
+
+        context.run(
+            context.on.action("slow-queries", params={"limit": 10, "reset": True}),
+            State(),
+        )
+
+        assert enable_mock.call_count == 3
+        logins = {
+            (c.args[0].host, c.args[0].username, c.args[0].password): c.args[1]
+            for c in slow_queries_mock.call_args_list
+        }
+        assert logins[("db.test", "acct", "acct-secret")] == [
+            "landscape-standalone-account-1"
+        ]
+        assert (
+            "landscape-standalone-account-1"
+            not in logins[("db.test", "schema", "schema-secret")]
+        )
+        assert logins[("db2.test", "schema", "schema-secret")] == [
+            "landscape-standalone-package"
+        ]
+        assert sorted(c.args[0].host for c in reset_mock.call_args_list) == [
+            "db.test",
+            "db2.test",
+        ]
+
+    @patch(
+        "charm.get_slow_queries",
+        side_effect=CalledProcessError(1, ["psql", "-c", "SELECT"]),
+    )
+    @patch("charm.enable_pg_stat_statements", return_value=False)
+    def test_not_loaded(self, _, __, capture_service_conf):
+        capture_service_conf.tempfile.write_text(self.SERVICE_CONF)
+        context = Context(LandscapeServerCharm)
+
+        with pytest.raises(ActionFailed, match="shared_preload_libraries"):
+            context.run(
+                context.on.action("slow-queries", params={"limit": 10, "reset": False}),
+                State(),
+            )
+
+
+class TestHookStats:
+    """
+    Tests for recording hook timings and the `hook-stats` action.
+    """
+
+    @staticmethod
+    def _hook_stats(state: State) -> list[dict]:
+        stored = state.get_stored_state("_stored", owner_path="LandscapeServerCharm")
+        return json.loads(stored.content["hook_stats"])
+
+    def test_records_hooks(self):
+        context = Context(LandscapeServerCharm)
+
+        state = context.run(context.on.update_status(), State())
+        state = context.run(context.on.update_status(), state)
+
+        records = self._hook_stats(state)
+        assert [record["hook"] for record in records] == ["update-status"] * 2
+
+    def test_ring_buffer_bounded(self):
+        """
+        Only the last `HOOK_STATS_SIZE` runs of each hook are kept, so
+        update-status does not evict the other hooks.
+        """
+        records = [{"hook": "install", "time": "", "duration": 1.0, "steps": {}}] + [
+            {"hook": "update-status", "time": "", "duration": 1.0, "steps": {}}
+        ] * HOOK_STATS_SIZE
+        context = Context(LandscapeServerCharm)
+        state = State(
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={"hook_stats": json.dumps(records)},
+                )
+            ],
+        )
+
+        state = context.run(context.on.update_status(), state)
+
+        records = self._hook_stats(state)
+        assert len(records) == HOOK_STATS_SIZE + 1
+        assert records[0]["hook"] == "install"
+        assert records[-1]["hook"] == "update-status"
+        assert records[-1]["time"]
+
+    def test_action_reports_summary(self):
+        records = [
+            {
+                "hook": "config-changed",
+                "time": "",
+                "duration": duration,
+                "steps": {"lsctl-restart": duration / 2},
+            }
+            for duration in (4.0, 2.0)
+        ] + [{"hook": "update-status", "time": "", "duration": 0.5, "steps": {}}]
+        context = Context(LandscapeServerCharm)
+        state = State(
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={"hook_stats": json.dumps(records)},
+                )
+            ],
+        )
+
+        context.run(context.on.action("hook-stats"), state)
+
+        assert context.action_results == {
+            "config-changed": {
+                "duration": "p50=2.00s p95=4.00s max=4.00s n=2",
+                "steps": {"lsctl-restart": "p50=1.00s p95=2.00s max=2.00s n=2"},
+            },
+            "update-status": {"duration": "p50=0.50s p95=0.50s max=0.50s n=1"},
+        }
+
+
+class TestCharmMetrics:
+    """
+    Tests for exporting the charm's own metrics.
+    """
+
+    @staticmethod
+    def _stored(state: State) -> dict:
+        return state.get_stored_state(
+            "_stored", owner_path="LandscapeServerCharm"
+        ).content
+
+    def test_writes_metrics(self, charm_metrics_file):
+        context = Context(LandscapeServerCharm)
+
+        state = context.run(context.on.update_status(), State())
+        state = context.run(context.on.update_status(), state)
+
+        counters = json.loads(self._stored(state)["charm_metrics"])
+        assert counters["hooks"]["update-status"][0] == 2
+        assert (
+            'landscape_charm_hook_duration_seconds_count{hook="update-status"} 2'
+            in charm_metrics_file.read_text()
+        )
+
+    def test_first_active_and_ready_since(self, charm_metrics_file):
+        """
+        The time the unit first became active and the time each relation became
+        ready are recorded once, and forgotten when a relation is no longer ready.
+        """
+        context = Context(LandscapeServerCharm)
+        state = State(
+            unit_status=ActiveStatus("Unit is ready"),
+            stored_states=[
+                StoredState(
+                    owner_path="LandscapeServerCharm",
+                    content={
+                        "installed_at": 100.0,
+                        "ready": {"db": True, "amqp": False, "haproxy": False},
+                        "ready_since": {"amqp": 150.0},
+                    },
+                )
+            ],
+        )
+
+        with patch("charm.time.time", return_value=200.0):
+            state = context.run(context.on.action("hook-stats"), state)
+
+        stored = self._stored(state)
+        assert stored["first_active_at"] == 200.0
+        assert stored["ready_since"] == {"db": 200.0}
+
+        metrics = charm_metrics_file.read_text()
+        assert "landscape_charm_install_to_active_seconds 100.0" in metrics
+        assert 'landscape_charm_relation_ready{relation="amqp"} 0' in metrics
+        assert (
+            'landscape_charm_relation_ready_timestamp_seconds{relation="db"} 200.0'
+            in metrics
+        )
+
+
+class TestHashIdDatabasesSchedule:
+    """
+    Tests for the `hash_id_databases_schedule` configuration.
+    """
+
+    def test_writes_cron_on_leader(self, tmp_path):
+        cron = tmp_path / "cron"
+        context = Context(LandscapeServerCharm)
+        state = State(
+            config={"hash_id_databases_schedule": "@weekly"},
+            relations=[PeerRelation("replicas")],
+            leader=True,
+        )
 
-        with patch("charm.generate_secret_token") as mock_token:
-            token = "mytestsecrettoken"
-            mock_token.return_value = token
-            state_out = context.run(context.on.config_changed(), state_in)
-        app_data = state_out.get_relation(relation.id).local_app_data
-        assert app_data.get("secret-token") == token
+        with patch("charm.HASH_ID_DATABASES_CRON", new=str(cron)):
+            context.run(context.on.config_changed(), state)
 
-        after_config = capture_service_conf.get_config()
-        assert after_config["landscape"].get("secret-token") == token
+        assert f"@weekly root python3 {HASH_ID_DATABASES_RUNNER}" in cron.read_text()
 
-    def test_follower_waits_if_not_provided(self, capture_service_conf):
+    @pytest.mark.parametrize("all_units", [False, True])
+    def test_removes_cron_on_non_leader(self, tmp_path, all_units):
         """
-        If the `secret_token` is not provided locally nor in a replica and we
-        are not the leader unit, do nothing. We wait for the leader to generate
-        a token.
+        Non-leaders have no schedule, even with `hash_id_databases_all_units`, as
+        they follow the generations of the leader's scheduled runs.
         """
-        relation = PeerRelation("replicas", peers_data={})
-        state = State(relations=[relation], config={}, leader=False)
+        cron = tmp_path / "cron"
+        cron.write_text("old")
         context = Context(LandscapeServerCharm)
+        state = State(
+            config={
+                "hash_id_databases_schedule": "@weekly",
+                "hash_id_databases_all_units": all_units,
+            },
+            leader=False,
+        )
 
-        before_config = capture_service_conf.get_config()
-        assert "landscape" not in before_config.sections()
+        with patch("charm.HASH_ID_DATABASES_CRON", new=str(cron)):
+            context.run(context.on.config_changed(), state)
 
-        context.run(context.on.config_changed(), state)
+        assert not cron.exists()
 
-        after_config = capture_service_conf.get_config()
-        assert after_config["landscape"].get("secret-token", None) is None
+    def test_default_path(self):
+        assert HASH_ID_DATABASES_CRON == "/etc/cron.d/landscape-hash-id-databases"
 
 
-class TestGetCookieEncryptionKey:
+class TestHashIdDatabasesResource:
     """
-    Tests for `on.config_changed` hooks that affect the `cookie-encryption-key`
-    configuration.
+    Tests for the `hash-id-databases` charm resource.
     """
 
-    def test_provided_in_config(self, capture_service_conf):
+    @patch("charm.user_exists")
+    @patch("charm.write_hash_id_databases")
+    def test_upgrade_unpacks_resource(self, write_mock, user_exists_mock, tmp_path):
         """
-        If the `cookie_encryption_key` is provided in the configuration for this unit,
-        return it.
+        If a `hash-id-databases` resource is attached, unpack it on upgrade and
+        remember it, so the same resource is not unpacked again.
         """
-        cookie_encryption_key = "testcookieencryptionkeylotsofentropy"
+        user_exists_mock.return_value = Mock(spec_set=struct_passwd, pw_uid=1000)
+        archive = tmp_path / "hash-id-databases.tar.gz"
+        archive.write_bytes(b"archive")
         context = Context(LandscapeServerCharm)
-        state = State(config={"cookie_encryption_key": cookie_encryption_key})
-        context.run(context.on.config_changed(), state)
-
-        config = capture_service_conf.get_config()
-        assert config["api"]["cookie-encryption-key"] == cookie_encryption_key
-
-    def test_provided_in_replica(self, capture_service_conf):
-        """
-        If the `cookie_encryption_key` is not provided in the configuration
-        for this unit and there is a replica, return the encryption key from
-        it.
-        """
-        cookie_encryption_key = "testcookieencryptionkeylotsofentropy"
-        relation = PeerRelation(
-            "replicas", local_app_data={"cookie-encryption-key": cookie_encryption_key}
+        state_in = State(
+            resources={Resource(name="hash-id-databases", path=archive)},
         )
-        state = State(relations=[relation])
-        context = Context(LandscapeServerCharm)
 
-        context.run(context.on.config_changed(), state)
+        state_out = context.run(context.on.upgrade_charm(), state_in)
+        context.run(context.on.upgrade_charm(), state_out)
 
-        config = capture_service_conf.get_config()
-        assert config["api"]["cookie-encryption-key"] == cookie_encryption_key
+        write_mock.assert_called_once_with(str(archive), 1000, ANY)
 
-    def test_prefer_local_config(self, capture_service_conf):
+    @patch("charm.user_exists")
+    @patch("charm.write_hash_id_databases")
+    def test_resource_digest(self, write_mock, user_exists_mock, tmp_path):
         """
-        If the `cookie_encryption_key` is provided in a replica but also
-        locally, prefer the local version and return it.
+        The resource is hashed a chunk at a time.
         """
-        local_cookie_encryption_key = "testcookieencryptionkeylotsofentropy"
-        peer_cookie_encryption_key = "thecookieencryptionkeyfromthepeerrelation"
-        relation = PeerRelation(
-            "replicas",
-            peers_data={1: {"cookie-encryption-key": peer_cookie_encryption_key}},
-        )
-        state = State(
-            relations=[relation],
-            config={"cookie_encryption_key": local_cookie_encryption_key},
-        )
+        archive = tmp_path / "hash-id-databases.tar.gz"
+        archive.write_bytes(b"archive contents")
         context = Context(LandscapeServerCharm)
+        state_in = State(
+            resources={Resource(name="hash-id-databases", path=archive)},
+        )
 
-        context.run(context.on.config_changed(), state)
+        with patch("charm.RESOURCE_CHUNK_SIZE", new=3):
+            state_out = context.run(context.on.upgrade_charm(), state_in)
 
-        config = capture_service_conf.get_config()
-        assert config["api"]["cookie-encryption-key"] == local_cookie_encryption_key
+        stored = state_out.get_stored_state(
+            "_stored", owner_path="LandscapeServerCharm"
+        ).content
+        assert stored["hash_id_databases_resource"] == (
+            hashlib.sha256(b"archive contents").hexdigest()
+        )
 
-    def test_leader_generates_if_not_provided(self, capture_service_conf):
+    @patch("charm.user_exists")
+    @patch("charm.write_hash_id_databases")
+    def test_upgrade_keeps_blocked_status(self, write_mock, user_exists_mock, tmp_path):
         """
-        If the `cookie_encryption_key` is not provided locally nor in a replica
-        and we are the leader unit, generate a new cookie encryption key and
-        put it into the peer app relation databag.
+        Installing the resource on upgrade does not clear a blocked status.
         """
-        relation = PeerRelation("replicas", peers_data={})
-        state_in = State(relations=[relation], config={}, leader=True)
+        archive = tmp_path / "hash-id-databases.tar.gz"
+        archive.write_bytes(b"archive")
         context = Context(LandscapeServerCharm)
+        blocked = BlockedStatus("Failed schema migration")
+        state_in = State(
+            resources={Resource(name="hash-id-databases", path=archive)},
+            unit_status=blocked,
+        )
 
-        before_config = capture_service_conf.get_config()
-        assert "api" not in before_config.sections()
-
-        with patch(
-            "charm.generate_cookie_encryption_key"
-        ) as mock_cookie_encryption_key:
-            cookie_encryption_key = "mytestcookieencryptionkey"
-            mock_cookie_encryption_key.return_value = cookie_encryption_key
-            state_out = context.run(context.on.config_changed(), state_in)
-
-        app_data = state_out.get_relation(relation.id).local_app_data
-        assert app_data.get("cookie-encryption-key") == cookie_encryption_key
+        state_out = context.run(context.on.upgrade_charm(), state_in)
 
-        after_config = capture_service_conf.get_config()
-        assert after_config["api"].get("cookie-encryption-key") == cookie_encryption_key
+        write_mock.assert_called_once()
+        assert state_out.unit_status == blocked
 
-    def test_follower_waits_if_not_provided(self, capture_service_conf):
+    @patch("charm.write_hash_id_databases")
+    def test_empty_resource(self, write_mock, tmp_path):
         """
-        If the `cookie_encryption_key` is not provided locally nor in a replica
-        and we are not the leader unit, do nothing. We wait for the leader to
-        generate a cookie encryption key.
+        An empty resource is a placeholder and is not unpacked.
         """
-        relation = PeerRelation("replicas", peers_data={})
-        state = State(relations=[relation], config={}, leader=False)
+        archive = tmp_path / "hash-id-databases.tar.gz"
+        archive.write_bytes(b"")
         context = Context(LandscapeServerCharm)
+        state_in = State(
+            resources={Resource(name="hash-id-databases", path=archive)},
+        )
 
-        before_config = capture_service_conf.get_config()
-        assert "api" not in before_config.sections()
-
-        context.run(context.on.config_changed(), state)
+        context.run(context.on.upgrade_charm(), state_in)
 
-        after_config = capture_service_conf.get_config()
-        assert after_config["api"].get("cookie-encryption-key", None) is None
+        write_mock.assert_not_called()
 
 
 class TestCharm(unittest.TestCase):
@@ -604,7 +2512,7 @@ class TestCharm(unittest.TestCase):
 
         patches = patch.multiple(
             "charm",
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             apt=DEFAULT,
             prepend_default_settings=DEFAULT,
             update_service_conf=DEFAULT,
@@ -615,10 +2523,12 @@ class TestCharm(unittest.TestCase):
         with patches as mocks:
             harness.begin_with_initial_hooks()
 
-        mocks["check_call"].assert_any_call(
-            ["add-apt-repository", "-y", ppa], env=env_variables
+        mocks["run_command"].assert_any_call(
+            ["add-apt-repository", "-y", ppa], env=env_variables, retries=APT_RETRIES
+        )
+        mocks["run_command"].assert_any_call(
+            ["apt-mark", "hold", "landscape-server"], retries=APT_RETRIES
         )
-        mocks["check_call"].assert_any_call(["apt-mark", "hold", "landscape-server"])
         mocks["apt"].add_package.assert_called_once_with(
             ["landscape-server", "landscape-hashids"],
             update_cache=True,
@@ -634,7 +2544,7 @@ class TestCharm(unittest.TestCase):
         harness = Harness(LandscapeServerCharm)
         patches = patch.multiple(
             "charm",
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             apt=DEFAULT,
             update_service_conf=DEFAULT,
         )
@@ -652,7 +2562,7 @@ class TestCharm(unittest.TestCase):
         harness = Harness(LandscapeServerCharm)
         patches = patch.multiple(
             "charm",
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             apt=DEFAULT,
             update_service_conf=DEFAULT,
         )
@@ -675,7 +2585,7 @@ class TestCharm(unittest.TestCase):
         )
 
         with (
-            patch("charm.check_call") as mock,
+            patch("charm.run_command") as mock,
             patch("charm.update_service_conf"),
             patch("charm.apt"),
         ):
@@ -684,16 +2594,16 @@ class TestCharm(unittest.TestCase):
 
     @patch("charm.get_modified_env_vars", return_value={"PATH": "/usr/bin"})
     def test_migrate_schema_bootstrap_owner_role_flag(self, get_env):
-        with (
-            patch("charm.check_call") as check_call_mock,
-            patch.object(self.harness.charm, "_bootstrap_account"),
-            patch.object(self.harness.charm, "_set_autoregistration"),
-        ):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
+        with patch("charm.run_command") as run_command_mock:
             result = self.harness.charm._migrate_schema_bootstrap("charmed_dba")
 
-        check_call_mock.assert_called_once_with(
+        run_command_mock.assert_called_once_with(
             [SCHEMA_SCRIPT, "--bootstrap", "--db-owner-role", "charmed_dba"],
             env={"PATH": "/usr/bin"},
+            timeout=SCHEMA_TIMEOUT,
+            secret_args=PROXY_SECRET_ARGS,
         )
         self.assertTrue(result)
 
@@ -708,7 +2618,7 @@ class TestCharm(unittest.TestCase):
         harness = Harness(LandscapeServerCharm)
         patches = patch.multiple(
             "charm",
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             apt=DEFAULT,
             update_service_conf=DEFAULT,
             prepend_default_settings=DEFAULT,
@@ -721,8 +2631,8 @@ class TestCharm(unittest.TestCase):
         with patches as mocks:
             harness.begin_with_initial_hooks()
 
-        mocks["check_call"].assert_any_call(
-            ["add-apt-repository", "-y", ppa], env=env_variables
+        mocks["run_command"].assert_any_call(
+            ["add-apt-repository", "-y", ppa], env=env_variables, retries=APT_RETRIES
         )
 
     def test_install_ssl_cert(self):
@@ -732,7 +2642,7 @@ class TestCharm(unittest.TestCase):
 
         patches = patch.multiple(
             "charm",
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             apt=DEFAULT,
             write_ssl_cert=DEFAULT,
             update_service_conf=DEFAULT,
@@ -764,7 +2674,7 @@ class TestCharm(unittest.TestCase):
 
         patches = patch.multiple(
             "charm",
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             apt=DEFAULT,
             write_license_file=DEFAULT,
             prepend_default_settings=DEFAULT,
@@ -788,7 +2698,7 @@ class TestCharm(unittest.TestCase):
         with patch.multiple(
             "charm",
             apt=DEFAULT,
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             update_service_conf=DEFAULT,
             prepend_default_settings=DEFAULT,
             write_license_file=DEFAULT,
@@ -809,7 +2719,7 @@ class TestCharm(unittest.TestCase):
 
         patches = patch.multiple(
             "charm",
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             update_default_settings=DEFAULT,
         )
 
@@ -823,6 +2733,33 @@ class TestCharm(unittest.TestCase):
 
         mock_args = mocks["update_default_settings"].mock_calls[0].args[0]
         self.assertEqual(mock_args["RUN_APPSERVER"], "2")
+        self.assertEqual(mock_args["RUN_JOBHANDLER"], "1")
+        self.assertEqual(mock_args["RUN_ASYNC_FRONTEND"], "1")
+
+    def test_update_ready_status_roles(self):
+        self.harness.charm.unit.status = WaitingStatus()
+        self.harness.update_config({"roles": "background"})
+
+        self.harness.charm._stored.ready.update(
+            {k: True for k in self.harness.charm._stored.ready.keys()}
+        )
+
+        patches = patch.multiple(
+            "charm",
+            run_command=DEFAULT,
+            update_default_settings=DEFAULT,
+        )
+
+        with patches as mocks:
+            self.harness.charm._update_ready_status(restart_services=True)
+
+        mock_args = mocks["update_default_settings"].mock_calls[0].args[0]
+        self.assertEqual(mock_args["RUN_APPSERVER"], "no")
+        self.assertEqual(mock_args["RUN_APISERVER"], "no")
+        self.assertEqual(mock_args["RUN_MSGSERVER"], "no")
+        self.assertEqual(mock_args["RUN_PINGSERVER"], "no")
+        self.assertEqual(mock_args["RUN_JOBHANDLER"], "1")
+        self.assertEqual(mock_args["RUN_ASYNC_FRONTEND"], "1")
 
     def test_update_ready_status_running(self):
         self.harness.charm.unit.status = WaitingStatus()
@@ -847,12 +2784,12 @@ class TestCharm(unittest.TestCase):
 
         patches = patch.multiple(
             "charm",
-            check_call=DEFAULT,
+            run_command=DEFAULT,
             update_default_settings=DEFAULT,
         )
 
         with patches as mocks:
-            mocks["check_call"].side_effect = CalledProcessError(127, "ouch")
+            mocks["run_command"].side_effect = CalledProcessError(127, "ouch")
             self.harness.charm._update_ready_status()
 
         status = self.harness.charm.unit.status
@@ -889,6 +2826,8 @@ class TestCharm(unittest.TestCase):
         self.assertFalse(self.harness.charm._stored.ready["db"])
 
     def test_db_relation_changed_called_process_error(self):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
         mock_event = Mock()
         mock_event.relation.data = {
             mock_event.unit: {
@@ -902,10 +2841,10 @@ class TestCharm(unittest.TestCase):
         }
 
         with (
-            patch("charm.check_call") as check_call_mock,
+            patch("charm.run_command") as run_command_mock,
             patch("settings_files.update_service_conf") as update_service_conf_mock,
         ):
-            check_call_mock.side_effect = CalledProcessError(127, "ouch")
+            run_command_mock.side_effect = CalledProcessError(127, "ouch")
             self.harness.charm._db_relation_changed(mock_event)
 
         status = self.harness.charm.unit.status
@@ -916,6 +2855,7 @@ class TestCharm(unittest.TestCase):
             {
                 "stores": {
                     "host": "1.2.3.4:5678",
+                    "read-only-host": "1.2.3.4:5678",
                     "password": "testpass",
                 },
                 "schema": {
@@ -948,11 +2888,12 @@ class TestCharm(unittest.TestCase):
         )
 
         with (
-            patch("charm.check_call"),
+            patch("charm.run_command") as run_command_mock,
             patch(
                 "settings_files.update_service_conf",
             ) as update_service_conf_mock,
         ):
+            run_command_mock.return_value.stdout = ""
             self.harness.charm._db_relation_changed(mock_event)
             self.harness.update_config({"db_host": "hello", "db_port": "world"})
 
@@ -963,6 +2904,7 @@ class TestCharm(unittest.TestCase):
                 {
                     "stores": {
                         "host": "hello:world",
+                        "read-only-host": "hello:world",
                     },
                 }
             ),
@@ -974,6 +2916,8 @@ class TestCharm(unittest.TestCase):
         If the schema migration doesn't go through on a manual config change,
         then block unit status
         """
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
         mock_event = Mock()
         mock_event.relation.data = {
             mock_event.unit: {
@@ -987,16 +2931,17 @@ class TestCharm(unittest.TestCase):
         }
 
         with (
-            patch("charm.check_call") as check_call_mock,
+            patch("charm.run_command") as run_command_mock,
             patch("settings_files.update_service_conf"),
         ):
+            run_command_mock.return_value.stdout = ""
             self.harness.charm._db_relation_changed(mock_event)
 
         with (
-            patch("charm.check_call") as check_call_mock,
+            patch("charm.run_command") as run_command_mock,
             patch("settings_files.update_service_conf"),
         ):
-            check_call_mock.side_effect = CalledProcessError(127, "ouch")
+            run_command_mock.side_effect = CalledProcessError(127, "ouch")
             self.harness.update_config({"db_host": "hello", "db_port": "world"})
 
         status = self.harness.charm.unit.status
@@ -1004,6 +2949,8 @@ class TestCharm(unittest.TestCase):
 
     @patch("charm.update_service_conf")
     def test_on_db_relation_changed_update_wsl_distribution(self, _):
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
         mock_event = Mock()
         mock_event.relation.data = {
             mock_event.unit: {
@@ -1017,12 +2964,27 @@ class TestCharm(unittest.TestCase):
         }
 
         with (
-            patch("charm.check_call") as check_call_mock,
+            patch("charm.run_command") as run_mock,
             patch("settings_files.update_service_conf"),
         ):
+            run_mock.return_value.stdout = (
+                '{"update-wsl-distributions": {"ok": true, "duration": 1.5}}\n'
+            )
             self.harness.charm._db_relation_changed(mock_event)
 
-        check_call_mock.assert_called_with([UPDATE_WSL_DISTRIBUTIONS_SCRIPT], env=ANY)
+        run_mock.assert_any_call(
+            ["python3", MAINTENANCE_SCRIPT],
+            input='{"update-wsl-distributions": {"schema": null}}',
+            capture_output=True,
+            text=True,
+            env=ANY,
+            timeout=MAINTENANCE_TIMEOUT,
+            check=False,
+        )
+        self.assertIn(
+            ("Maintenance step %s took %.2fs", "update-wsl-distributions", 1.5),
+            [call.args for call in self.log_info_mock.call_args_list],
+        )
 
     @patch("charm.update_service_conf")
     def test_on_db_relation_update_wsl_distributions_fail(self, _):
@@ -1030,6 +2992,8 @@ class TestCharm(unittest.TestCase):
         If the `update_wsl_distributions` script fails,
         it will not result in a `BlockedStatus`.
         """
+        with self.harness.hooks_disabled():
+            self.harness.set_leader()
         mock_event = Mock()
         mock_event.relation.data = {
             mock_event.unit: {
@@ -1043,11 +3007,13 @@ class TestCharm(unittest.TestCase):
         }
 
         with (
-            patch("charm.check_call") as check_call_mock,
+            patch("charm.run_command") as run_mock,
             patch("settings_files.update_service_conf"),
         ):
-            # Let bootstrap account go through
-            check_call_mock.side_effect = [None, CalledProcessError(127, "ouch")]
+            run_mock.return_value.stdout = (
+                '{"update-wsl-distributions": '
+                '{"ok": false, "error": "RuntimeError: ouch", "duration": 0.5}}\n'
+            )
             self.harness.charm._db_relation_changed(mock_event)
 
         status = self.harness.charm.unit.status
@@ -1066,7 +3032,11 @@ class TestCharm(unittest.TestCase):
         )
 
         self.assertIn(
-            ("Failed to update WSL distributions with return code %d", 127),
+            (
+                "Maintenance step %s failed: %s",
+                "update-wsl-distributions",
+                "RuntimeError: ouch",
+            ),
             error_calls,
         )
 
@@ -1381,21 +3351,21 @@ class TestCharm(unittest.TestCase):
         self.assertIsInstance(self.harness.charm.unit.status, BlockedStatus)
 
     def test_action_pause(self):
-        with patch("charm.check_call") as check_call_mock:
+        with patch("charm.run_command") as run_command_mock:
             self.harness.charm._pause(Mock())
 
-        check_call_mock.assert_called_once_with([LSCTL, "stop"], env=ANY)
+        run_command_mock.assert_called_once_with([LSCTL, "stop"], env=ANY)
         self.assertFalse(self.harness.charm._stored.running)
 
     def test_action_pause_CalledProcessError(self):
         self.harness.charm._stored.running = True
         event = Mock(spec_set=ActionEvent)
 
-        with patch("charm.check_call") as check_call_mock:
-            check_call_mock.side_effect = CalledProcessError(127, "ouch")
+        with patch("charm.run_command") as run_command_mock:
+            run_command_mock.side_effect = CalledProcessError(127, "ouch")
             self.harness.charm._pause(event)
 
-        check_call_mock.assert_called_once_with([LSCTL, "stop"], env=ANY)
+        run_command_mock.assert_called_once_with([LSCTL, "stop"], env=ANY)
         self.assertIsInstance(self.harness.charm.unit.status, BlockedStatus)
         self.assertTrue(self.harness.charm._stored.running)
         event.fail.assert_called_once()
@@ -1404,16 +3374,21 @@ class TestCharm(unittest.TestCase):
         self.harness.charm._update_ready_status = Mock()
         event = Mock(spec_set=ActionEvent)
 
-        with (
-            patch("subprocess.run") as run_mock,
-            patch("charm.check_call") as check_call_mock,
-        ):
+        with patch("charm.run_command") as run_command_mock:
             self.harness.charm._resume(event)
 
-        run_mock.assert_called_once_with(
-            [LSCTL, "start"], capture_output=True, text=True, env=ANY
+        run_command_mock.assert_has_calls(
+            [
+                call(
+                    [LSCTL, "start"],
+                    capture_output=True,
+                    text=True,
+                    env=ANY,
+                    check=False,
+                ),
+                call([LSCTL, "status"], env=ANY),
+            ]
         )
-        check_call_mock.assert_called_once_with([LSCTL, "status"], env=ANY)
         self.harness.charm._update_ready_status.assert_called_once()
         self.assertTrue(self.harness.charm._stored.running)
         event.log.assert_called_once()
@@ -1422,21 +3397,32 @@ class TestCharm(unittest.TestCase):
         self.harness.charm._update_ready_status = Mock()
         event = Mock(spec_set=ActionEvent)
 
-        with (
-            patch("subprocess.run") as run_mock,
-            patch("charm.check_call") as check_call_mock,
-        ):
-            run_mock.return_value = Mock(stdout="Everything is on fire")
-            check_call_mock.side_effect = CalledProcessError(127, "uhoh")
+        with patch("charm.run_command") as run_command_mock:
+            run_command_mock.side_effect = [
+                Mock(stdout="Everything is on fire"),
+                CalledProcessError(127, "uhoh"),
+                Mock(),
+            ]
 
             self.harness.charm._resume(event)
 
-        self.assertEqual(2, len(run_mock.mock_calls))
-        run_mock.assert_any_call(
-            [LSCTL, "start"], capture_output=True, text=True, env=ANY
+        self.assertEqual(
+            run_command_mock.call_args_list,
+            [
+                call(
+                    [LSCTL, "start"],
+                    capture_output=True,
+                    text=True,
+                    env=ANY,
+                    check=False,
+                ),
+                call([LSCTL, "status"], env=ANY),
+                call([LSCTL, "stop"], env=ANY, check=False),
+            ],
+        )
+        event.fail.assert_called_once_with(
+            "Failed to start services: Everything is on fire"
         )
-        run_mock.assert_any_call([LSCTL, "stop"], env=ANY)
-        check_call_mock.assert_called_once_with([LSCTL, "status"], env=ANY)
         self.assertIsInstance(self.harness.charm.unit.status, BlockedStatus)
         event.log.assert_called_once()
         event.fail.assert_called_once()
@@ -1446,7 +3432,7 @@ class TestCharm(unittest.TestCase):
         self.harness.charm._stored.running = False
         prev_status = self.harness.charm.unit.status
 
-        with patch("charm.apt", spec_set=apt) as apt_mock, patch("charm.check_call"):
+        with patch("charm.apt", spec_set=apt) as apt_mock, patch("charm.run_command"):
             pkg_mock = Mock()
             apt_mock.DebianPackage.from_apt_cache.return_value = pkg_mock
             self.harness.charm._upgrade(event)
@@ -1476,7 +3462,7 @@ class TestCharm(unittest.TestCase):
         event = Mock(spec_set=ActionEvent)
         self.harness.charm._stored.running = False
 
-        with patch("charm.apt", spec_set=apt) as apt_mock, patch("charm.check_call"):
+        with patch("charm.apt", spec_set=apt) as apt_mock, patch("charm.run_command"):
             pkg_mock = Mock()
             apt_mock.DebianPackage.from_apt_cache.return_value = pkg_mock
             pkg_mock.ensure.side_effect = PackageNotFoundError("ouch")
@@ -1498,7 +3484,7 @@ class TestCharm(unittest.TestCase):
         event.log.assert_called_once()
         event.fail.assert_not_called()
         run_mock.assert_called_once_with(
-            [SCHEMA_SCRIPT], check=True, text=True, env=ANY
+            [SCHEMA_SCRIPT], check=True, text=True, env=ANY, timeout=SCHEMA_TIMEOUT
         )
 
     def test_action_migrate_schema_running(self):
@@ -1526,7 +3512,7 @@ class TestCharm(unittest.TestCase):
         event.log.assert_called_once()
         event.fail.assert_called_once()
         run_mock.assert_called_once_with(
-            [SCHEMA_SCRIPT], check=True, text=True, env=ANY
+            [SCHEMA_SCRIPT], check=True, text=True, env=ANY, timeout=SCHEMA_TIMEOUT
         )
         self.assertIsInstance(self.harness.charm.unit.status, BlockedStatus)
 
@@ -1571,6 +3557,23 @@ class TestCharm(unittest.TestCase):
         for service in LEADER_SERVICES:
             self.assertNotIn(service, event_data["monitors"])
 
+    def test_nrpe_external_master_relation_joined_roles(self):
+        mock_event = Mock()
+        unit = self.harness.charm.unit
+        mock_event.relation.data = {unit: {}}
+
+        with patch("charm.update_service_conf"):
+            self.harness.update_config({"roles": "message"})
+
+        self.harness.charm._nrpe_external_master_relation_joined(mock_event)
+
+        monitors = mock_event.relation.data[unit]["monitors"]
+
+        self.assertIn("landscape-msgserver", monitors)
+        self.assertIn("landscape-pingserver", monitors)
+        self.assertNotIn("landscape-appserver", monitors)
+        self.assertNotIn("landscape-job-handler", monitors)
+
     def test_nrpe_external_master_relation_joined_cfgs_exist(self):
         mock_event = Mock()
         unit = self.harness.charm.unit
@@ -1697,9 +3700,92 @@ class TestCharm(unittest.TestCase):
             }
         )
 
+    def test_on_replicas_relation_changed_non_leader_local_package_search(self):
+        """
+        If `package_search_mode` is `local`, non-leaders point package-search at
+        their own service instead of the leader.
+        """
+        self.harness.charm._update_nrpe_checks = Mock()
+        self.harness.hooks_disabled()
+        self.harness.update_config({"package_search_mode": "local"})
+        relation_id = self.harness.add_relation("replicas", "landscape-server")
+
+        with patch("charm.update_service_conf") as mock_update_conf:
+            self.harness.update_relation_data(
+                relation_id, "landscape-server", {"leader-ip": "test"}
+            )
+
+        mock_update_conf.assert_called_once_with(
+            {
+                "package-search": {
+                    "host": "localhost",
+                },
+            }
+        )
+
+    def test_on_replicas_relation_changed_non_web_local_package_search(self):
+        """
+        Units without the web role do not run package-search, so they keep
+        pointing at the leader in `local` mode.
+        """
+        self.harness.charm._update_nrpe_checks = Mock()
+        self.harness.hooks_disabled()
+        self.harness.update_config(
+            {"package_search_mode": "local", "roles": "message,background"}
+        )
+        relation_id = self.harness.add_relation("replicas", "landscape-server")
+
+        with patch("charm.update_service_conf") as mock_update_conf:
+            self.harness.update_relation_data(
+                relation_id, "landscape-server", {"leader-ip": "test"}
+            )
+
+        mock_update_conf.assert_called_once_with(
+            {
+                "package-search": {
+                    "host": "test",
+                },
+            }
+        )
+
+    def test_update_ready_status_local_package_search(self):
+        self.harness.charm.unit.status = WaitingStatus()
+        self.harness.update_config({"package_search_mode": "local"})
+
+        self.harness.charm._stored.ready.update(
+            {k: True for k in self.harness.charm._stored.ready.keys()}
+        )
+
+        patches = patch.multiple(
+            "charm",
+            run_command=DEFAULT,
+            update_default_settings=DEFAULT,
+        )
+
+        with patches as mocks:
+            self.harness.charm._update_ready_status(restart_services=True)
+
+        mock_args = mocks["update_default_settings"].mock_calls[0].args[0]
+        self.assertEqual(mock_args["RUN_PACKAGESEARCH"], "yes")
+        self.assertEqual(mock_args["RUN_PACKAGEUPLOADSERVER"], "no")
+        self.assertEqual(mock_args["RUN_CRON"], "no")
+
+    def test_nrpe_external_master_relation_joined_local_package_search(self):
+        mock_event = Mock()
+        unit = self.harness.charm.unit
+        mock_event.relation.data = {unit: {}}
+
+        with patch("charm.update_service_conf"):
+            self.harness.update_config({"package_search_mode": "local"})
+
+        self.harness.charm._nrpe_external_master_relation_joined(mock_event)
+
+        monitors = mock_event.relation.data[unit]["monitors"]
+
+        self.assertIn("landscape-package-search", monitors)
+        self.assertNotIn("landscape-package-upload", monitors)
+
 
-# TODO fix from broken commit.
-@unittest.skip("Broken in `de29548e2b09c71db3a55f606ab318b5ea25550d`")
 class TestBootstrapAccount(unittest.TestCase):
     def setUp(self):
         self.harness = Harness(LandscapeServerCharm)
@@ -1716,7 +3802,15 @@ class TestBootstrapAccount(unittest.TestCase):
         grp_mock = patch("charm.group_exists").start()
         grp_mock.return_value = Mock(spec_set=struct_group, gr_gid=1000)
 
+        patch.multiple(
+            "charm",
+            service_pause=DEFAULT,
+            service_resume=DEFAULT,
+            service_running=DEFAULT,
+        ).start()
+
         self.process_mock = patch("subprocess.run").start()
+        self.process_mock.return_value.stdout = "{}"
         self.log_mock = patch("charm.logger.error").start()
         self.log_info_mock = patch("charm.logger.info").start()
 
@@ -1773,7 +3867,7 @@ class TestBootstrapAccount(unittest.TestCase):
         )
         self.assertIn(
             self.harness.charm._stored.default_root_url,
-            self.process_mock.call_args.args[0],
+            self.process_mock.call_args.kwargs["input"],
         )
 
     @patch("charm.update_service_conf")
@@ -1789,7 +3883,7 @@ class TestBootstrapAccount(unittest.TestCase):
                 "root_url": config_root_url,
             }
         )
-        self.assertIn(config_root_url, self.process_mock.call_args.args[0])
+        self.assertIn(config_root_url, self.process_mock.call_args.kwargs["input"])
 
     @patch("charm.update_service_conf")
     def test_bootstrap_account_runs_once_with_correct_args(self, _):
@@ -1797,7 +3891,10 @@ class TestBootstrapAccount(unittest.TestCase):
         Test that bootstrap account runs with correct args and that it can't
         run again after a successful run
         """
-        self.process_mock.return_value.returncode = 0  # Success
+        self.process_mock.return_value.stdout = (
+            '{"bootstrap-account": {"ok": true, "duration": 1.0}, '
+            '"autoregistration": {"ok": true, "duration": 1.0}}'
+        )
         admin_email = "hello@ubuntu.com"
         admin_name = "Hello Ubuntu"
         admin_password = "password"
@@ -1811,7 +3908,6 @@ class TestBootstrapAccount(unittest.TestCase):
         self.harness.update_config(config)
         self.assertEqual(
             [
-                "/opt/canonical/landscape/bootstrap-account",
                 "--admin_email",
                 admin_email,
                 "--admin_name",
@@ -1821,7 +3917,9 @@ class TestBootstrapAccount(unittest.TestCase):
                 "--root_url",
                 root_url,
             ],
-            self.process_mock.call_args.args[0],
+            json.loads(self.process_mock.call_args.kwargs["input"])[
+                "bootstrap-account"
+            ]["args"],
         )
         self.harness.update_config(config)
         self.process_mock.assert_called_once()
@@ -1832,7 +3930,9 @@ class TestBootstrapAccount(unittest.TestCase):
         If there's an error ensure that bootstrap account runs again and not
         a third time if successful
         """
-        self.process_mock.return_value.returncode = 1  # Error here
+        self.process_mock.return_value.stdout = (
+            '{"bootstrap-account": {"ok": false, "error": "", "duration": 1.0}}'
+        )
         admin_email = "hello@ubuntu.com"
         admin_name = "Hello Ubuntu"
         admin_password = "password"
@@ -1844,10 +3944,18 @@ class TestBootstrapAccount(unittest.TestCase):
             "root_url": root_url,
         }
         self.harness.update_config(config)
-        self.process_mock.return_value.returncode = 0
+        self.process_mock.return_value.stdout = (
+            '{"bootstrap-account": {"ok": true, "duration": 1.0}, '
+            '"autoregistration": {"ok": true, "duration": 1.0}}'
+        )
         self.harness.update_config(config)
         self.harness.update_config(config)  # Third time
-        self.assertEqual(self.process_mock.call_count, 2)
+        bootstrap_calls = [
+            c
+            for c in self.process_mock.call_args_list
+            if "bootstrap-account" in c.kwargs["input"]
+        ]
+        self.assertEqual(len(bootstrap_calls), 2)
 
     @patch("charm.update_service_conf")
     def test_bootstrap_account_cannot_run_if_already_bootstrapped(
@@ -1857,8 +3965,10 @@ class TestBootstrapAccount(unittest.TestCase):
         If user already has created an account outside of the charm,
         then the bootstrap account cannot run again
         """
-        self.process_mock.return_value.returncode = 1  # Error here
-        self.process_mock.return_value.stderr = "DuplicateAccountError"
+        self.process_mock.return_value.stdout = (
+            '{"bootstrap-account": {"ok": false, "duration": 1.0, '
+            '"error": "DuplicateAccountError: hello@ubuntu.com"}}'
+        )
         admin_email = "hello@ubuntu.com"
         admin_name = "Hello Ubuntu"
         admin_password = "password"
@@ -1872,35 +3982,12 @@ class TestBootstrapAccount(unittest.TestCase):
         self.harness.update_config(config)
         self.harness.update_config(config)
         self.harness.update_config(config)  # Third time
-        self.process_mock.assert_called_once()
-
-    @patch("subprocess.run")
-    def test_hash_id_databases(self, run_mock):
-        event = Mock(spec_set=ActionEvent)
-
-        self.harness.charm._hash_id_databases(event)
-
-        run_mock.assert_called_once_with(
-            ["sudo", "-u", "landscape", HASH_ID_DATABASES],
-            check=True,
-            text=True,
-            env=ANY,
-        )
-
-    @patch("subprocess.run")
-    def test_hash_id_databases_error(self, run_mock):
-        event = Mock(spec_set=ActionEvent)
-        run_mock.side_effect = CalledProcessError(127, "ouchie")
-
-        self.harness.charm._hash_id_databases(event)
-
-        run_mock.assert_called_once_with(
-            ["sudo", "-u", "landscape", HASH_ID_DATABASES],
-            check=True,
-            text=True,
-            env=ANY,
-        )
-        event.fail.assert_called_once()
+        bootstrap_calls = [
+            c
+            for c in self.process_mock.call_args_list
+            if "bootstrap-account" in c.kwargs["input"]
+        ]
+        self.assertEqual(len(bootstrap_calls), 1)
 
 
 class TestGetModifiedEnvVars(unittest.TestCase):
@@ -0,0 +1,114 @@
+# Copyright 2025 Canonical Ltd
+
+from unittest.mock import patch
+
+import charm_metrics
+from charm_metrics import (
+    install_metrics_service,
+    METRICS_SERVICE,
+    METRICS_SERVICE_UNIT,
+    render,
+    update_counters,
+    write_metrics,
+)
+from helpers import CommandStats
+
+
+def test_update_counters():
+    counters = {
+        "hooks": {"config-changed": [1, 2.0]},
+        "commands": {
+            "lsctl": {"duration": 1.0, "timeouts": 0, "exit_codes": {"0": 1}},
+        },
+    }
+    record = {
+        "hook": "config-changed",
+        "duration": 3.0,
+        "steps": {"lsctl-restart": 2.5},
+    }
+    command_stats = {
+        "lsctl": CommandStats(runs=2, duration=2.5, exit_codes={0: 1, 1: 1}),
+        "psql": CommandStats(runs=1, duration=30.0, timeouts=1),
+    }
+
+    counters = update_counters(counters, record, command_stats)
+
+    assert counters == {
+        "hooks": {"config-changed": (2, 5.0)},
+        "steps": {"lsctl-restart": (1, 2.5)},
+        "commands": {
+            "lsctl": {"duration": 3.5, "timeouts": 0, "exit_codes": {"0": 2, "1": 1}},
+            "psql": {"duration": 30.0, "timeouts": 1, "exit_codes": {}},
+        },
+    }
+
+
+def test_render():
+    counters = {
+        "hooks": {"install": [1, 120.5]},
+        "steps": {"apt-install": [1, 100.0]},
+        "commands": {
+            "lsctl": {"duration": 3.5, "timeouts": 1, "exit_codes": {"0": 2}},
+        },
+    }
+
+    metrics = render(counters, 1000.0, 1300.0, {"db": True}, {"db": 1250.0})
+
+    assert metrics.endswith("\n")
+    for line in (
+        "# TYPE landscape_charm_hook_duration_seconds summary",
+        'landscape_charm_hook_duration_seconds_count{hook="install"} 1',
+        'landscape_charm_hook_duration_seconds_sum{hook="install"} 120.5',
+        'landscape_charm_step_duration_seconds_sum{step="apt-install"} 100.0',
+        'landscape_charm_command_runs_total{command="lsctl",exit_code="0"} 2',
+        'landscape_charm_command_timeouts_total{command="lsctl"} 1',
+        'landscape_charm_command_duration_seconds_total{command="lsctl"} 3.5',
+        "landscape_charm_install_timestamp_seconds 1000.0",
+        "landscape_charm_install_to_active_seconds 300.0",
+        'landscape_charm_relation_ready{relation="db"} 1',
+        'landscape_charm_relation_ready_timestamp_seconds{relation="db"} 1250.0',
+    ):
+        assert line in metrics.splitlines()
+
+
+def test_render_not_yet_active():
+    metrics = render({}, 1000.0, 0.0, {}, {})
+
+    assert "landscape_charm_install_timestamp_seconds 1000.0" in metrics
+    assert "landscape_charm_install_to_active_seconds" not in metrics
+
+
+def test_render_escapes_labels():
+    counters = {"hooks": {'a"b\\c': [1, 1.0]}}
+
+    metrics = render(counters, 0.0, 0.0, {}, {})
+
+    assert '{hook="a\\"b\\\\c"}' in metrics
+
+
+def test_write_metrics(charm_metrics_file):
+    write_metrics("first\n")
+    write_metrics("second\n")
+
+    assert charm_metrics_file.read_text() == "second\n"
+    assert charm_metrics_file.stat().st_mode & 0o777 == 0o644
+    assert not charm_metrics_file.with_suffix(".txt.tmp").exists()
+
+
+@patch("charm_metrics.service_enable")
+@patch("charm_metrics.daemon_reload")
+def test_install_metrics_service(daemon_reload, service_enable, tmp_path, monkeypatch):
+    """
+    The service unit is only rewritten, and systemd reloaded, when it changes.
+    """
+    unit_file = tmp_path / "landscape-charm-metrics.service"
+    monkeypatch.setattr(charm_metrics, "METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setattr(charm_metrics, "METRICS_SERVICE_FILE", str(unit_file))
+
+    install_metrics_service()
+    install_metrics_service()
+
+    assert unit_file.read_text() == METRICS_SERVICE_UNIT
+    assert (tmp_path / "metrics").is_dir()
+    daemon_reload.assert_called_once_with()
+    service_enable.assert_called_with("--now", METRICS_SERVICE)
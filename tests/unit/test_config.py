@@ -5,7 +5,11 @@ from src.config import (
     DEFAULT_CONFIGURATION,
     get_config_defaults,
     LandscapeCharmConfiguration,
+    PackageSearchMode,
     RedirectHTTPS,
+    Role,
+    SCRAPE_JOBS,
+    Store,
 )
 
 
@@ -19,6 +23,8 @@ def test_defaults():
     assert config.landscape_ppa == "ppa:landscape/self-hosted-beta"
     assert config.landscape_ppa_key == ""
     assert config.worker_counts == 2
+    assert config.job_handler_workers == 1
+    assert config.async_frontend_workers == 1
     assert config.license_file is None
 
     assert config.openid_provider_url is None
@@ -65,6 +71,12 @@ def test_defaults():
 
     assert not config.enable_hostagent_messenger
     assert not config.enable_ubuntu_installer_attach
+    assert config.roles == {Role.WEB, Role.MESSAGE, Role.BACKGROUND}
+    assert config.package_search_mode == PackageSearchMode.LEADER
+    assert config.hash_id_databases_schedule is None
+    assert config.db_store_hosts == {}
+    assert config.db_max_connections == 0
+    assert config.db_connections_per_process == 6
 
 
 @pytest.mark.parametrize(
@@ -152,3 +164,253 @@ def test_oidc_minimum_fields(
             LandscapeCharmConfiguration(**defaults)
     else:
         LandscapeCharmConfiguration(**defaults)
+
+
+@pytest.mark.parametrize(
+    "parameter",
+    ["job_handler_workers", "async_frontend_workers"],
+)
+def test_background_workers_positive(parameter):
+    """
+    The job-handler and async-frontend must run at least one process.
+    """
+    defaults = get_config_defaults()
+    defaults[parameter] = 0
+    with pytest.raises(ValidationError):
+        LandscapeCharmConfiguration(**defaults)
+
+
+@pytest.mark.parametrize(
+    "roles,valid",
+    [
+        ("web", True),
+        ("web, message", True),
+        ("background,message,web", True),
+        ("", False),
+        ("web,frontend", False),
+    ],
+)
+def test_roles(roles, valid):
+    """
+    `roles` is a comma-separated list of known roles with at least one entry.
+    """
+    defaults = get_config_defaults()
+    defaults["roles"] = roles
+
+    if not valid:
+        with pytest.raises(ValidationError):
+            LandscapeCharmConfiguration(**defaults)
+    else:
+        LandscapeCharmConfiguration(**defaults)
+
+
+@pytest.mark.parametrize(
+    "schedule,valid",
+    [
+        ("", True),
+        ("@weekly", True),
+        ("0 3 * * 0", True),
+        ("0 3 * *", False),
+        ("weekly", False),
+    ],
+)
+def test_hash_id_databases_schedule(schedule, valid):
+    """
+    `hash_id_databases_schedule` is empty or a cron schedule.
+    """
+    defaults = get_config_defaults()
+    defaults["hash_id_databases_schedule"] = schedule
+
+    if not valid:
+        with pytest.raises(ValidationError):
+            LandscapeCharmConfiguration(**defaults)
+    else:
+        LandscapeCharmConfiguration(**defaults)
+
+
+@pytest.mark.parametrize(
+    "store_hosts,expected",
+    [
+        ("", {}),
+        (
+            "package=10.0.0.5",
+            {
+                Store.PACKAGE: {
+                    "host": "10.0.0.5",
+                    "port": "",
+                    "user": "",
+                    "password": "",
+                }
+            },
+        ),
+        (
+            "package=pkg:secret@10.0.0.5:5433, resource-1=10.0.0.6",
+            {
+                Store.PACKAGE: {
+                    "host": "10.0.0.5",
+                    "port": "5433",
+                    "user": "pkg",
+                    "password": "secret",
+                },
+                Store.RESOURCE: {
+                    "host": "10.0.0.6",
+                    "port": "",
+                    "user": "",
+                    "password": "",
+                },
+            },
+        ),
+        ("packages=10.0.0.5", None),
+        ("package=", None),
+    ],
+)
+def test_db_store_hosts(store_hosts, expected):
+    """
+    `db_store_hosts` maps known stores to their own PostgreSQL cluster.
+    """
+    defaults = get_config_defaults()
+    defaults["db_store_hosts"] = store_hosts
+
+    if expected is None:
+        with pytest.raises(ValidationError):
+            LandscapeCharmConfiguration(**defaults)
+    else:
+        config = LandscapeCharmConfiguration(**defaults)
+        assert config.db_store_hosts == expected
+
+
+@pytest.mark.parametrize(
+    "session_settings,expected",
+    [
+        ("", {}),
+        (
+            "statement_timeout=60s, knowledge.statement_timeout=0,"
+            "package.work_mem=64MB",
+            {
+                store: {
+                    "statement_timeout": ("0" if store == Store.KNOWLEDGE else "60s"),
+                    **({"work_mem": "64MB"} if store == Store.PACKAGE else {}),
+                }
+                for store in Store
+            },
+        ),
+        (
+            "tcp_keepalives_count=5",
+            {store: {"tcp_keepalives_count": "5"} for store in Store},
+        ),
+        ("search_path=public", None),
+        ("statement_timeout=1; DROP TABLE computer", None),
+        ("tcp_keepalives_count=5s", None),
+        ("packages.work_mem=4MB", None),
+    ],
+)
+def test_db_session_settings(session_settings, expected):
+    """
+    `db_session_settings` maps every store to its validated session settings.
+    """
+    defaults = get_config_defaults()
+    defaults["db_session_settings"] = session_settings
+
+    if expected is None:
+        with pytest.raises(ValidationError):
+            LandscapeCharmConfiguration(**defaults)
+    else:
+        config = LandscapeCharmConfiguration(**defaults)
+        assert config.db_session_settings == expected
+
+
+@pytest.mark.parametrize(
+    "port,networks,expected",
+    [
+        (0, "", []),
+        (8404, "10.0.0.0/24, 192.168.1.5", ["10.0.0.0/24", "192.168.1.5/32"]),
+        (8404, "", None),
+        (8404, "10.0.0.300/24", None),
+        (70000, "10.0.0.0/24", None),
+    ],
+)
+def test_haproxy_stats(port, networks, expected):
+    """
+    The HAProxy statistics frontend must be restricted to valid networks.
+    """
+    defaults = get_config_defaults()
+    defaults["haproxy_stats_port"] = port
+    defaults["haproxy_stats_allowed_networks"] = networks
+
+    if expected is None:
+        with pytest.raises(ValidationError):
+            LandscapeCharmConfiguration(**defaults)
+    else:
+        config = LandscapeCharmConfiguration(**defaults)
+        assert config.haproxy_stats_allowed_networks == expected
+
+
+@pytest.mark.parametrize(
+    "overrides,expected",
+    [
+        ("", {}),
+        (
+            "appserver=2m, pingserver=1h30m,charm=5m",
+            {"appserver": "2m", "pingserver": "1h30m", "charm": "5m"},
+        ),
+        ("landscape=2m", None),
+        ("appserver=2 minutes", None),
+        ("appserver=", None),
+    ],
+)
+def test_prometheus_scrape_interval_overrides(overrides, expected):
+    """
+    `prometheus_scrape_interval_overrides` maps known scrape jobs to valid
+    Prometheus durations.
+    """
+    defaults = get_config_defaults()
+    defaults["prometheus_scrape_interval_overrides"] = overrides
+
+    if expected is None:
+        with pytest.raises(ValidationError):
+            LandscapeCharmConfiguration(**defaults)
+    else:
+        config = LandscapeCharmConfiguration(**defaults)
+        assert config.prometheus_scrape_interval_overrides == expected
+        assert set(config.prometheus_scrape_interval_overrides) <= set(SCRAPE_JOBS)
+
+
+@pytest.mark.parametrize("interval", ["", "1 minute", "m"])
+def test_prometheus_scrape_interval_invalid(interval):
+    defaults = get_config_defaults()
+    defaults["prometheus_scrape_interval"] = interval
+
+    with pytest.raises(ValidationError):
+        LandscapeCharmConfiguration(**defaults)
+
+
+@pytest.mark.parametrize("option", ["prometheus_metric_keep", "prometheus_metric_drop"])
+@pytest.mark.parametrize(
+    "patterns,expected",
+    [
+        ("", []),
+        ("python_gc_.*, up,", ["python_gc_.*", "up"]),
+        ("http_(requests", None),
+        ("http_(?!requests).*", None),
+        ("(?<=http_)requests", None),
+        ("(a)\\1", None),
+        ("(?P<x>a)(?P=x)", None),
+        ("(?>a+)b", None),
+        ("path_\\\\1", ["path_\\\\1"]),
+        ("escaped_\\(?=", ["escaped_\\(?="]),
+    ],
+)
+def test_prometheus_metric_patterns(option, patterns, expected):
+    """
+    The metric keep and drop lists must be valid regular expressions in the RE2
+    syntax of Prometheus.
+    """
+    defaults = get_config_defaults()
+    defaults[option] = patterns
+
+    if expected is None:
+        with pytest.raises(ValidationError):
+            LandscapeCharmConfiguration(**defaults)
+    else:
+        config = LandscapeCharmConfiguration(**defaults)
+        assert getattr(config, option) == expected
@@ -1,8 +1,11 @@
-from subprocess import CalledProcessError
+from subprocess import CalledProcessError, TimeoutExpired
 from unittest import mock
-from unittest.mock import call, Mock, patch
+from unittest.mock import ANY, Mock, patch
 
-from charms.data_platform_libs.v0.data_interfaces import DatabaseCreatedEvent
+from charms.data_platform_libs.v0.data_interfaces import (
+    DatabaseCreatedEvent,
+    DatabaseReadOnlyEndpointsChangedEvent,
+)
 from ops.model import ActiveStatus, MaintenanceStatus
 from ops.testing import Context, Relation, State, StoredState
 import pytest
@@ -12,11 +15,22 @@ from charm import (
 )
 from database import (
     DatabaseConnectionContext,
+    enable_pg_stat_statements,
     execute_psql,
     fetch_postgres_relation_data,
     get_postgres_owner_role_from_version,
-    grant_role,
+    get_slow_queries,
+    get_table_bloat,
+    grant_roles,
+    maintain_table,
+    MAINTENANCE_OPTIONS,
     PostgresRoles,
+    PSQL_TIMEOUT,
+    query_psql,
+    select_read_only_endpoint,
+    set_role_settings,
+    SlowQuery,
+    TableMaintenance,
 )
 
 
@@ -65,6 +79,22 @@ class TestFetchPostgresRelationData:
             version="13.3",
         )
 
+    def test_returns_read_only_endpoints(self):
+        db_manager = mock.Mock()
+        db_manager.fetch_relation_data.return_value = {
+            1: {
+                "endpoints": "1.2.3.4:5432",
+                "read-only-endpoints": "1.2.3.5:5432,1.2.3.6:5432",
+                "username": "landscape",
+                "password": "secret",
+                "version": "14.8",
+            }
+        }
+        with mock.patch("database.logger"):
+            result = fetch_postgres_relation_data(db_manager)
+
+        assert result.read_only_endpoints == "1.2.3.5:5432,1.2.3.6:5432"
+
     def test_returns_empty_context_when_no_data(self):
         db_manager = mock.Mock()
         db_manager.fetch_relation_data.return_value = {}
@@ -113,7 +143,7 @@ class TestDatabaseRelation:
         state_in = self._state(relation=relation, leader=False)
 
         with (
-            patch("charm.update_db_conf") as update_db_conf,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
             patch("charm.fetch_postgres_relation_data") as fetch_mock,
         ):
             fetch_mock.return_value = DatabaseConnectionContext(
@@ -148,13 +178,13 @@ class TestDatabaseRelation:
 
         with (
             patch("charm.fetch_postgres_relation_data") as fetch_mock,
-            patch("charm.update_db_conf") as update_db_conf,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
             patch(
                 "charm.LandscapeServerCharm._migrate_schema_bootstrap",
                 return_value=True,
             ),
             patch(
-                "charm.LandscapeServerCharm._update_wsl_distributions",
+                "charm.LandscapeServerCharm._run_db_maintenance",
                 return_value=True,
             ),
             patch(
@@ -166,7 +196,7 @@ class TestDatabaseRelation:
                     superuser=None,
                 ),
             ),
-            patch("charm.grant_role") as grant_role_mock,
+            patch("charm.grant_roles") as grant_roles_mock,
         ):
             fetch_mock.return_value = DatabaseConnectionContext(
                 host="1.2.3.4",
@@ -190,7 +220,7 @@ class TestDatabaseRelation:
         assert isinstance(status, ActiveStatus)
         assert ready["db"] is False
         update_db_conf.assert_not_called()
-        grant_role_mock.assert_not_called()
+        grant_roles_mock.assert_not_called()
         update_ready.assert_called_once_with()
 
     def test_database_relation_uses_relation_credentials(self):
@@ -201,13 +231,13 @@ class TestDatabaseRelation:
 
         with (
             patch("charm.fetch_postgres_relation_data") as fetch_mock,
-            patch("charm.update_db_conf") as update_db_conf,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
             patch(
                 "charm.LandscapeServerCharm._migrate_schema_bootstrap",
                 return_value=True,
             ) as migrate_mock,
             patch(
-                "charm.LandscapeServerCharm._update_wsl_distributions",
+                "charm.LandscapeServerCharm._run_db_maintenance",
                 return_value=True,
             ),
             patch(
@@ -219,7 +249,7 @@ class TestDatabaseRelation:
                     superuser=None,
                 ),
             ),
-            patch("charm.grant_role") as grant_role_mock,
+            patch("charm.grant_roles") as grant_roles_mock,
         ):
             fetch_mock.return_value = DatabaseConnectionContext(
                 host="1.2.3.4",
@@ -246,13 +276,87 @@ class TestDatabaseRelation:
             user="landscape",
             password="secret",
             schema_password=None,
+            read_only_host=None,
         )
         migrate_mock.assert_called_once_with("postgres")
-        grant_role_mock.assert_not_called()
+        grant_roles_mock.assert_not_called()
         update_ready.assert_called_once_with(restart_services=True)
         assert isinstance(status, ActiveStatus)
         assert ready["db"] is True
 
+    def test_database_relation_read_only_endpoints(self):
+        """
+        The units spread over the read-only endpoints by their unit number.
+        """
+        ctx = Context(LandscapeServerCharm, unit_id=3)
+        relation = Relation("database", remote_app_name="postgresql")
+
+        state_in = self._state(relation=relation, leader=False)
+
+        with (
+            patch("charm.fetch_postgres_relation_data") as fetch_mock,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
+        ):
+            fetch_mock.return_value = DatabaseConnectionContext(
+                host="1.2.3.4",
+                port="5432",
+                username="landscape",
+                password="secret",
+                version="14.8",
+                read_only_endpoints="1.2.3.6:5432,1.2.3.5:5432",
+            )
+
+            with ctx(ctx.on.start(), state_in) as manager:
+                manager.charm.database = Mock()
+                with patch.object(manager.charm, "_update_ready_status"):
+                    manager.charm._database_relation_changed(
+                        mock.create_autospec(DatabaseReadOnlyEndpointsChangedEvent)
+                    )
+
+        update_db_conf.assert_called_once_with(
+            host="1.2.3.4",
+            port="5432",
+            user="landscape",
+            password="secret",
+            schema_password=None,
+            read_only_host="1.2.3.6:5432",
+        )
+
+    @pytest.mark.parametrize("stores_changed", [False, True])
+    def test_database_relation_restarts_on_store_change(self, stores_changed):
+        """
+        A read-only endpoint change only restarts the services of the units whose
+        stores changed.
+        """
+        ctx = Context(LandscapeServerCharm, unit_id=3)
+        relation = Relation("database", remote_app_name="postgresql")
+
+        state_in = self._state(relation=relation, leader=False)
+
+        with (
+            patch("charm.fetch_postgres_relation_data") as fetch_mock,
+            patch("charm.update_db_conf", return_value=stores_changed),
+        ):
+            fetch_mock.return_value = DatabaseConnectionContext(
+                host="1.2.3.4",
+                port="5432",
+                username="landscape",
+                password="secret",
+                version="14.8",
+                read_only_endpoints="1.2.3.6:5432,1.2.3.5:5432,1.2.3.7:5432",
+            )
+
+            with ctx(ctx.on.start(), state_in) as manager:
+                manager.charm.database = Mock()
+                with patch.object(
+                    manager.charm, "_update_ready_status"
+                ) as update_ready_status:
+                    manager.charm._database_relation_changed(
+                        mock.create_autospec(DatabaseReadOnlyEndpointsChangedEvent)
+                    )
+
+        update_ready_status.assert_called_once_with(restart_services=stores_changed)
+
     def test_database_relation_manual_overrides(self):
         ctx = Context(LandscapeServerCharm)
         relation = Relation("database", remote_app_name="postgresql")
@@ -270,13 +374,13 @@ class TestDatabaseRelation:
 
         with (
             patch("charm.fetch_postgres_relation_data") as fetch_mock,
-            patch("charm.update_db_conf") as update_db_conf,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
             patch(
                 "charm.LandscapeServerCharm._migrate_schema_bootstrap",
                 return_value=True,
             ) as migrate_mock,
             patch(
-                "charm.LandscapeServerCharm._update_wsl_distributions",
+                "charm.LandscapeServerCharm._run_db_maintenance",
                 return_value=True,
             ),
             patch(
@@ -288,7 +392,7 @@ class TestDatabaseRelation:
                     superuser=None,
                 ),
             ),
-            patch("charm.grant_role") as grant_role_mock,
+            patch("charm.grant_roles") as grant_roles_mock,
         ):
             fetch_mock.return_value = DatabaseConnectionContext(
                 host="1.2.3.4",
@@ -317,9 +421,10 @@ class TestDatabaseRelation:
             user="schemauser",
             password="landscape-pass",
             schema_password=None,
+            read_only_host=None,
         )
         migrate_mock.assert_called_once_with("postgres")
-        grant_role_mock.assert_not_called()
+        grant_roles_mock.assert_not_called()
         update_ready.assert_called_once_with(restart_services=True)
 
     def test_database_relation_pg16_grants_roles(self):
@@ -335,13 +440,13 @@ class TestDatabaseRelation:
         )
 
         with (
-            patch("charm.update_db_conf") as update_db_conf,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
             patch(
                 "charm.LandscapeServerCharm._migrate_schema_bootstrap",
                 return_value=True,
             ) as migrate_mock,
             patch(
-                "charm.LandscapeServerCharm._update_wsl_distributions",
+                "charm.LandscapeServerCharm._run_db_maintenance",
                 return_value=True,
             ),
             patch(
@@ -353,7 +458,7 @@ class TestDatabaseRelation:
                     superuser="landscape-maintenance",
                 ),
             ),
-            patch("charm.grant_role") as grant_role_mock,
+            patch("charm.grant_roles") as grant_roles_mock,
             patch("charm.fetch_postgres_relation_data", return_value=fetch_context),
         ):
             state_in = self._state(relation=relation, leader=True)
@@ -365,33 +470,23 @@ class TestDatabaseRelation:
                 )
 
         migrate_mock.assert_called_once_with("charmed_dba")
-        grant_role_mock.assert_has_calls(
-            [
-                call(
-                    host="1.2.3.4",
-                    port="5432",
-                    relation_user="relation-9",
-                    relation_password="secret",
-                    role="charmed_dml",
-                    user="landscape-app",
-                ),
-                call(
-                    host="1.2.3.4",
-                    port="5432",
-                    relation_user="relation-9",
-                    relation_password="secret",
-                    role="charmed_dba",
-                    user="landscape-maintenance",
-                ),
-            ]
+        grant_roles_mock.assert_called_once_with(
+            host="1.2.3.4",
+            port="5432",
+            relation_user="relation-9",
+            relation_password="secret",
+            grants=[
+                ("charmed_dml", "landscape-app"),
+                ("charmed_dba", "landscape-maintenance"),
+            ],
         )
-        assert grant_role_mock.call_count == 2
         update_db_conf.assert_called_once_with(
             host="1.2.3.4",
             port="5432",
             user="relation-9",
             password="secret",
             schema_password=None,
+            read_only_host=None,
         )
 
     def test_database_relation_schema_password_override(self):
@@ -405,13 +500,13 @@ class TestDatabaseRelation:
 
         with (
             patch("charm.fetch_postgres_relation_data") as fetch_mock,
-            patch("charm.update_db_conf") as update_db_conf,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
             patch(
                 "charm.LandscapeServerCharm._migrate_schema_bootstrap",
                 return_value=True,
             ),
             patch(
-                "charm.LandscapeServerCharm._update_wsl_distributions",
+                "charm.LandscapeServerCharm._run_db_maintenance",
                 return_value=True,
             ),
             patch(
@@ -423,7 +518,7 @@ class TestDatabaseRelation:
                     superuser=None,
                 ),
             ),
-            patch("charm.grant_role") as grant_role_mock,
+            patch("charm.grant_roles") as grant_roles_mock,
         ):
             fetch_mock.return_value = DatabaseConnectionContext(
                 host="1.2.3.4",
@@ -446,8 +541,9 @@ class TestDatabaseRelation:
             user="landscape",
             password="secret",
             schema_password="override-schema-pass",
+            read_only_host=None,
         )
-        grant_role_mock.assert_not_called()
+        grant_roles_mock.assert_not_called()
 
     def test_database_relation_partial_overrides(self):
         ctx = Context(LandscapeServerCharm)
@@ -460,13 +556,13 @@ class TestDatabaseRelation:
 
         with (
             patch("charm.fetch_postgres_relation_data") as fetch_mock,
-            patch("charm.update_db_conf") as update_db_conf,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
             patch(
                 "charm.LandscapeServerCharm._migrate_schema_bootstrap",
                 return_value=True,
             ),
             patch(
-                "charm.LandscapeServerCharm._update_wsl_distributions",
+                "charm.LandscapeServerCharm._run_db_maintenance",
                 return_value=True,
             ),
             patch(
@@ -478,7 +574,7 @@ class TestDatabaseRelation:
                     superuser=None,
                 ),
             ),
-            patch("charm.grant_role") as grant_role_mock,
+            patch("charm.grant_roles") as grant_roles_mock,
         ):
             fetch_mock.return_value = DatabaseConnectionContext(
                 host="1.2.3.4",
@@ -501,8 +597,9 @@ class TestDatabaseRelation:
             user="landscape",
             password="secret",
             schema_password=None,
+            read_only_host=None,
         )
-        grant_role_mock.assert_not_called()
+        grant_roles_mock.assert_not_called()
 
     @patch(
         "charm.get_postgres_roles",
@@ -514,7 +611,7 @@ class TestDatabaseRelation:
         ),
     )
     @patch("charm.fetch_postgres_relation_data")
-    @patch("charm.update_db_conf")
+    @patch("charm.update_db_conf", return_value=True)
     @patch("charm.LandscapeServerCharm._migrate_schema_bootstrap", return_value=False)
     def test_database_relation_migrate_failure(
         self, _, update_db_conf, fetch_mock, get_roles_mock
@@ -553,13 +650,13 @@ class TestDatabaseRelation:
 
         with (
             patch("charm.fetch_postgres_relation_data") as fetch_mock,
-            patch("charm.update_db_conf") as update_db_conf,
+            patch("charm.update_db_conf", return_value=True) as update_db_conf,
             patch(
                 "charm.LandscapeServerCharm._migrate_schema_bootstrap",
                 return_value=True,
             ),
             patch(
-                "charm.LandscapeServerCharm._update_wsl_distributions",
+                "charm.LandscapeServerCharm._run_db_maintenance",
                 return_value=False,
             ),
             patch(
@@ -571,7 +668,7 @@ class TestDatabaseRelation:
                     superuser=None,
                 ),
             ),
-            patch("charm.grant_role") as grant_role_mock,
+            patch("charm.grant_roles") as grant_roles_mock,
         ):
             fetch_mock.return_value = DatabaseConnectionContext(
                 host="1.2.3.4",
@@ -593,7 +690,7 @@ class TestDatabaseRelation:
                     ready = dict(manager.charm._stored.ready)
 
         update_db_conf.assert_called_once()
-        grant_role_mock.assert_not_called()
+        grant_roles_mock.assert_not_called()
         update_ready.assert_not_called()
         assert isinstance(status, MaintenanceStatus)
         assert ready["db"] is False
@@ -603,6 +700,17 @@ class TestDatabaseHelpers:
     def test_get_postgres_owner_role_pg16(self):
         assert get_postgres_owner_role_from_version("16.1") == "charmed_dba"
 
+    def test_select_read_only_endpoint(self):
+        endpoints = "10.0.0.2:5432, 10.0.0.1:5432"
+
+        assert select_read_only_endpoint(endpoints, 0) == "10.0.0.1:5432"
+        assert select_read_only_endpoint(endpoints, 1) == "10.0.0.2:5432"
+        assert select_read_only_endpoint(endpoints, 2) == "10.0.0.1:5432"
+
+    def test_select_read_only_endpoint_none(self):
+        assert select_read_only_endpoint(None, 0) is None
+        assert select_read_only_endpoint("", 0) is None
+
     def test_get_postgres_owner_role_falls_back(self):
         with patch("database.logger") as logger:
             result = get_postgres_owner_role_from_version("garbage")
@@ -611,8 +719,8 @@ class TestDatabaseHelpers:
         logger.warning.assert_called_once()
 
     @patch("database.get_modified_env_vars", return_value={"PATH": "/usr/bin"})
-    @patch("database.check_call")
-    def test_execute_psql_calls_check_call(self, check_call_mock, get_env):
+    @patch("database.run_command")
+    def test_execute_psql_calls_run_command(self, run_command_mock, get_env):
         execute_psql(
             host="db.internal",
             port="5432",
@@ -622,7 +730,7 @@ class TestDatabaseHelpers:
             database="landscape",
         )
 
-        check_call_mock.assert_called_once_with(
+        run_command_mock.assert_called_once_with(
             [
                 "psql",
                 "-h",
@@ -636,14 +744,19 @@ class TestDatabaseHelpers:
                 "-c",
                 "SELECT 1",
             ],
-            env={"PATH": "/usr/bin", "PGPASSWORD": "hunter2"},
+            env={
+                "PATH": "/usr/bin",
+                "PGPASSWORD": "hunter2",
+                "PGCONNECT_TIMEOUT": str(PSQL_TIMEOUT),
+            },
+            timeout=PSQL_TIMEOUT,
         )
         get_env.assert_called_once_with()
 
     @patch("database.get_modified_env_vars", return_value={})
-    @patch("database.check_call", side_effect=CalledProcessError(1, "psql"))
-    def test_execute_psql_raises_on_error(self, check_call_mock, _):
-        with patch("database.logger") as logger, pytest.raises(CalledProcessError):
+    @patch("subprocess.run", side_effect=CalledProcessError(1, "psql"))
+    def test_execute_psql_raises_on_error(self, run_mock, _):
+        with patch("helpers.logger") as logger, pytest.raises(CalledProcessError):
             execute_psql(
                 host="db.internal",
                 port="5432",
@@ -653,11 +766,11 @@ class TestDatabaseHelpers:
             )
 
         logger.error.assert_called_once()
-        check_call_mock.assert_called_once()
+        run_mock.assert_called_once()
 
     @patch("database.get_modified_env_vars", return_value={})
-    @patch("database.check_call")
-    def test_execute_psql_uses_default_database(self, check_call_mock, _):
+    @patch("database.run_command")
+    def test_execute_psql_uses_default_database(self, run_command_mock, _):
         execute_psql(
             host="db.internal",
             port="5432",
@@ -666,20 +779,39 @@ class TestDatabaseHelpers:
             sql="SELECT 1",
         )
 
-        args = check_call_mock.call_args.args[0]
+        args = run_command_mock.call_args.args[0]
         assert "-d" in args
         idx = args.index("-d")
         assert args[idx + 1] == "postgres"
 
+    @patch("database.get_modified_env_vars", return_value={})
+    @patch("database.run_command")
+    def test_execute_psql_timeout(self, run_command_mock, _):
+        execute_psql(
+            host="db.internal",
+            port="5432",
+            relation_user="relation-user",
+            relation_password="hunter2",
+            sql="SELECT 1",
+            timeout=10,
+        )
+
+        run_command_mock.assert_called_once_with(
+            ANY, env={"PGPASSWORD": "hunter2", "PGCONNECT_TIMEOUT": "10"}, timeout=10
+        )
+
     @patch("database.execute_psql")
-    def test_grant_role_calls_execute(self, execute_psql_mock):
-        grant_role(
+    def test_grant_roles_single_transaction(self, execute_psql_mock):
+        """
+        All grants are applied by one `psql` call, in one transaction, and only if
+        they don't exist yet.
+        """
+        grant_roles(
             host="db.internal",
             port="5432",
             relation_user="relation-user",
             relation_password="hunter2",
-            user="landscape",
-            role="charmed_dba",
+            grants=[("charmed_dml", "landscape"), ("charmed_dba", "o'brien")],
         )
 
         execute_psql_mock.assert_called_once_with(
@@ -687,25 +819,253 @@ class TestDatabaseHelpers:
             port="5432",
             relation_user="relation-user",
             relation_password="hunter2",
-            sql="GRANT charmed_dba TO landscape;",
+            sql=ANY,
+            timeout=PSQL_TIMEOUT,
         )
+        sql = execute_psql_mock.call_args.kwargs["sql"]
+        assert sql.startswith("BEGIN;\n")
+        assert sql.endswith("COMMIT;")
+        assert sql.count("pg_auth_members") == 2
+        assert "r.rolname = 'charmed_dml' AND u.rolname = 'landscape'" in sql
+        assert "u.rolname = 'o''brien'" in sql
 
     @patch(
         "database.execute_psql",
-        side_effect=CalledProcessError(
-            1, ["psql", "-c", "GRANT charmed_dba TO landscape;"]
-        ),
+        side_effect=CalledProcessError(1, ["psql", "-c", "GRANT"]),
     )
-    def test_grant_role_raises_on_error(self, execute_psql_mock):
+    def test_grant_roles_raises_on_error(self, execute_psql_mock):
         with patch("database.logger") as logger, pytest.raises(CalledProcessError):
-            grant_role(
+            grant_roles(
                 host="db.internal",
                 port="5432",
                 relation_user="relation-user",
                 relation_password="hunter2",
-                user="landscape",
-                role="charmed_dba",
+                grants=[("charmed_dba", "landscape")],
             )
 
         execute_psql_mock.assert_called_once()
         logger.error.assert_called_once()
+
+
+class TestDatabaseMaintenance:
+    db = DatabaseConnectionContext(
+        host="db.internal",
+        port="5432",
+        username="relation-user",
+        password="hunter2",
+        database="landscape-standalone-main",
+    )
+
+    @patch("database.get_modified_env_vars", return_value={})
+    @patch("database.run_command")
+    def test_query_psql(self, run_command_mock, _):
+        run_command_mock.return_value.stdout = "public.a\t2048\t1\n\n"
+
+        rows = query_psql(
+            host="db.internal",
+            port="5432",
+            relation_user="relation-user",
+            relation_password="hunter2",
+            sql="SELECT 1",
+        )
+
+        assert rows == [["public.a", "2048", "1"]]
+        args = run_command_mock.call_args.args[0]
+        assert "--tuples-only" in args
+
+    @patch("database.query_psql")
+    def test_get_table_bloat(self, query_psql_mock):
+        query_psql_mock.return_value = [
+            ["public.computer", "1048576", "75", "25"],
+            ["public.empty", "8192", "0", "0"],
+        ]
+
+        tables = get_table_bloat(self.db)
+
+        assert tables == [
+            TableMaintenance(
+                table="public.computer", size=1048576, dead_tuples_ratio=0.25
+            ),
+            TableMaintenance(table="public.empty", size=8192, dead_tuples_ratio=0.0),
+        ]
+        assert query_psql_mock.call_args.kwargs["database"] == (
+            "landscape-standalone-main"
+        )
+
+    @patch("database.execute_psql")
+    def test_maintain_table(self, execute_psql_mock):
+        table = TableMaintenance(
+            table="public.computer", size=1048576, dead_tuples_ratio=0.25
+        )
+
+        maintain_table(self.db, table, reindex=True, timeout=60)
+
+        assert [c.kwargs["sql"] for c in execute_psql_mock.call_args_list] == [
+            "VACUUM (ANALYZE) public.computer;",
+            "REINDEX TABLE CONCURRENTLY public.computer;",
+        ]
+        assert execute_psql_mock.call_args.kwargs["options"] == (
+            f"{MAINTENANCE_OPTIONS} -c statement_timeout=60s"
+        )
+        assert execute_psql_mock.call_args.kwargs["timeout"] > 60
+        assert table.vacuum_seconds is not None
+        assert table.reindex_seconds is not None
+        assert table.error is None
+
+    @patch(
+        "database.execute_psql",
+        side_effect=CalledProcessError(1, ["psql", "-c", "VACUUM"]),
+    )
+    def test_maintain_table_error(self, execute_psql_mock):
+        table = TableMaintenance(
+            table="public.computer", size=1048576, dead_tuples_ratio=0.25
+        )
+
+        maintain_table(self.db, table, reindex=True, timeout=60)
+
+        execute_psql_mock.assert_called_once()
+        assert table.vacuum_seconds is None
+        assert "exit status 1" in table.error
+        assert str(table).startswith("public.computer: size=1MiB dead=25.0% error=")
+
+    @patch("database.query_psql")
+    @patch("database.execute_psql")
+    def test_maintain_table_drops_invalid_indexes(
+        self, execute_psql_mock, query_psql_mock
+    ):
+        """
+        The invalid indexes left by a reindex that was cancelled are dropped, and
+        those that cannot be are reported.
+        """
+        execute_psql_mock.side_effect = [
+            None,
+            TimeoutExpired("psql", 70),
+            None,
+            CalledProcessError(1, "psql"),
+        ]
+        query_psql_mock.return_value = [
+            ["public.computer_pkey_ccnew"],
+            ["public.computer_name_idx_ccnew"],
+        ]
+        table = TableMaintenance(
+            table="public.computer", size=1048576, dead_tuples_ratio=0.25
+        )
+
+        maintain_table(self.db, table, reindex=True, timeout=60)
+
+        assert "'public.computer'::regclass" in query_psql_mock.call_args.kwargs["sql"]
+        assert [c.kwargs["sql"] for c in execute_psql_mock.call_args_list[2:]] == [
+            "DROP INDEX CONCURRENTLY IF EXISTS public.computer_pkey_ccnew;",
+            "DROP INDEX CONCURRENTLY IF EXISTS public.computer_name_idx_ccnew;",
+        ]
+        assert table.reindex_seconds is None
+        assert table.invalid_indexes == ["public.computer_name_idx_ccnew"]
+        assert "invalid_indexes=public.computer_name_idx_ccnew" in str(table)
+
+    @patch("database.query_psql")
+    @patch(
+        "database.execute_psql",
+        side_effect=CalledProcessError(1, ["psql", "-c", "VACUUM"]),
+    )
+    def test_maintain_table_vacuum_error_skips_index_check(
+        self, execute_psql_mock, query_psql_mock
+    ):
+        table = TableMaintenance(
+            table="public.computer", size=1048576, dead_tuples_ratio=0.25
+        )
+
+        maintain_table(self.db, table, reindex=True, timeout=60)
+
+        query_psql_mock.assert_not_called()
+
+
+class TestSlowQueries:
+    db = DatabaseConnectionContext(
+        host="db.internal",
+        port="5432",
+        username="relation-user",
+        password="hunter2",
+        database="landscape-standalone-main",
+    )
+
+    @patch("database.query_psql")
+    def test_get_slow_queries(self, query_psql_mock):
+        query_psql_mock.return_value = [
+            ["landscape-standalone-main", "12", "340.5", "28.4", "12", "SELECT 1"],
+        ]
+
+        queries = get_slow_queries(
+            self.db,
+            ["landscape-standalone-main", "landscape-standalone-o'dd"],
+            "mean_exec_time",
+            5,
+        )
+
+        assert queries == [
+            SlowQuery(
+                database="landscape-standalone-main",
+                calls=12,
+                total_ms=340.5,
+                mean_ms=28.4,
+                rows=12,
+                query="SELECT 1",
+            )
+        ]
+        assert str(queries[0]) == (
+            "landscape-standalone-main: calls=12 total=340.5ms mean=28.4ms "
+            "rows=12 SELECT 1"
+        )
+        sql = query_psql_mock.call_args.kwargs["sql"]
+        assert "IN ('landscape-standalone-main', 'landscape-standalone-o''dd')" in sql
+        assert "ORDER BY s.mean_exec_time DESC\nLIMIT 5;" in sql
+
+    def test_get_slow_queries_bad_order(self):
+        with pytest.raises(ValueError):
+            get_slow_queries(self.db, ["landscape-standalone-main"], "calls", 5)
+
+    @patch(
+        "database.execute_psql",
+        side_effect=CalledProcessError(1, ["psql", "-c", "CREATE EXTENSION"]),
+    )
+    def test_enable_pg_stat_statements_fails(self, execute_psql_mock):
+        assert not enable_pg_stat_statements(self.db)
+        assert execute_psql_mock.call_args.kwargs["database"] == (
+            "landscape-standalone-main"
+        )
+
+
+@patch("database.execute_psql")
+def test_set_role_settings(execute_psql_mock):
+    db = DatabaseConnectionContext(
+        host="db.internal",
+        port="5432",
+        username="relation-user",
+        password="hunter2",
+        database="landscape-standalone-main",
+    )
+
+    set_role_settings(
+        db,
+        "landscape",
+        {"statement_timeout": "60s", "work_mem": "64MB"},
+        reset=["work_mem", "lock_timeout", "statement_timeout"],
+    )
+
+    execute_psql_mock.assert_called_once_with(
+        host="db.internal",
+        port="5432",
+        relation_user="relation-user",
+        relation_password="hunter2",
+        sql=(
+            "BEGIN;\n"
+            'ALTER ROLE "landscape" IN DATABASE "landscape-standalone-main" '
+            "SET statement_timeout = '60s';\n"
+            'ALTER ROLE "landscape" IN DATABASE "landscape-standalone-main" '
+            "SET work_mem = '64MB';\n"
+            'ALTER ROLE "landscape" IN DATABASE "landscape-standalone-main" '
+            "RESET lock_timeout;\n"
+            "COMMIT;"
+        ),
+        database="landscape-standalone-main",
+        timeout=PSQL_TIMEOUT,
+    )
@@ -11,11 +11,12 @@ from src.charm import LandscapeServerCharm
 
 
 @pytest.fixture(autouse=True)
-def check_call():
+def run_command():
     """
-    Patch `check_call` to avoid any real subprocess calls.
+    Patch `run_command` to avoid any real subprocess calls.
     """
-    with patch("src.charm.check_call") as p:
+    with patch("src.charm.run_command") as p:
+        p.return_value.stdout = ""
         yield p
 
 
@@ -1,4 +1,6 @@
 from base64 import b64encode
+from copy import deepcopy
+from dataclasses import asdict
 import unittest
 from unittest.mock import patch
 
@@ -8,15 +10,19 @@ import pytest
 import yaml
 
 from charm import LandscapeServerCharm
+from config import Role
 from haproxy import (
     create_grpc_service,
     create_http_service,
     create_https_service,
+    create_stats_service,
     create_ubuntu_installer_attach_service,
     DEFAULT_REDIRECT_SCHEME,
     HAProxyErrorFile,
     HTTPBackend,
     HTTPSBackend,
+    REQUEST_TIMING_OPTIONS,
+    STATS_SERVICE,
 )
 
 
@@ -194,6 +200,36 @@ class TestWebsiteRelationJoined:
 
         assert "landscape-ubuntu-installer-attach" in service_names
 
+    def test_includes_stats_if_enabled(self):
+        """
+        If `haproxy_stats_port` is set, include the statistics frontend.
+        """
+        context = Context(LandscapeServerCharm)
+        relation = Relation("website")
+        state_in = State(
+            config={
+                "root_url": "https//root.test",
+                "haproxy_stats_port": 8404,
+                "haproxy_stats_allowed_networks": "10.0.0.0/24",
+            },
+            relations=[relation],
+        )
+        state_out = context.run(context.on.relation_joined(relation), state_in)
+        raw_services = state_out.get_relation(relation.id).local_unit_data["services"]
+        services = {s["service_name"]: s for s in yaml.safe_load(raw_services)}
+
+        assert services["landscape-haproxy-stats"]["service_port"] == 8404
+
+    def test_excludes_stats_by_default(self):
+        context = Context(LandscapeServerCharm)
+        relation = Relation("website")
+        state_in = State(config={"root_url": "https//root.test"}, relations=[relation])
+        state_out = context.run(context.on.relation_joined(relation), state_in)
+        raw_services = state_out.get_relation(relation.id).local_unit_data["services"]
+        service_names = [s["service_name"] for s in yaml.safe_load(raw_services)]
+
+        assert "landscape-haproxy-stats" not in service_names
+
 
 class TestWebsiteRelationChanged:
 
@@ -615,6 +651,90 @@ class TestCreateHTTPService(unittest.TestCase):
 
         self.assertIn(expected, service["backends"])
 
+    def test_message_role_only(self):
+        """
+        If the unit only runs the message role, only the ping and message backends
+        have servers. All backends are still declared.
+        """
+        http = create_http_service(
+            http_service=self.http_service,
+            server_ip="10.1.1.10",
+            unit_name="unitname",
+            worker_counts=1,
+            is_leader=True,
+            error_files=(),
+            service_ports=self.service_ports,
+            server_options=self.server_options,
+            roles=(Role.MESSAGE,),
+        )
+
+        backends = {b["backend_name"]: b["servers"] for b in http["backends"]}
+
+        self.assertEqual([], http["servers"])
+        self.assertEqual(len(backends[f"{HTTPBackend.PING}"]), 1)
+        self.assertEqual(len(backends[f"{HTTPBackend.MESSAGE}"]), 1)
+        self.assertEqual([], backends[f"{HTTPBackend.API}"])
+        self.assertEqual([], backends[f"{HTTPBackend.PACKAGE_UPLOAD}"])
+        self.assertEqual([], backends[f"{HTTPBackend.HASHIDS}"])
+
+    def test_hashid_databases_and_package_upload_on_nonleader(self):
+        """
+        If `serve_hashid_databases` and `serve_package_upload` are set, a non-leader
+        has servers for the hashid-databases and package-upload backends.
+        """
+        http = create_http_service(
+            http_service=self.http_service,
+            server_ip="10.1.1.10",
+            unit_name="unitname",
+            worker_counts=1,
+            is_leader=False,
+            error_files=(),
+            service_ports=self.service_ports,
+            server_options=self.server_options,
+            serve_package_upload=True,
+            serve_hashid_databases=True,
+        )
+
+        backends = {b["backend_name"]: b["servers"] for b in http["backends"]}
+
+        self.assertEqual(http["servers"], backends[f"{HTTPBackend.HASHIDS}"])
+        self.assertEqual(
+            [
+                (
+                    "landscape-package-upload-unitname-0",
+                    "10.1.1.10",
+                    self.package_upload_port,
+                    self.server_options,
+                )
+            ],
+            backends[f"{HTTPBackend.PACKAGE_UPLOAD}"],
+        )
+
+    def test_web_role_only(self):
+        """
+        If the unit only runs the web role, the ping and message backends have no
+        servers.
+        """
+        http = create_http_service(
+            http_service=self.http_service,
+            server_ip="10.1.1.10",
+            unit_name="unitname",
+            worker_counts=1,
+            is_leader=True,
+            error_files=(),
+            service_ports=self.service_ports,
+            server_options=self.server_options,
+            roles=(Role.WEB,),
+        )
+
+        backends = {b["backend_name"]: b["servers"] for b in http["backends"]}
+
+        self.assertEqual(len(http["servers"]), 1)
+        self.assertEqual([], backends[f"{HTTPBackend.PING}"])
+        self.assertEqual([], backends[f"{HTTPBackend.MESSAGE}"])
+        self.assertEqual(len(backends[f"{HTTPBackend.API}"]), 1)
+        self.assertEqual(len(backends[f"{HTTPBackend.PACKAGE_UPLOAD}"]), 1)
+
     def test_error_files(self):
         """
         Sets error files for the service if provided.
@@ -645,6 +765,30 @@ class TestCreateHTTPService(unittest.TestCase):
 
         self.assertEqual(expected, http["error_files"])
 
+    def test_request_timing_logs(self):
+        """
+        If `request_timing_logs`, requests get an ID and are logged with timings.
+        """
+        kwargs = dict(
+            server_ip="10.1.1.10",
+            unit_name="unitname",
+            worker_counts=1,
+            is_leader=False,
+            error_files=(),
+            service_ports=self.service_ports,
+            server_options=self.server_options,
+        )
+        http = create_http_service(http_service=deepcopy(self.http_service), **kwargs)
+        self.assertNotIn("unique-id-header X-Request-ID", http["service_options"])
+
+        http = create_http_service(
+            http_service=deepcopy(self.http_service),
+            request_timing_logs=True,
+            **kwargs,
+        )
+        for option in REQUEST_TIMING_OPTIONS:
+            self.assertIn(option, http["service_options"])
+
 
 class TestCreateHTTPSService(unittest.TestCase):
     """
@@ -1110,6 +1254,23 @@ class TestCreateHTTPSService(unittest.TestCase):
 
         self.assertIn(expected, service["backends"])
 
+    def test_request_timing_logs(self):
+        https = create_https_service(
+            https_service=self.https_service,
+            ssl_cert="some-cert",
+            server_ip="10.1.1.10",
+            unit_name="unitname",
+            worker_counts=1,
+            is_leader=False,
+            error_files=(),
+            service_ports=self.service_ports,
+            server_options=self.server_options,
+            request_timing_logs=True,
+        )
+
+        for option in REQUEST_TIMING_OPTIONS:
+            self.assertIn(option, https["service_options"])
+
 
 class TestCreateGRPCService(unittest.TestCase):
     """
@@ -1306,6 +1467,27 @@ class TestCreateUbuntuInstallerAttachService(unittest.TestCase):
         self.assertEqual(expected, service["error_files"])
 
 
+class TestCreateStatsService:
+    def test_allowed_networks(self):
+        """
+        Only the allowed networks can access the statistics frontend, which has no
+        servers.
+        """
+        service = create_stats_service(
+            stats_service=asdict(STATS_SERVICE),
+            port=8404,
+            allowed_networks=["10.0.0.0/24", "192.168.1.5/32"],
+        )
+
+        assert service["service_port"] == 8404
+        assert service["servers"] == []
+        options = service["service_options"]
+        assert "acl stats_client src 10.0.0.0/24 192.168.1.5/32" in options
+        assert options.index("http-request deny unless stats_client") < options.index(
+            "http-request use-service prometheus-exporter if { path /metrics }"
+        )
+
+
 class TestRedirectHTTPS:
     """
     Tests for the effect of the `redirect_https` configuration parameter on the
@@ -0,0 +1,59 @@
+# Copyright 2025 Canonical Ltd
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+import hash_id_databases
+from hash_id_databases import main, read_status
+
+
+@pytest.fixture(autouse=True)
+def status_file(tmp_path, monkeypatch):
+    path = tmp_path / "status.json"
+    monkeypatch.setattr(hash_id_databases, "STATUS_FILE", str(path))
+    monkeypatch.setattr(hash_id_databases, "LOCK_FILE", str(tmp_path / "lock"))
+    return path
+
+
+@pytest.mark.parametrize("running,state", [(True, "running"), (False, "failed")])
+def test_read_status_stale_run(status_file, running, state):
+    """
+    A run marked as running that no longer holds the lock is reported as failed.
+    """
+    status_file.write_text(json.dumps({"state": "running"}))
+
+    with patch("hash_id_databases.is_running", return_value=running):
+        assert read_status()["state"] == state
+
+
+@patch("hash_id_databases.signal.signal")
+@patch("hash_id_databases.subprocess.Popen")
+def test_main_succeeded(popen_mock, signal_mock, status_file):
+    popen_mock.return_value.stdout = ["Generating noble\n"]
+    popen_mock.return_value.wait.return_value = 0
+
+    assert main() == 0
+
+    status = json.loads(status_file.read_text())
+    assert status["state"] == "succeeded"
+    assert status["last-success"] == status["finished"]
+
+
+@patch("hash_id_databases.signal.signal")
+@patch("hash_id_databases.subprocess.Popen")
+def test_main_interrupted(popen_mock, signal_mock, status_file):
+    """
+    A run that is stopped part way records that it failed.
+    """
+    popen_mock.return_value.stdout.__iter__.side_effect = SystemExit(143)
+    status_file.write_text(json.dumps({"last-success": "2025-01-01T00:00:00+00:00"}))
+
+    with pytest.raises(SystemExit):
+        main()
+
+    status = json.loads(status_file.read_text())
+    assert status["state"] == "failed"
+    assert status["returncode"] is None
+    assert status["last-success"] == "2025-01-01T00:00:00+00:00"
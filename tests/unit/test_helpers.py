@@ -0,0 +1,129 @@
+# Copyright 2025 Canonical Ltd
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import CalledProcessError, CompletedProcess, TimeoutExpired
+from unittest.mock import call, patch
+
+import pytest
+
+import helpers
+from helpers import (
+    CommandStats,
+    DEFAULT_COMMAND_TIMEOUT,
+    get_args_with_secrets_removed,
+    run_command,
+)
+
+
+@pytest.fixture(autouse=True)
+def command_stats(monkeypatch):
+    stats = defaultdict(CommandStats)
+    monkeypatch.setattr(helpers, "command_stats", stats)
+    return stats
+
+
+@pytest.fixture
+def sleep():
+    with patch("helpers.time.sleep") as sleep_mock:
+        yield sleep_mock
+
+
+def test_get_args_with_secrets_removed():
+    args = ["--admin_password", "hunter2", "--registration_key=secret", "--x", "y"]
+
+    assert get_args_with_secrets_removed(
+        args, ["admin_password", "registration_key"]
+    ) == ["--admin_password", "REDACTED", "--registration_key=REDACTED", "--x", "y"]
+    assert args[1] == "hunter2"
+
+
+@patch("subprocess.run")
+def test_run_command(run_mock, command_stats):
+    run_mock.return_value = CompletedProcess(["/usr/bin/lsctl", "restart"], 0)
+
+    result = run_command(["/usr/bin/lsctl", "restart"], env={})
+
+    assert result is run_mock.return_value
+    run_mock.assert_called_once_with(
+        ["/usr/bin/lsctl", "restart"],
+        timeout=DEFAULT_COMMAND_TIMEOUT,
+        check=True,
+        env={},
+    )
+    assert command_stats["lsctl"].runs == 1
+    assert command_stats["lsctl"].exit_codes == {0: 1}
+
+
+@patch("subprocess.run")
+def test_run_command_retries(run_mock, sleep, command_stats):
+    """
+    A failed command is retried with an exponential backoff.
+    """
+    run_mock.side_effect = [
+        CalledProcessError(100, "apt-mark"),
+        CalledProcessError(100, "apt-mark"),
+        CompletedProcess("apt-mark", 0),
+    ]
+
+    run_command(["apt-mark", "hold", "landscape-server"], retries=3, backoff=2.0)
+
+    assert run_mock.call_count == 3
+    assert sleep.call_args_list == [call(2.0), call(4.0)]
+    assert command_stats["apt-mark"].exit_codes == {100: 2, 0: 1}
+
+
+@patch("subprocess.run", side_effect=CalledProcessError(100, "apt-mark"))
+def test_run_command_retries_exhausted(run_mock, sleep):
+    with pytest.raises(CalledProcessError):
+        run_command(["apt-mark", "hold", "landscape-server"], retries=2)
+
+    assert run_mock.call_count == 3
+
+
+@patch("subprocess.run", side_effect=TimeoutExpired("psql", 30))
+def test_run_command_timeout(run_mock, sleep, command_stats):
+    """
+    A command that times out is not retried.
+    """
+    with pytest.raises(TimeoutExpired):
+        run_command(["psql", "-c", "SELECT 1"], timeout=30, retries=2)
+
+    run_mock.assert_called_once()
+    sleep.assert_not_called()
+    assert command_stats["psql"].timeouts == 1
+
+
+@patch("subprocess.run", side_effect=CalledProcessError(1, "landscape-schema"))
+def test_run_command_redacts_secrets(run_mock):
+    args = ["landscape-schema", "--with-http-proxy", "http://user:pw@proxy.test"]
+
+    with patch("helpers.logger") as logger, pytest.raises(CalledProcessError):
+        run_command(args, secret_args=("with-http-proxy",))
+
+    logged = str(logger.error.call_args)
+    assert "pw@proxy.test" not in logged
+    assert "--with-http-proxy REDACTED" in logged
+
+
+@patch("subprocess.run")
+def test_run_command_names_python_scripts(run_mock, command_stats):
+    run_command(["python3", "/charm/src/maintenance.py"], check=False)
+
+    assert list(command_stats) == ["maintenance.py"]
+
+
+@patch("subprocess.run")
+def test_run_command_from_threads(run_mock, command_stats):
+    """
+    Runs from worker threads, like the database session settings, are all
+    counted.
+    """
+    run_mock.return_value = CompletedProcess([], 0)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(400):
+            executor.submit(run_command, ["psql"], check=False)
+
+    assert command_stats["psql"].runs == 400
+    assert command_stats["psql"].exit_codes == {0: 400}
@@ -0,0 +1,104 @@
+# Copyright 2025 Canonical Ltd
+
+from unittest.mock import patch
+
+import pytest
+
+from hook_stats import (
+    append_record,
+    format_durations,
+    get_hook_name,
+    HookProfiler,
+    percentile,
+    summarise,
+)
+
+
+@pytest.mark.parametrize(
+    "dispatch_path,expected",
+    [
+        ("hooks/config-changed", "config-changed"),
+        ("hooks/database_relation_changed", "database-relation-changed"),
+        ("actions/hook-stats", "actions-hook-stats"),
+        ("", "unknown"),
+    ],
+)
+def test_get_hook_name(dispatch_path, expected):
+    with patch.dict("os.environ", {"JUJU_DISPATCH_PATH": dispatch_path}):
+        assert get_hook_name() == expected
+
+
+@patch("hook_stats.time.monotonic")
+def test_profiler_steps(monotonic_mock):
+    """
+    The duration of a step run more than once in a hook is the total of its runs.
+    """
+    monotonic_mock.side_effect = [0.0, 1.0, 3.0, 4.0, 5.0, 6.0, 6.5, 10.0]
+    profiler = HookProfiler("config-changed")
+
+    with profiler.step("lsctl-restart"):
+        pass
+    with profiler.step("apt-install"):
+        pass
+    with pytest.raises(RuntimeError):
+        with profiler.step("lsctl-restart"):
+            raise RuntimeError()
+
+    record = profiler.record()
+
+    assert record["hook"] == "config-changed"
+    assert record["duration"] == 10.0
+    assert record["steps"] == {"lsctl-restart": 2.5, "apt-install": 1.0}
+
+
+def test_append_record_bounded():
+    records = [{"hook": "install"}] + [{"hook": "update-status"}] * 3
+
+    records = append_record(records, {"hook": "update-status"}, 3)
+
+    assert [record["hook"] for record in records] == ["install"] + ["update-status"] * 3
+
+
+def test_append_record_keeps_other_hooks():
+    records = [{"hook": "update-status"}] * 3
+
+    records = append_record(records, {"hook": "config-changed"}, 3)
+
+    assert len(records) == 4
+    assert records[-1]["hook"] == "config-changed"
+
+
+def test_percentile():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+
+    assert percentile(values, 50) == 3.0
+    assert percentile(values, 95) == 5.0
+    assert percentile(values, 0) == 1.0
+    assert percentile([7.0], 95) == 7.0
+
+
+def test_summarise():
+    records = [
+        {"hook": "config-changed", "duration": 2.0, "steps": {"apt-install": 1.0}},
+        {"hook": "config-changed", "duration": 4.0, "steps": {}},
+        {"hook": "update-status", "duration": 0.5, "steps": {}},
+    ]
+
+    summary = summarise(records)
+
+    assert summary == {
+        "config-changed": {
+            "duration": {"count": 2, "p50": 2.0, "p95": 4.0, "max": 4.0},
+            "steps": {
+                "apt-install": {"count": 1, "p50": 1.0, "p95": 1.0, "max": 1.0},
+            },
+        },
+        "update-status": {
+            "duration": {"count": 1, "p50": 0.5, "p95": 0.5, "max": 0.5},
+            "steps": {},
+        },
+    }
+    assert (
+        format_durations(summary["config-changed"]["duration"])
+        == "p50=2.00s p95=4.00s max=4.00s n=2"
+    )
@@ -3,6 +3,7 @@
 from base64 import b64encode
 from io import BytesIO, StringIO
 import os
+import tarfile
 from tempfile import TemporaryDirectory
 from unittest import TestCase
 from unittest.mock import patch
@@ -11,13 +12,17 @@ from urllib.error import URLError
 from settings_files import (
     CONFIGS_DIR,
     configure_for_deployment_mode,
+    HashIdDatabasesReadException,
     LICENSE_FILE,
     LicenseFileReadException,
     merge_service_conf,
     prepend_default_settings,
     SSLCertReadException,
+    update_db_conf,
     update_default_settings,
     update_service_conf,
+    update_store_hosts,
+    write_hash_id_databases,
     write_license_file,
     write_ssl_cert,
 )
@@ -261,6 +266,120 @@ class UpdateServiceConfTestCase(TestCase):
 
         self.assertEqual(outfile.captured, "[fixed]\nold = yes\n\n")
 
+    def test_remove_sections(self):
+        """
+        Sections in `remove_sections` are replaced by `updates`, and the
+        configuration is migrated afterwards.
+        """
+        infile = StringIO("[fixed]\nold = no\n\n[tracing]\nstale = yes\n")
+        outfile = CapturingStringIO()
+
+        i = 0
+
+        def return_conf(path, *args, **kwargs):
+            nonlocal i
+            retval = (infile, outfile)[i]
+            i += 1
+            return retval
+
+        with (
+            patch("os.path.isfile") as mock_isfile,
+            patch("builtins.open") as open_mock,
+            patch("settings_files.migrate_service_conf") as mock_migrate_service_conf,
+        ):
+            mock_isfile.return_value = True
+            open_mock.side_effect = return_conf
+            update_service_conf({"tracing": {"new": "yes"}}, ("tracing",))
+
+        self.assertEqual(
+            outfile.captured, "[fixed]\nold = no\n\n[tracing]\nnew = yes\n\n"
+        )
+        mock_migrate_service_conf.assert_called_once_with()
+
+
+class UpdateDbConfTestCase(TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.service_conf = os.path.join(self.tempdir.name, "service.conf")
+        with open(self.service_conf, "w") as conf_fp:
+            conf_fp.write("[stores]\nhost = db.test:5432\n")
+
+        patches = (
+            patch("settings_files.SERVICE_CONF", new=self.service_conf),
+            patch("settings_files.migrate_service_conf"),
+        )
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_stores_changed(self):
+        """
+        Only changes to the `[stores]` section are reported.
+        """
+        self.assertTrue(update_db_conf(host="db.test", read_only_host="ro.test:5432"))
+        self.assertFalse(
+            update_db_conf(host="db.test", read_only_host="ro.test:5432", user="u")
+        )
+        self.assertTrue(update_db_conf(host="db.test", read_only_host="ro2.test:5432"))
+
+
+class UpdateStoreHostsTestCase(TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.service_conf = os.path.join(self.tempdir.name, "service.conf")
+        with open(self.service_conf, "w") as conf_fp:
+            conf_fp.write("[stores]\nhost = db.test:5432\n")
+
+        patches = (
+            patch("settings_files.SERVICE_CONF", new=self.service_conf),
+            patch("settings_files.migrate_service_conf"),
+        )
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_unchanged(self):
+        """
+        service.conf is only rewritten, and migrated, when the stores change.
+        """
+        store_hosts = {
+            "package": {"host": "10.0.0.5", "port": "", "user": "", "password": ""},
+        }
+
+        self.assertTrue(update_store_hosts(store_hosts))
+        mtime = os.stat(self.service_conf).st_mtime_ns
+        self.assertFalse(update_store_hosts(store_hosts))
+
+        self.assertEqual(mtime, os.stat(self.service_conf).st_mtime_ns)
+        with open(self.service_conf) as conf_fp:
+            self.assertIn("package-host = 10.0.0.5:5432", conf_fp.read())
+
+    def test_read_only_host(self):
+        """
+        Moved stores read from their own host, not the main cluster's standby.
+        """
+        with open(self.service_conf, "a") as conf_fp:
+            conf_fp.write("read-only-host = standby.test:5432\n")
+
+        update_store_hosts({"package": {"host": "10.0.0.5", "port": "5433"}})
+
+        with open(self.service_conf) as conf_fp:
+            conf = conf_fp.read()
+        self.assertIn("package-read-only-host = 10.0.0.5:5433", conf)
+        self.assertIn("read-only-host = standby.test:5432", conf)
+
+    def test_removed(self):
+        update_store_hosts({"package": {"host": "10.0.0.5"}})
+
+        self.assertTrue(update_store_hosts({}))
+
+        with open(self.service_conf) as conf_fp:
+            conf = conf_fp.read()
+        self.assertNotIn("package-host", conf)
+        self.assertNotIn("package-read-only-host", conf)
+
 
 class WriteLicenseFileTestCase(TestCase):
 
@@ -366,3 +485,72 @@ class WriteSSLCertTestCase(TestCase):
                 write_ssl_cert,
                 "notvalidb64haha",
             )
+
+
+class WriteHashIdDatabasesTestCase(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+
+        self.archive = os.path.join(self.tempdir.name, "hash-id-databases.tar.gz")
+        self.target = os.path.join(self.tempdir.name, "hash-id-databases")
+
+        patch("settings_files.HASH_ID_DATABASES_DIR", new=self.target).start()
+        self.chown_mock = patch("settings_files.os.chown").start()
+        self.addCleanup(patch.stopall)
+
+    def _add_file(self, tar, name, content=b"hashes"):
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        tar.addfile(info, BytesIO(content))
+
+    def test_unpack(self):
+        """
+        Tests that the hash-id databases are unpacked and owned by the given user.
+        """
+        with tarfile.open(self.archive, "w:gz") as tar:
+            self._add_file(tar, "noble_amd64")
+            self._add_file(tar, "jammy_amd64")
+
+        write_hash_id_databases(self.archive, 1000, 1000)
+
+        self.assertEqual(
+            ["jammy_amd64", "noble_amd64"], sorted(os.listdir(self.target))
+        )
+        self.chown_mock.assert_any_call(
+            os.path.join(self.target, "noble_amd64"), 1000, 1000
+        )
+
+    def test_unsafe_member(self):
+        """
+        Tests that a HashIdDatabasesReadException is raised if the archive
+        contains a path outside of its root.
+        """
+        with tarfile.open(self.archive, "w:gz") as tar:
+            self._add_file(tar, "../escape")
+
+        self.assertRaises(
+            HashIdDatabasesReadException,
+            write_hash_id_databases,
+            self.archive,
+            1000,
+            1000,
+        )
+        self.assertFalse(os.path.exists(self.target))
+
+    def test_not_a_tarball(self):
+        """
+        Tests that a HashIdDatabasesReadException is raised if the archive
+        cannot be read.
+        """
+        with open(self.archive, "wb") as fp:
+            fp.write(b"not a tarball")
+
+        self.assertRaises(
+            HashIdDatabasesReadException,
+            write_hash_id_databases,
+            self.archive,
+            1000,
+            1000,
+        )